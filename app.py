@@ -1,12 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify, Response, stream_with_context
 import pandas as pd
 import os
 from datetime import datetime, timedelta
 import uuid
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from excel_handler import export_complaints_excel, backup_database, import_complaints_from_excel
-from biil import check_payment_status
+from excel_handler import backup_database, import_complaints_from_excel, save_workbook, workbook_lock
+from backup_store import compact_change_log
+from parquet_export import export_parquet
+from scheduler import scheduler
+from metrics import init_metrics, storage_timer
+from tracing import init_tracing, span, traced
+from profiler import profiler
+from biil import check_payment_status, reload_bills
 from flask import current_app
 import logging
 import speech_recognition as sr
@@ -15,20 +21,42 @@ import tempfile
 import wave
 import io
 from excel_editor_multi import register_excel_editors
+from complaint_merge import load_unified_complaints, update_unified_complaint, update_unified_complaints, unified_view
+from change_log import record_change, record_changes
+from incident_detector import incident_detector
+from duplicate_detector import find_duplicates, duplicate_index
+from dispatch import AUTO_DISPATCH, dispatch_engine
+from technician_queues import technician_queues
+from sla_engine import sla_engine
+from complaint_lifecycle import (InvalidTransition, canonical_status, check_transition, compact_events,
+                                 lifecycle_tracker, record_transition, record_transitions, transition_path)
+from report_cache import report_builder
+from stream_export import csv_stream, ndjson_stream, export_filters, export_sources
+from complaint_search import search_complaints, search_index
 from send_email import send_email_smtp ;
 import re
-from voice22 import main
+import threading
+from voice22 import main, VOICE_COMPLAINT_FILE, load_voice_complaints
 
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "default_secret_key")  # Use environment variable for secret key
+# Request, storage and cache metrics at /metrics
+init_metrics(app)
+# Per-request trace IDs and the slow-operation log
+init_tracing(app)
 
 # File paths
 UPLOAD_FOLDER = 'uploads'
 COMPLAINT_FILE = 'data/complaints.xlsx'
 USER_FILE = 'data/users.xlsx'
 TECHNICIAN_FILE = "data/technician.xlsx"
+# Assign each new complaint to the least loaded technician as it is submitted
+# Run the periodic maintenance jobs registered at the bottom of this file.
+# They start from gunicorn's post_worker_init hook or `python app.py`,
+# never on import.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -41,12 +69,14 @@ if not os.path.exists(COMPLAINT_FILE):
         'location', 'submission_date', 'status', 'assigned_to',
         'attachment_path', 'resolution_notes', 'resolution_date'
     ])
-    complaints_df.to_excel(COMPLAINT_FILE, index=False)
+    save_workbook(complaints_df, COMPLAINT_FILE)
 
+@traced()
 def load_technician():
     """Load technicians from Excel file"""
     if os.path.exists(TECHNICIAN_FILE):
-        technicians_df = pd.read_excel(TECHNICIAN_FILE)
+        with storage_timer('read_excel', TECHNICIAN_FILE):
+            technicians_df = pd.read_excel(TECHNICIAN_FILE)
         technicians_df['technician_id'] = technicians_df['technician_id'].astype(str)  # Ensure technician_id is a string
         return technicians_df
     return pd.DataFrame(columns=[
@@ -70,7 +100,9 @@ if not os.path.exists(TECHNICIAN_FILE):
         'role': 'technician'
     }
     technician_df = pd.concat([technician_df, pd.DataFrame([technician_data])], ignore_index=True)
-    technician_df.to_excel(TECHNICIAN_FILE, index=False)
+    with workbook_lock(TECHNICIAN_FILE):
+        save_workbook(technician_df, TECHNICIAN_FILE)
+        record_change('technician', 'insert', technician_data)
 
 if not os.path.exists(USER_FILE):
     users_df = pd.DataFrame(columns=[
@@ -89,14 +121,21 @@ if not os.path.exists(USER_FILE):
         'registration_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     users_df = pd.concat([users_df, pd.DataFrame([admin_data])], ignore_index=True)
-    users_df.to_excel(USER_FILE, index=False)
+    with workbook_lock(USER_FILE):
+        save_workbook(users_df, USER_FILE)
+        record_change('user', 'insert', admin_data)
 
 # Ensure all technician passwords are hashed
-technicians_df = load_technician()
-technicians_df['password'] = technicians_df['password'].apply(
-    lambda x: generate_password_hash(str(x)) if not isinstance(x, str) else x
-)
-technicians_df.to_excel(TECHNICIAN_FILE, index=False)
+with workbook_lock(TECHNICIAN_FILE):
+    technicians_df = load_technician()
+    unhashed = technicians_df['password'].map(lambda x: not isinstance(x, str))
+    # Every worker runs this at start-up; only write when something changed
+    if unhashed.any():
+        technicians_df.loc[unhashed, 'password'] = technicians_df.loc[unhashed, 'password'].map(
+            lambda x: generate_password_hash(str(x)))
+        save_workbook(technicians_df, TECHNICIAN_FILE)
+        record_changes('technician', 'update',
+                       technicians_df.loc[unhashed, ['technician_id', 'password']].to_dict('records'))
 
 # Helper functions
 # def load_complaints():
@@ -105,10 +144,12 @@ technicians_df.to_excel(TECHNICIAN_FILE, index=False)
 #         return pd.read_excel(COMPLAINT_FILE)
 #     return pd.DataFrame()
 
+@traced()
 def load_complaints():
     """Load complaints from Excel file"""
     if os.path.exists(COMPLAINT_FILE):
-        df = pd.read_excel(COMPLAINT_FILE)
+        with storage_timer('read_excel', COMPLAINT_FILE):
+            df = pd.read_excel(COMPLAINT_FILE)
         # Ensure complaint_id is string and clean
         df['complaint_id'] = df['complaint_id'].astype(str).str.strip()
         # Ensure user_id is string and clean
@@ -116,10 +157,41 @@ def load_complaints():
         return df
     return pd.DataFrame()
 
+def complaint_source_file(complaint_id):
+    """The workbook a complaint lives in (web or voice)"""
+    if unified_view.source_of(complaint_id) == 'voice':
+        return VOICE_COMPLAINT_FILE
+    return COMPLAINT_FILE
+
+def load_complaint_source(file_path):
+    """
+    (complaints_df, change log entity) for a workbook from complaint_source_file
+    Voice complaints get the assignment and resolution columns the web
+    workbook has, so both can be updated the same way.
+    """
+    if file_path == VOICE_COMPLAINT_FILE:
+        voice_df = load_voice_complaints()
+        voice_df['complaint_id'] = voice_df['complaint_id'].astype(str).str.strip()
+        voice_df = voice_df.rename(columns={'complaint_type': 'category'})
+        for column in ('assigned_to', 'technician_name', 'resolution_notes', 'resolution_date'):
+            if column not in voice_df.columns:
+                voice_df[column] = ''
+            voice_df[column] = voice_df[column].astype(object)
+        return voice_df, 'voice_complaint'
+    return load_complaints(), 'complaint'
+
+def save_complaint_source(complaints_df, file_path):
+    """Write back a workbook returned by load_complaint_source"""
+    if file_path == VOICE_COMPLAINT_FILE:
+        complaints_df = complaints_df.rename(columns={'category': 'complaint_type'})
+    save_workbook(complaints_df, file_path)
+
+@traced()
 def load_users():
     """Load users from Excel file"""
     if os.path.exists(USER_FILE):
-        return pd.read_excel(USER_FILE)
+        with storage_timer('read_excel', USER_FILE):
+            return pd.read_excel(USER_FILE)
     return pd.DataFrame(columns=[
         'user_id', 'fullName', 'aadhar', 'email', 'phone',
         'address', 'password', 'role', 'registration_date'
@@ -127,32 +199,197 @@ def load_users():
 
 
 
+@traced()
 def save_complaint(complaint_data):
     """Save a new complaint to Excel file"""
-    complaints_df = load_complaints()
-    new_complaint = pd.DataFrame([complaint_data])
-    updated_df = pd.concat([complaints_df, new_complaint], ignore_index=True)
-    updated_df.to_excel(COMPLAINT_FILE, index=False)
+    with workbook_lock(COMPLAINT_FILE):
+        complaints_df = load_complaints()
+        new_complaint = pd.DataFrame([complaint_data])
+        updated_df = pd.concat([complaints_df, new_complaint], ignore_index=True)
+        save_workbook(updated_df, COMPLAINT_FILE)
+        # Logged under the lock so the log's order matches the writes'
+        record_change('complaint', 'insert', complaint_data)
 
+@traced()
 def save_user(user_data):
     """Save a new user to Excel file"""
-    users_df = load_users()
-    new_user = pd.DataFrame([user_data])
-    updated_df = pd.concat([users_df, new_user], ignore_index=True)
-    updated_df.to_excel(USER_FILE, index=False)
+    with workbook_lock(USER_FILE):
+        users_df = load_users()
+        new_user = pd.DataFrame([user_data])
+        updated_df = pd.concat([users_df, new_user], ignore_index=True)
+        save_workbook(updated_df, USER_FILE)
+        record_change('user', 'insert', user_data)
 
+@traced()
 def update_complaint_status(complaint_id, status, notes=None):
-    """Update complaint status and notes"""
-    complaints_df = load_complaints()
-    idx = complaints_df.index[complaints_df['complaint_id'] == complaint_id].tolist()
-    if idx:
+    """
+    Update complaint status and notes
+    Raises InvalidTransition if the status change is not allowed
+    """
+    file_path = complaint_source_file(complaint_id)
+    with workbook_lock(file_path):
+        complaints_df, entity = load_complaint_source(file_path)
+        idx = complaints_df.index[complaints_df['complaint_id'] == complaint_id].tolist()
+        if not idx:
+            return False
+        previous_status = complaints_df.at[idx[0], 'status']
+        status = check_transition(previous_status, status)
         complaints_df.at[idx[0], 'status'] = status
         if notes:
             complaints_df.at[idx[0], 'resolution_notes'] = notes
             complaints_df.at[idx[0], 'resolution_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        complaints_df.to_excel(COMPLAINT_FILE, index=False)
-        return True
-    return False
+        save_complaint_source(complaints_df, file_path)
+        row = complaints_df.loc[idx[0]]
+        record_change(entity, 'update', {
+            'complaint_id': complaint_id, 'status': status,
+            'resolution_notes': row.get('resolution_notes'),
+            'resolution_date': row.get('resolution_date')
+        })
+    
+    # Keep the unified web + voice view in step
+    update_unified_complaint(complaint_id, status=status,
+                             resolution_notes=row.get('resolution_notes'),
+                             resolution_date=row.get('resolution_date'))
+    if canonical_status(previous_status) != status:
+        record_transition(complaint_id, status, row.get('category'), row.get('assigned_to'))
+    return True
+
+@traced()
+def update_complaints_status(complaint_ids, status, notes=None, advance=False):
+    """
+    Update the status of many complaints with one write per workbook
+    With advance, complaints that cannot make the move directly are taken
+    through the states in between (e.g. Open -> In Progress -> Resolved),
+    each recorded as a lifecycle transition, in the same write.
+    Returns the number of complaints updated
+    """
+    complaint_ids = [str(complaint_id) for complaint_id in complaint_ids]
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    updated_ids = []
+    transitions = []
+    
+    status = check_transition(None, status)
+    paths = {}
+    def path_from(current):
+        # States entered on the way to `status`, or None if it cannot get there
+        if current not in paths:
+            path = transition_path(current, status)
+            paths[current] = path if advance or path is None or len(path) <= 1 else None
+        return paths[current]
+    changes = {'status': status}
+    if notes:
+        changes.update(resolution_notes=notes, resolution_date=now)
+    
+    with workbook_lock(COMPLAINT_FILE):
+        complaints_df = load_complaints()
+        mask = None
+        if not complaints_df.empty:
+            # Complaints that cannot make this move (e.g. already Closed) are left as they are
+            steps = complaints_df['status'].map(path_from)
+            mask = complaints_df['complaint_id'].isin(complaint_ids) & steps.notna()
+        if mask is not None and mask.any():
+            for complaint_id, path, category, technician in zip(
+                    complaints_df.loc[mask, 'complaint_id'], steps[mask],
+                    complaints_df.loc[mask, 'category'], complaints_df.loc[mask, 'assigned_to']):
+                transitions.extend((complaint_id, state, category, technician) for state in path)
+            complaints_df.loc[mask, 'status'] = status
+            if notes:
+                complaints_df['resolution_notes'] = complaints_df['resolution_notes'].astype(object)
+                complaints_df['resolution_date'] = complaints_df['resolution_date'].astype(object)
+                complaints_df.loc[mask, 'resolution_notes'] = notes
+                complaints_df.loc[mask, 'resolution_date'] = now
+            save_workbook(complaints_df, COMPLAINT_FILE)
+            web_ids = list(complaints_df.loc[mask, 'complaint_id'])
+            record_changes('complaint', 'update', [
+                dict(changes, complaint_id=complaint_id) for complaint_id in web_ids
+            ])
+            updated_ids.extend(web_ids)
+    
+    # Voice complaints gain the resolution columns the first time they are resolved with notes
+    with workbook_lock(VOICE_COMPLAINT_FILE):
+        voice_df = load_voice_complaints()
+        if not voice_df.empty:
+            voice_df['complaint_id'] = voice_df['complaint_id'].astype(str).str.strip()
+            steps = voice_df['status'].map(path_from)
+            voice_mask = voice_df['complaint_id'].isin(complaint_ids) & steps.notna()
+            if voice_mask.any():
+                technicians = (voice_df.loc[voice_mask, 'assigned_to'].fillna('') if 'assigned_to' in voice_df
+                               else [''] * int(voice_mask.sum()))
+                for complaint_id, path, category, technician in zip(
+                        voice_df.loc[voice_mask, 'complaint_id'], steps[voice_mask],
+                        voice_df.loc[voice_mask, 'complaint_type'], technicians):
+                    transitions.extend((complaint_id, state, category, technician) for state in path)
+                voice_df.loc[voice_mask, 'status'] = status
+                if notes:
+                    for column, value in (('resolution_notes', notes), ('resolution_date', now)):
+                        if column not in voice_df.columns:
+                            voice_df[column] = ''
+                        voice_df[column] = voice_df[column].astype(object)
+                        voice_df.loc[voice_mask, column] = value
+                save_workbook(voice_df, VOICE_COMPLAINT_FILE)
+                voice_ids = list(voice_df.loc[voice_mask, 'complaint_id'])
+                record_changes('voice_complaint', 'update', [
+                    dict(changes, complaint_id=complaint_id) for complaint_id in voice_ids
+                ])
+                updated_ids.extend(voice_ids)
+    
+    if updated_ids:
+        update_unified_complaints(updated_ids, **changes)
+        record_transitions(transitions)
+    return len(updated_ids)
+
+@traced()
+def assign_complaints(assignments):
+    """
+    Write [(complaint_id, technician_id, technician_name)] with one write per workbook
+    Open complaints move to In Progress. Returns the number assigned.
+    """
+    if not assignments:
+        return 0
+    by_file = {}
+    for assignment in assignments:
+        by_file.setdefault(complaint_source_file(assignment[0]), []).append(assignment)
+
+    changes = []
+    categories = []
+    for file_path, file_assignments in by_file.items():
+        with workbook_lock(file_path):
+            complaints_df, entity = load_complaint_source(file_path)
+            positions = {complaint_id: i for i, complaint_id in enumerate(complaints_df['complaint_id'])}
+            if 'technician_name' not in complaints_df.columns:
+                complaints_df['technician_name'] = ''
+            complaints_df['assigned_to'] = complaints_df['assigned_to'].astype(object)
+            complaints_df['technician_name'] = complaints_df['technician_name'].astype(object)
+
+            file_changes = []
+            for complaint_id, technician_id, technician_name in file_assignments:
+                i = positions.get(complaint_id)
+                if i is None:
+                    continue
+                complaints_df.iat[i, complaints_df.columns.get_loc('assigned_to')] = technician_id
+                complaints_df.iat[i, complaints_df.columns.get_loc('technician_name')] = technician_name
+                if complaints_df.iat[i, complaints_df.columns.get_loc('status')] == 'Open':
+                    complaints_df.iat[i, complaints_df.columns.get_loc('status')] = 'In Progress'
+                file_changes.append({
+                    'complaint_id': complaint_id,
+                    'assigned_to': technician_id,
+                    'technician_name': technician_name,
+                    'status': complaints_df.iat[i, complaints_df.columns.get_loc('status')]
+                })
+                categories.append(complaints_df.iat[i, complaints_df.columns.get_loc('category')])
+            if not file_changes:
+                continue
+
+            save_complaint_source(complaints_df, file_path)
+            record_changes(entity, 'update', file_changes)
+        changes.extend(file_changes)
+    for change in changes:
+        update_unified_complaint(change['complaint_id'], assigned_to=change['assigned_to'],
+                                 technician_name=change['technician_name'], status=change['status'])
+    record_transitions([(change['complaint_id'], canonical_status(change['status']), category, change['assigned_to'])
+                        for change, category in zip(changes, categories)
+                        if canonical_status(change['status'])])
+    return len(changes)
 
 # Routes
 @app.route('/')
@@ -179,7 +416,9 @@ def login():
              (users_df['phone'] == username))
         ]
         
-        if not user.empty and check_password_hash(user.iloc[0]['password'], password):
+        with span('check_password'):
+            password_ok = not user.empty and check_password_hash(user.iloc[0]['password'], password)
+        if password_ok:
             user_data = user.iloc[0].to_dict()
             session['user_id'] = user_data['user_id']
             session['username'] = user_data['email']
@@ -265,8 +504,37 @@ def submit_complaint():
             'voice_complaint': True if 'voice_used' in request.form else False
         }
         
-        save_complaint(complaint_data)
+        # Link probable repeats of an earlier web or voice complaint
+        try:
+            duplicates = find_duplicates(description, location, session['user_id'])
+        except Exception as e:
+            print(f"Error checking for duplicate complaints: {e}")
+            duplicates = []
+        if duplicates:
+            complaint_data['duplicate_of'] = duplicates[0][0]
+        
+        # The assignment is saved with the complaint, not as a second write
+        assignment = None
+        if AUTO_DISPATCH:
+            try:
+                assignment = dispatch_engine.assign_new(new_complaint_id)
+            except Exception as e:
+                print(f"Error dispatching complaint: {e}")
+        if assignment:
+            complaint_data['assigned_to'] = assignment[1]
+            complaint_data['technician_name'] = assignment[2]
+            complaint_data['status'] = 'In Progress'
+        
+        try:
+            save_complaint(complaint_data)
+        except Exception:
+            if assignment:
+                dispatch_engine.reset()
+            raise
+        record_transition(new_complaint_id, complaint_data['status'], category, complaint_data['assigned_to'])
         flash('Complaint submitted successfully!', complaint_data['complaint_id'])
+        if duplicates:
+            flash(f"This looks like a repeat of complaint {duplicates[0][0]}; we have linked the two.", 'info')
         return redirect(url_for('user_dashboard'))
     
     return render_template('submit_complaint.html', voice_transcript=voice_transcript)
@@ -395,7 +663,9 @@ def add_technician():
         # Add new technician to the DataFrame
         new_technician = pd.DataFrame([technician_data])
         updated_df = pd.concat([technicians_df, new_technician], ignore_index=True)
-        updated_df.to_excel(TECHNICIAN_FILE, index=False)
+        with workbook_lock(TECHNICIAN_FILE):
+            save_workbook(updated_df, TECHNICIAN_FILE)
+            record_change('technician', 'insert', technician_data)
         
         flash('Technician added successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
@@ -421,9 +691,9 @@ def admin_dashboard():
         flash('Unauthorized access', 'danger')
         return redirect(url_for('login'))
     
-    # Get all complaints
-    complaints_df = load_complaints()
-    complaints_df=complaints_df[::-1]
+    # Get all complaints, web and voice, newest first
+    complaints_df = load_unified_complaints()
+    complaints_df = complaints_df.sort_values('submission_date', ascending=False, kind='stable')
     
     # Get all technicians for assignment
     technicians_df = load_technician()
@@ -475,13 +745,15 @@ editors = [
         'name': 'Technician',
         'url_prefix': '/Technician',
         'excel_file': 'data/technician.xlsx',
-        'sheet_name': 'Sheet1'
+        'sheet_name': 'Sheet1',
+        'entity': 'technician'
     },
     {
         'name': 'users',
         'url_prefix': '/Customer',
         'excel_file': 'data/users.xlsx',
-        'sheet_name': 'Sheet1'
+        'sheet_name': 'Sheet1',
+        'entity': 'user'
     },
     {
         'name': 'bills',
@@ -492,7 +764,8 @@ editors = [
         'name': 'complaints',
         'url_prefix': '/Complaints',
         'excel_file': 'data/complaints.xlsx',
-        'sheet_name': 'Sheet1'
+        'sheet_name': 'Sheet1',
+        'entity': 'complaint'
     },
 ]
 
@@ -520,7 +793,8 @@ def process_voice_complaint():
         recognizer = sr.Recognizer()
         with sr.AudioFile(temp_audio.name) as source:
             audio_data = recognizer.record(source)
-            transcript = recognizer.recognize_google(audio_data)
+            with span('transcribe', engine='google'):
+                transcript = recognizer.recognize_google(audio_data)
         
         # Clean up temporary file
         os.unlink(temp_audio.name)
@@ -559,6 +833,10 @@ def view_complaint(complaint_id):
     
     complaints_df = load_complaints()
     complaint = complaints_df[complaints_df['complaint_id'] == complaint_id]
+    if complaint.empty and session['role'] == 'admin':
+        # Voice complaints only exist in the unified view
+        unified_df = load_unified_complaints()
+        complaint = unified_df[unified_df['complaint_id'] == complaint_id]
 
     # Get all technicians for assignment
     technicians_df = load_technician()
@@ -589,34 +867,53 @@ def assign_technician(complaint_id):
         return redirect(url_for('view_complaint', complaint_id=complaint_id))
     
     try:
-        # Load complaints and technician data
-        complaints_df = load_complaints()
         technicians_df = load_technician()
+        # Load complaints (web or voice workbook)
+        file_path = complaint_source_file(complaint_id)
+        with workbook_lock(file_path):
+            complaints_df, entity = load_complaint_source(file_path)
+            
+            # Find complaint by ID
+            complaint_idx = complaints_df.index[complaints_df['complaint_id'] == complaint_id].tolist()
         
-        # Find complaint by ID
-        complaint_idx = complaints_df.index[complaints_df['complaint_id'] == complaint_id].tolist()
+            if not complaint_idx:
+                flash('Complaint not found', 'danger')
+                return redirect(url_for('admin_dashboard'))
         
-        if not complaint_idx:
-            flash('Complaint not found', 'danger')
-            return redirect(url_for('admin_dashboard'))
+            # Find technician by ID
+            technician = technicians_df[technicians_df['technician_id'] == technician_id]
         
-        # Find technician by ID
-        technician = technicians_df[technicians_df['technician_id'] == technician_id]
+            if technician.empty:
+                flash('Technician not found', 'danger')
+                return redirect(url_for('view_complaint', complaint_id=complaint_id))
         
-        if technician.empty:
-            flash('Technician not found', 'danger')
-            return redirect(url_for('view_complaint', complaint_id=complaint_id))
+            if canonical_status(complaints_df.at[complaint_idx[0], 'status']) == 'Closed':
+                flash('Closed complaints cannot be reassigned', 'danger')
+                return redirect(url_for('view_complaint', complaint_id=complaint_id))
         
-        # Update complaint with technician assignment
-        complaints_df.at[complaint_idx[0], 'assigned_to'] = technician_id
-        complaints_df.at[complaint_idx[0], 'technician_name'] = technician.iloc[0]['fullName']
+            # Update complaint with technician assignment
+            complaints_df.at[complaint_idx[0], 'assigned_to'] = technician_id
+            complaints_df.at[complaint_idx[0], 'technician_name'] = technician.iloc[0]['fullName']
         
-        # Update status to "In Progress" if it's currently "Open"
-        if complaints_df.at[complaint_idx[0], 'status'] == 'Open':
-            complaints_df.at[complaint_idx[0], 'status'] = 'In Progress'
+            # Update status to "In Progress" if it's currently "Open"
+            if complaints_df.at[complaint_idx[0], 'status'] == 'Open':
+                complaints_df.at[complaint_idx[0], 'status'] = 'In Progress'
         
-        # Save changes to Excel file
-        complaints_df.to_excel(COMPLAINT_FILE, index=False)
+            # Save changes to Excel file
+            save_complaint_source(complaints_df, file_path)
+            record_change(entity, 'update', {
+                'complaint_id': complaint_id,
+                'assigned_to': technician_id,
+                'technician_name': technician.iloc[0]['fullName'],
+                'status': complaints_df.at[complaint_idx[0], 'status']
+            })
+        update_unified_complaint(complaint_id,
+                                 assigned_to=technician_id,
+                                 technician_name=technician.iloc[0]['fullName'],
+                                 status=complaints_df.at[complaint_idx[0], 'status'])
+        state = canonical_status(complaints_df.at[complaint_idx[0], 'status'])
+        if state:
+            record_transition(complaint_id, state, complaints_df.at[complaint_idx[0], 'category'], technician_id)
         
         flash(f'Complaint assigned to {technician.iloc[0]["fullName"]}', 'success')
         return redirect(url_for('admin_dashboard', complaint_id=complaint_id))
@@ -633,7 +930,13 @@ def update_complaint(complaint_id):
     status = request.form['status']
     notes = request.form['notes']
     
-    if update_complaint_status(complaint_id, status, notes):
+    try:
+        updated = update_complaint_status(complaint_id, status, notes)
+    except InvalidTransition as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin_dashboard'))
+    
+    if updated:
         # --- Email notification logic ---
         # Load complaint and user info
         complaints_df = load_complaints()
@@ -708,10 +1011,13 @@ def generate_report():
         flash('Unauthorized access', 'danger')
         return redirect(url_for('login'))
     
-    complaints_df = load_complaints()
+    complaints_df = load_unified_complaints()
     
-    # Create a summary report
-    report_data = {
+    return render_template('report.html', report=build_report_data(complaints_df))
+
+def build_report_data(complaints_df):
+    """Summary figures for the report page"""
+    return {
         'total_complaints': len(complaints_df),
         'open_complaints': len(complaints_df[complaints_df['status'] == 'Open']),
         'in_progress': len(complaints_df[complaints_df['status'] == 'In Progress']),
@@ -719,8 +1025,6 @@ def generate_report():
         'category_counts': complaints_df['category'].value_counts().to_dict(),
         'recent_complaints': complaints_df.sort_values('submission_date', ascending=False).head(5).to_dict('records')
     }
-    
-    return render_template('report.html', report=report_data)
 
 @app.route('/export_report_excel')
 def export_report_excel():
@@ -728,10 +1032,137 @@ def export_report_excel():
         flash('Unauthorized access', 'danger')
         return redirect(url_for('login'))
     
-    complaints_df = load_complaints()
+    # Reports are built in the background and cached per data version, so
+    # downloads of unchanged data are served straight from disk
+    version, path = report_builder.request()
+    if path:
+        return send_file(
+            path,
+            as_attachment=True,
+            download_name=f"complaints_report_{version}.xlsx",
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    
+    flash('The Excel report is being prepared. The download will be ready shortly.', 'info')
+    return redirect(url_for('admin_tools'))
+
+@app.route('/report_status')
+def report_status():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    status = report_builder.status()
+    if status['status'] == 'done':
+        status['download_url'] = url_for('export_report_excel')
+    return jsonify(status)
+
+@app.route('/search_complaints')
+def search_complaints_api():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'query': '', 'results': [], 'took_ms': 0})
+    
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    return jsonify(search_complaints(
+        query,
+        status=request.args.get('status') or None,
+        category=request.args.get('category') or None,
+        limit=limit
+    ))
+
+@app.route('/sla_stats')
+def sla_stats():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    escalations = sla_engine.check()
+    return jsonify({
+        'resolution_hours': sla_engine.stats(),
+        'pending_deadlines': len(sla_engine.deadlines),
+        'escalated_total': len(sla_engine.escalated),
+        'new_escalations': escalations,
+    })
+
+@app.route('/lifecycle_stats')
+def lifecycle_stats():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    dimension = request.args.get('by', 'category')
+    if dimension not in ('category', 'technician'):
+        return jsonify({'error': "by must be 'category' or 'technician'"}), 400
+    return jsonify({
+        'backlog': lifecycle_tracker.backlog(dimension),
+        'time_in_state': lifecycle_tracker.time_in_state(dimension),
+        'resolved_per_day': lifecycle_tracker.throughput('Resolved'),
+    })
+
+@app.route('/incidents')
+def incidents():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    return render_template('incidents.html', incidents=incident_detector.list_incidents())
+
+@app.route('/incidents.json')
+def incidents_json():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    include_resolved = request.args.get('include_resolved') == '1'
+    return jsonify({'incidents': incident_detector.list_incidents(include_resolved)})
+
+@app.route('/incidents/<incident_id>/resolve', methods=['POST'])
+def resolve_incident(incident_id):
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    members = incident_detector.members(incident_id)
+    if not members:
+        flash('Incident not found', 'danger')
+        return redirect(url_for('incidents'))
     
-    # Call the export function from excel_handler.py
-    return export_complaints_excel(complaints_df)
+    notes = request.form.get('notes') or f"Resolved with incident {incident_id}"
+    try:
+        # Open members go through In Progress on the way, in the same write
+        updated = update_complaints_status(members, 'Resolved', notes, advance=True)
+        incident_detector.mark_resolved(incident_id)
+        flash(f'Resolved {updated} complaints in incident {incident_id}', 'success')
+    except Exception as e:
+        flash(f'Error resolving incident: {str(e)}', 'danger')
+    return redirect(url_for('incidents'))
+
+@app.route('/export_complaints.csv')
+def export_complaints_csv():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    # Filters: ?status=&category=&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&source=web|voice
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return Response(
+        stream_with_context(csv_stream(export_filters(request.args), export_sources(request.args))),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=complaints_{timestamp}.csv'}
+    )
+
+@app.route('/export_complaints.ndjson')
+def export_complaints_ndjson():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return Response(
+        stream_with_context(ndjson_stream(export_filters(request.args), export_sources(request.args))),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=complaints_{timestamp}.ndjson'}
+    )
 
 @app.route('/backup_database')
 def backup_db():
@@ -743,13 +1174,92 @@ def backup_db():
     flash(message, 'success')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/scheduler_status')
+def scheduler_status():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    return jsonify(scheduler.status())
+
+@app.route('/admin/profiler')
+def profiler_status():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiler/start', methods=['POST'])
+def profiler_start():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    # Profiles the next N requests to one endpoint in this worker process
+    try:
+        status = profiler.start(app, request.form.get('endpoint', ''),
+                                request.form.get('requests', 10),
+                                request.form.get('mode', 'cprofile'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(status)
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+def profiler_stop():
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    return jsonify({'result': profiler.stop()})
+
+@app.route('/admin/profiler/files/<filename>')
+def profiler_download(filename):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    path = profiler.profile_path(filename)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'text' and path.endswith('.pstats'):
+        return Response(profiler.top_functions(path), mimetype='text/plain')
+    return send_file(os.path.abspath(path), as_attachment=True)
+
+@app.route('/admin/profiler/memory/<action>', methods=['POST'])
+def profiler_memory(action):
+    if 'user_id' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    try:
+        if action == 'start':
+            profiler.memory_start()
+            return jsonify({'tracemalloc': True})
+        if action == 'stop':
+            profiler.memory_stop()
+            return jsonify({'tracemalloc': False})
+        if action == 'snapshot':
+            return jsonify(profiler.memory_snapshot(request.form.get('label')))
+        if action == 'diff':
+            return jsonify({'top': profiler.memory_diff(request.form.get('before'), request.form.get('after'))})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'error': f"Unknown action '{action}'"}), 404
+
 @app.route('/admin_tools')
 def admin_tools():
     if 'user_id' not in session or session['role'] != 'admin':
         flash('Unauthorized access', 'danger')
         return redirect(url_for('login'))
     
-    return render_template('admin_tools.html')
+    return render_template('admin_tools.html', import_rejects=session.get('import_rejects'))
+
+@app.route('/import_rejects/<filename>')
+def download_import_rejects(filename):
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    file_path = os.path.join('uploads', secure_filename(filename))
+    if not filename.startswith('import_rejects_') or not os.path.exists(file_path):
+        flash('Rejects file not found', 'danger')
+        return redirect(url_for('admin_tools'))
+    return send_file(file_path, as_attachment=True, download_name=filename, mimetype='text/csv')
  
 @app.route('/import_complaints', methods=['POST'])
 def import_complaints():
@@ -773,26 +1283,24 @@ def import_complaints():
             file_path = os.path.join('uploads', filename)
             file.save(file_path)
             
-            imported_df, message = import_complaints_from_excel(file_path)
+            # Backup current data before import
+            backup_database()
             
-            if imported_df is not None:
-                # Backup current data before import
-                backup_database()
-                
-                # Merge with existing complaints
-                complaints_df = load_complaints()
-                # Avoid duplicates based on complaint_id
-                existing_ids = set(complaints_df['complaint_id'])
-                new_complaints = imported_df[~imported_df['complaint_id'].isin(existing_ids)]
-                
-                if not new_complaints.empty:
-                    updated_df = pd.concat([complaints_df, new_complaints], ignore_index=True)
-                    updated_df.to_excel(COMPLAINT_FILE, index=False)
-                    flash(f"Successfully imported {len(new_complaints)} new complaints", 'success')
-                else:
-                    flash("No new complaints to import", 'info')
+            rejects_path = os.path.join(
+                'uploads', f"import_rejects_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+            result = import_complaints_from_excel(file_path, COMPLAINT_FILE, rejects_path)
+            
+            if result['error']:
+                flash(f"Import failed: {result['error']}", 'danger')
+            elif result['imported']:
+                flash(f"Successfully imported {result['imported']} new complaints", 'success')
             else:
-                flash(f"Import failed: {message}", 'danger')
+                flash("No new complaints to import", 'info')
+            if result['rejected']:
+                session['import_rejects'] = os.path.basename(result['rejects_path'])
+                flash(f"{result['rejected']} rows were rejected, download the rejects file for the reasons", 'warning')
+            else:
+                session.pop('import_rejects', None)
             
             # Remove the temporary file
             os.remove(file_path)
@@ -838,7 +1346,10 @@ def update_profile():
         users_df.at[user_idx[0], 'password'] = generate_password_hash(new_password)
     
     # Save changes
-    users_df.to_excel(USER_FILE, index=False)
+    with workbook_lock(USER_FILE):
+        save_workbook(users_df, USER_FILE)
+        record_change('user', 'update', users_df.loc[user_idx[0], [
+            'user_id', 'email', 'phone', 'address', 'password']].to_dict())
     
     flash('Profile updated successfully', 'success')
     return redirect(url_for('profile'))
@@ -936,26 +1447,11 @@ def technician_dashboard():
         flash('Unauthorized access', 'danger')
         return redirect(url_for('technicianLogin'))
     
-    # Load complaints assigned to the logged-in technician
-    complaints_df = load_complaints()
-    technician_complaints = complaints_df[complaints_df['assigned_to'] == session['user_id']]
-    
-    total_complaint=len(technician_complaints)
-    open_complaint=len(technician_complaints[technician_complaints['status']=='open'])
-    inProgress_complaint=len(technician_complaints[technician_complaints['status']=='Inprogress'])
-    resolved_complaint=len(technician_complaints[technician_complaints['status']=='Resolved'])
-
-    stats={
-        'total':total_complaint,
-        'open':open_complaint,
-        'InProgress':inProgress_complaint,
-        'Resolved':resolved_complaint,
-
-    }
-
+    # Complaints assigned to the logged-in technician, with counts per status
+    technician_complaints, stats = technician_queues.queue(session['user_id'])
 
     return render_template('technician_dashboard.html',
-                            complaints=technician_complaints.to_dict('records'),
+                            complaints=technician_complaints,
                             stats=stats)
 # Add this new route for technician_profile after the technician_dashboard route
 @app.route('/technician_profile')
@@ -1012,7 +1508,10 @@ def update_technician_profile():
         technicians_df.at[tech_idx[0], 'password'] = generate_password_hash(new_password)
     
     # Save changes
-    technicians_df.to_excel(TECHNICIAN_FILE, index=False)
+    with workbook_lock(TECHNICIAN_FILE):
+        save_workbook(technicians_df, TECHNICIAN_FILE)
+        record_change('technician', 'update', technicians_df.loc[tech_idx[0], [
+            'technician_id', 'email', 'phone', 'address', 'password']].to_dict())
     
     flash('Profile updated successfully', 'success')
     return redirect(url_for('technician_profile'))
@@ -1040,10 +1539,13 @@ def update_technician_complaint(complaint_id):
         return redirect(url_for('technician_dashboard'))
     
     # Update complaint status and resolution notes
-    if update_complaint_status(complaint_id, status, notes):
-        flash('Complaint updated successfully!', 'success')
-    else:
-        flash('Failed to update complaint', 'danger')
+    try:
+        if update_complaint_status(complaint_id, status, notes):
+            flash('Complaint updated successfully!', 'success')
+        else:
+            flash('Failed to update complaint', 'danger')
+    except InvalidTransition as e:
+        flash(str(e), 'danger')
     
     return redirect(url_for('technician_dashboard'))
 
@@ -1058,7 +1560,33 @@ def manage_technicians():
     # Load technicians data
     technicians_df = load_technician()
     technicians_count = len(technicians_df)
-    return render_template('manage_technicians.html', technicians=technicians_df.to_dict('records'),technicians_count=technicians_count)
+    try:
+        workload = dispatch_engine.workload()
+    except Exception as e:
+        print(f"Error loading technician workload: {e}")
+        workload = {'technicians': {}, 'waiting': 0}
+    return render_template('manage_technicians.html', technicians=technicians_df.to_dict('records'),technicians_count=technicians_count,
+                           workload=workload['technicians'], waiting_count=workload['waiting'])
+
+@app.route('/dispatch_backlog', methods=['POST'])
+def dispatch_backlog():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    try:
+        assignments = dispatch_engine.plan()
+        if not assignments:
+            flash('No unassigned complaints to dispatch, or no technicians available', 'info')
+        else:
+            assigned = assign_complaints(assignments)
+            if assigned < len(assignments):
+                dispatch_engine.reset()
+            flash(f'Dispatched {assigned} complaints to technicians', 'success')
+    except Exception as e:
+        dispatch_engine.reset()
+        flash(f'Error dispatching complaints: {str(e)}', 'danger')
+    return redirect(url_for('manage_technicians'))
 
 @app.route('/edit_technician/<technician_id>', methods=['GET', 'POST'])
 def edit_technician(technician_id):
@@ -1099,7 +1627,10 @@ def edit_technician(technician_id):
         technicians_df.at[tech_idx, 'address'] = address
         
         # Save changes
-        technicians_df.to_excel(TECHNICIAN_FILE, index=False)
+        with workbook_lock(TECHNICIAN_FILE):
+            save_workbook(technicians_df, TECHNICIAN_FILE)
+            record_change('technician', 'update', technicians_df.loc[tech_idx, [
+                'technician_id', 'fullName', 'aadhar', 'email', 'phone', 'address']].to_dict())
         
         flash('Technician updated successfully!', 'success')
         return redirect(url_for('manage_technicians'))
@@ -1123,7 +1654,9 @@ def delete_technician(technician_id):
     
     # Remove technician from the DataFrame
     technicians_df = technicians_df.drop(tech_idx[0])
-    technicians_df.to_excel(TECHNICIAN_FILE, index=False)
+    with workbook_lock(TECHNICIAN_FILE):
+        save_workbook(technicians_df, TECHNICIAN_FILE)
+        record_change('technician', 'delete', {'technician_id': technician_id})
     
     flash('Technician deleted successfully!', 'success')
     return redirect(url_for('manage_technicians'))
@@ -1134,16 +1667,11 @@ def assigned_complaint():
     return f"assigned no complaint"
 @app.route('/reports')
 def reports():
-    # Example: get or build your report data here
-    report = {
-        "total_complaints": 0,
-        "open_complaints": 0,
-        "in_progress": 0,
-        "resolved": 0,
-        "category_counts": {},
-        "recent_complaints": []
-    }
-    # Replace the above with your actual report data logic
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Unauthorized access', 'danger')
+        return redirect(url_for('login'))
+    
+    report = build_report_data(load_unified_complaints())
     return render_template('report.html', report=report)
 
 @app.route('/admin_profile')
@@ -1160,15 +1688,49 @@ def page_not_found(e):
 def server_error(e):
     return render_template('500.html')
 
+# Local microphone kiosk started from /start_voice_interaction
+voice_kiosk_thread = None
+
 @app.route('/start_voice_interaction')
 def start_voice_interaction():
-    # This will speak and listen using microphone
-    main()
+    # This will speak and listen using microphone. The kiosk loop blocks
+    # until the caller exits, so it runs on its own thread instead of the
+    # request worker; phone callers go through ivr_server.py instead.
+    global voice_kiosk_thread
+    if voice_kiosk_thread is None or not voice_kiosk_thread.is_alive():
+        voice_kiosk_thread = threading.Thread(target=main, daemon=True)
+        voice_kiosk_thread.start()
+        flash('Voice assistant started', 'info')
+    else:
+        flash('Voice assistant is already running', 'info')
     return  redirect('user_dashboard') # Or
 
 @app.route('/about')
 def about():
     return render_template('about.html')
 
+def warm_caches():
+    """Bring this worker's in-memory indexes up to date before a request needs them"""
+    search_index.sync()
+    duplicate_index.sync()
+    incident_detector.sync()
+    technician_queues.sync()
+    dispatch_engine.workload()
+    lifecycle_tracker.sync()
+
+# Periodic maintenance. Jobs that write shared files run in one gunicorn
+# worker only; jobs that warm a worker's own memory run in every worker.
+scheduler.add_job('backup', backup_database, cron='0 * * * *', jitter=60)
+scheduler.add_job('changelog_compaction', compact_change_log, cron='30 3 * * *', jitter=60)
+scheduler.add_job('lifecycle_compaction', compact_events, cron='45 3 * * *', jitter=60)
+scheduler.add_job('parquet_export', export_parquet, cron='0 2 * * *', jitter=60)
+scheduler.add_job('report_build', report_builder.request, interval=15 * 60, jitter=60)
+scheduler.add_job('sla_check', sla_engine.check, interval=60, jitter=10)
+scheduler.add_job('cache_warmup', warm_caches, interval=60, jitter=15, leader_only=False)
+scheduler.add_job('bill_reload', reload_bills, interval=5 * 60, jitter=30, leader_only=False)
+
 if __name__ == '__main__':
+    # The reloader runs the app in a child process; only that one serves requests
+    if SCHEDULER_ENABLED and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start()
     app.run(debug=True)
@@ -0,0 +1,318 @@
+# backup_store.py - Content-addressed, compressed backups of the data files
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from change_log import compact_log, fcntl, last_sequence, record_restore, workbook_lock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BACKUP_DIR = 'backups'
+BACKUP_FILES = [
+    'data/complaints.xlsx',
+    'data/users.xlsx',
+    'data/technician.xlsx',
+    'data/voiceComplaint.xlsx',
+    'data/Electricity_Bills_3Months.xlsx',
+]
+# Snapshots kept: the N most recent, plus the newest snapshot of each of
+# the last N hours/days/weeks
+BACKUP_RETENTION = {'latest': 10, 'hourly': 24, 'daily': 7, 'weekly': 4}
+RETENTION_PERIODS = {'hourly': '%Y%m%d%H', 'daily': '%Y%m%d', 'weekly': '%G%V'}
+HASH_CHUNK_SIZE = 1024 * 1024
+BACKUP_ID_FORMAT = '%Y%m%d_%H%M%S_%f'
+# What reading a damaged object raises before the digest can be checked
+CORRUPT_OBJECT_ERRORS = (EOFError, OSError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def objects_dir(backup_dir):
+    return os.path.join(backup_dir, 'objects')
+
+
+def manifests_dir(backup_dir):
+    return os.path.join(backup_dir, 'manifests')
+
+
+def object_path(backup_dir, digest, codec):
+    return os.path.join(objects_dir(backup_dir), digest[:2], f"{digest}.{codec}")
+
+
+def file_sha256(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def compress_file(source_path, target_path):
+    """
+    Compress with zstd when the zstandard package is installed, else gzip
+    Returns (sha256 of the original bytes, stat of the file read). Both
+    come from the one open file, so a workbook replaced mid-backup cannot
+    leave an object stored under another version's digest.
+    """
+    sha = hashlib.sha256()
+    temp_path = f"{target_path}.tmp"
+    with open(source_path, 'rb') as src:
+        stat = os.fstat(src.fileno())
+        with open(temp_path, 'wb') as raw:
+            if zstandard is not None:
+                dst = zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=False)
+            else:
+                dst = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+            with dst:
+                for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+                    dst.write(chunk)
+    os.replace(temp_path, target_path)
+    return sha.hexdigest(), stat
+
+
+def decompress_file(source_path, target_path):
+    with open(target_path, 'wb') as dst:
+        if source_path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to restore this backup")
+            with open(source_path, 'rb') as src:
+                zstandard.ZstdDecompressor().copy_stream(src, dst)
+        else:
+            with gzip.open(source_path, 'rb') as src:
+                shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+
+
+backup_thread_lock = threading.Lock()
+
+
+@contextmanager
+def backup_lock(backup_dir=BACKUP_DIR):
+    """
+    Held while snapshotting, pruning or compacting, so pruning never
+    deletes an object a snapshot being written still refers to
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    with backup_thread_lock, open(os.path.join(backup_dir, 'backup.lock'), 'a') as f:
+        if fcntl:
+            # Released when the file is closed
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """Manifests, newest first"""
+    directory = manifests_dir(backup_dir)
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), 'r') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def create_backup(files=None, backup_dir=BACKUP_DIR):
+    """
+    Snapshot the data files and return the new manifest
+
+    Files whose size and mtime match the previous snapshot are not read
+    again. Changed files are copied aside while every workbook lock is
+    held, so the copies and the change log sequence number describe the
+    same moment; the copies are then hashed and compressed in one read,
+    and only kept if no snapshot holds the same content yet.
+    """
+    with backup_lock(backup_dir):
+        files = files or BACKUP_FILES
+        os.makedirs(manifests_dir(backup_dir), exist_ok=True)
+        os.makedirs(objects_dir(backup_dir), exist_ok=True)
+        previous = list_backups(backup_dir)
+        previous_files = previous[0]['files'] if previous else {}
+
+        now = datetime.now()
+        manifest = {
+            'backup_id': now.strftime(BACKUP_ID_FORMAT),
+            'created_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'files': {},
+            'new_bytes': 0,
+        }
+        staging_dir = tempfile.mkdtemp(prefix='staging.', dir=objects_dir(backup_dir))
+        try:
+            copies = []
+            with ExitStack() as locks:
+                # Always taken in the same order, so two backups cannot deadlock
+                for file_path in sorted(files):
+                    locks.enter_context(workbook_lock(file_path))
+                # Writers log under these locks, so no event after this seq
+                # is in the copies and every event up to it is
+                manifest['change_seq'] = last_sequence()
+                for file_path in files:
+                    if not os.path.exists(file_path):
+                        continue
+                    stat = os.stat(file_path)
+                    entry = previous_files.get(file_path)
+                    if (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                            and os.path.exists(os.path.join(backup_dir, entry['object']))):
+                        manifest['files'][file_path] = entry
+                        continue
+                    copy_path = os.path.join(staging_dir, str(len(copies)))
+                    shutil.copyfile(file_path, copy_path)
+                    copies.append((file_path, copy_path, stat))
+
+            codec = 'zst' if zstandard is not None else 'gz'
+            for file_path, copy_path, stat in copies:
+                # Compressed to a scratch object first: the digest is only
+                # known once the file has been read
+                scratch_path = f"{copy_path}.{codec}"
+                digest, _ = compress_file(copy_path, scratch_path)
+                existing = [path for path in (object_path(backup_dir, digest, 'zst'),
+                                              object_path(backup_dir, digest, 'gz'))
+                            if os.path.exists(path)]
+                if existing:
+                    path = existing[0]
+                else:
+                    path = object_path(backup_dir, digest, codec)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(scratch_path, path)
+                    manifest['new_bytes'] += os.path.getsize(path)
+                manifest['files'][file_path] = {
+                    'sha256': digest,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'object': os.path.relpath(path, backup_dir),
+                }
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        path = os.path.join(manifests_dir(backup_dir), f"{manifest['backup_id']}.json")
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+        return manifest
+
+
+def backups_to_keep(manifests, retention=BACKUP_RETENTION):
+    """IDs of the snapshots the retention policy keeps (always including the newest)"""
+    keep = {manifest['backup_id'] for manifest in manifests[:max(1, retention.get('latest', 1))]}
+    for period, count in retention.items():
+        if period not in RETENTION_PERIODS:
+            continue
+        seen = set()
+        for manifest in manifests:
+            created = datetime.strptime(manifest['backup_id'], BACKUP_ID_FORMAT)
+            bucket = created.strftime(RETENTION_PERIODS[period])
+            if bucket in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(bucket)
+            keep.add(manifest['backup_id'])
+    return keep
+
+
+def prune_backups(backup_dir=BACKUP_DIR, retention=BACKUP_RETENTION):
+    """Apply the retention policy and delete objects no snapshot refers to"""
+    with backup_lock(backup_dir):
+        manifests = list_backups(backup_dir)
+        keep = backups_to_keep(manifests, retention)
+        removed = 0
+        referenced = set()
+        for manifest in manifests:
+            if manifest['backup_id'] in keep:
+                referenced.update(entry['object'] for entry in manifest['files'].values())
+            else:
+                os.remove(os.path.join(manifests_dir(backup_dir), f"{manifest['backup_id']}.json"))
+                removed += 1
+
+        for root, _, names in os.walk(objects_dir(backup_dir)):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, backup_dir) not in referenced:
+                    os.remove(path)
+        return removed
+
+
+def compact_change_log(backup_dir=BACKUP_DIR):
+    """
+    Drop change log events the oldest kept backup already contains
+    Point-in-time restores start from a backup, so older events are never
+    replayed. Returns the number of events dropped.
+    """
+    with backup_lock(backup_dir):
+        sequences = [manifest['change_seq'] for manifest in list_backups(backup_dir) if 'change_seq' in manifest]
+        if not sequences:
+            return 0
+        return compact_log(min(sequences))
+
+
+def restore_backup(backup_id, files=None, backup_dir=BACKUP_DIR):
+    """Restore files (all by default) from a snapshot; returns the restored paths"""
+    # Pruning could otherwise delete the objects while they are read
+    with backup_lock(backup_dir):
+        path = os.path.join(manifests_dir(backup_dir), f"{backup_id}.json")
+        if not os.path.exists(path):
+            raise ValueError(f"Backup {backup_id} not found")
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+
+        restored = []
+        for file_path, entry in manifest['files'].items():
+            if files and file_path not in files:
+                continue
+            temp_path = f"{file_path}.restoring"
+            try:
+                decompress_file(os.path.join(backup_dir, entry['object']), temp_path)
+                intact = file_sha256(temp_path) == entry['sha256']
+            except CORRUPT_OBJECT_ERRORS:
+                intact = False
+            if not intact:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise ValueError(f"Backup copy of {file_path} is corrupt")
+            with workbook_lock(file_path):
+                os.replace(temp_path, file_path)
+                record_restore(file_path)
+            restored.append(file_path)
+        return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up and restore the ECMS data files")
+    parser.add_argument('--dir', default=BACKUP_DIR, help="backup directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('backup', help="snapshot the data files and apply retention")
+    commands.add_parser('list', help="list snapshots")
+    commands.add_parser('prune', help="apply the retention policy")
+    restore = commands.add_parser('restore', help="restore a snapshot")
+    restore.add_argument('backup_id')
+    restore.add_argument('--file', action='append', help="restore only this file (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == 'backup':
+        manifest = create_backup(backup_dir=args.dir)
+        prune_backups(args.dir)
+        print(f"Backup {manifest['backup_id']}: {len(manifest['files'])} files, "
+              f"{manifest['new_bytes']} new bytes")
+    elif args.command == 'list':
+        for manifest in list_backups(args.dir):
+            print(f"{manifest['backup_id']}  {manifest['created_at']}  {len(manifest['files'])} files")
+    elif args.command == 'prune':
+        print(f"Removed {prune_backups(args.dir)} snapshots")
+    elif args.command == 'restore':
+        for file_path in restore_backup(args.backup_id, args.file, args.dir):
+            print(f"Restored {file_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# bench_storage.py - Storage and report micro-benchmarks at each dataset size
+import os
+from datetime import datetime
+
+import pytest
+
+from synthetic_data import make_complaints, user_email, write_workbook
+
+
+def bench_load_complaints(benchmark, ecms, dataset):
+    complaints = benchmark.pedantic(ecms.load_complaints, rounds=dataset['rounds'])
+    assert len(complaints) == dataset['rows']
+
+
+def bench_save_complaint(benchmark, ecms, dataset, restore_complaints):
+    complaint = {
+        'complaint_id': f"CID{dataset['rows'] + 1:07d}",
+        'user_id': 'UID0000001',
+        'category': 'Power Outage',
+        'description': 'No power since morning',
+        'location': 'Sector 4',
+        'submission_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'status': 'Open',
+        'assigned_to': '',
+        'attachment_path': '',
+        'resolution_notes': '',
+        'resolution_date': '',
+    }
+    benchmark.pedantic(ecms.save_complaint, args=(complaint,), setup=restore_complaints,
+                       rounds=dataset['rounds'])
+
+
+def bench_update_complaint_status(benchmark, ecms, dataset, restore_complaints):
+    complaints = dataset['complaints']
+    complaint_id = complaints.loc[complaints['status'] == 'Open', 'complaint_id'].iloc[len(complaints) // 8]
+    updated = benchmark.pedantic(ecms.update_complaint_status,
+                                 args=(complaint_id, 'In Progress', 'Technician on the way'),
+                                 setup=restore_complaints, rounds=dataset['rounds'])
+    assert updated
+
+
+def bench_check_payment_status(benchmark, ecms, dataset):
+    from biil import check_payment_status
+
+    # A customer half way through the bills
+    status = benchmark(check_payment_status, user_email(dataset['rows'] // 6))
+    assert status in ('paid', 'unpaid')
+
+
+def bench_generate_report_excel(benchmark, dataset):
+    from excel_handler import generate_report_excel
+
+    report = benchmark.pedantic(generate_report_excel, args=(dataset['complaints'],),
+                                rounds=dataset['rounds'])
+    assert report.getbuffer().nbytes > 0
+
+
+@pytest.fixture
+def import_file(dataset, tmp_path):
+    """An upload with as many new complaints as the dataset holds"""
+    rows = dataset['rows']
+    path = os.path.join(tmp_path, 'import.xlsx')
+    write_workbook(make_complaints(rows, rows, max(10, rows // 100), seed=1, first_id=rows + 1), path)
+    return path
+
+
+def bench_import_complaints_from_excel(benchmark, dataset, restore_complaints, import_file):
+    from excel_handler import import_complaints_from_excel
+
+    result = benchmark.pedantic(import_complaints_from_excel, args=(import_file,),
+                                setup=restore_complaints, rounds=dataset['rounds'])
+    assert result['error'] is None and result['imported'] == dataset['rows']
@@ -0,0 +1,88 @@
+# conftest.py - Synthetic datasets and an isolated working directory for the benchmarks
+#
+#   python -m pytest benchmarks                              # 1k and 10k rows
+#   python -m pytest benchmarks --sizes 1k,10k,100k,1M
+#   python -m pytest benchmarks --benchmark-compare          # against the last saved run
+#   python -m pytest benchmarks --benchmark-compare=0003 --benchmark-compare-fail=mean:20%
+#
+# Datasets are generated once per size and kept in data/synthetic/; the
+# app runs against copies of them in a temporary directory, so the real
+# workbooks are never touched.
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_data import SIZES, cached_dataset, install_dataset, parse_size  # noqa: E402
+
+DATASET_CACHE_DIR = os.path.join(ROOT, 'data', 'synthetic')
+DEFAULT_SIZES = '1k,10k'
+# Timed rounds per size; the slow sizes get a single round
+ROUNDS = {1_000: 5, 10_000: 3}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--sizes', default=DEFAULT_SIZES,
+                     help=f"comma separated dataset sizes ({', '.join(SIZES)} or row counts)")
+
+
+def size_labels(config):
+    return [label.strip() for label in config.getoption('sizes').split(',') if label.strip()]
+
+
+def pytest_generate_tests(metafunc):
+    # Session scope groups the benchmarks by size, so each dataset is installed once
+    if 'size' in metafunc.fixturenames:
+        metafunc.parametrize('size', size_labels(metafunc.config), scope='session')
+
+
+@pytest.fixture(scope='session')
+def ecms(tmp_path_factory, pytestconfig):
+    """The app module, imported inside a scratch working directory"""
+    workdir = tmp_path_factory.mktemp('ecms')
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    # The app reads its workbooks (and biil its bills) at import time
+    smallest = min(parse_size(label) for label in size_labels(pytestconfig))
+    install_dataset(cached_dataset(smallest, cache_dir=DATASET_CACHE_DIR), 'data')
+    try:
+        yield importlib.import_module('app')
+    finally:
+        os.chdir(previous_dir)
+
+
+@pytest.fixture(scope='session')
+def dataset(ecms, size):
+    """Install the dataset for `size` and bring the in-memory caches up to date"""
+    import biil
+    from complaint_merge import unified_view
+
+    rows = parse_size(size)
+    source_dir = cached_dataset(rows, cache_dir=DATASET_CACHE_DIR)
+    install_dataset(source_dir, 'data')
+    biil.reload_bills()
+    unified_view.refresh()
+    complaints = ecms.load_complaints()
+    return {
+        'rows': rows,
+        'source_dir': source_dir,
+        'rounds': ROUNDS.get(rows, 1),
+        'complaints': complaints,
+    }
+
+
+@pytest.fixture
+def restore_complaints(dataset):
+    """Setup for rounds that change complaints.xlsx: put the dataset's copy back"""
+    from complaint_merge import unified_view
+
+    def restore():
+        shutil.copy(os.path.join(dataset['source_dir'], 'complaints.xlsx'), 'data/complaints.xlsx')
+        # Merge the reset outside the timed call
+        unified_view.refresh()
+    return restore
@@ -1,9 +1,25 @@
+import os
+
 import pandas as pd
 
+from metrics import storage_timer
+from tracing import traced
+
 # Load the Excel file
 file_path = "data/Electricity_Bills_3Months.xlsx"  # Make sure the file is in the same directory
 df = pd.read_excel(file_path)
+bills_mtime = os.path.getmtime(file_path)
+
+def reload_bills():
+    """Re-read the bills workbook if it changed since it was loaded"""
+    global df, bills_mtime
+    mtime = os.path.getmtime(file_path)
+    if mtime != bills_mtime:
+        with storage_timer('read_excel', file_path):
+            df = pd.read_excel(file_path)
+        bills_mtime = mtime
 
+@traced()
 def check_payment_status(customer_id):
     # Filter records for the given customer
     customer_data = df[df["Customer ID"] == customer_id]
@@ -0,0 +1,256 @@
+# change_log.py - Ordered, sequence-numbered log of data mutations
+import json
+import math
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from metrics import storage_timer
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are still serialised within one process
+    fcntl = None
+
+
+CHANGE_LOG_FILE = 'data/changelog.ndjson'
+ENTITIES = {
+    'complaint': {'file': 'data/complaints.xlsx', 'key': 'complaint_id'},
+    'user': {'file': 'data/users.xlsx', 'key': 'user_id'},
+    'technician': {'file': 'data/technician.xlsx', 'key': 'technician_id'},
+    'voice_complaint': {'file': 'data/voiceComplaint.xlsx', 'key': 'complaint_id'},
+}
+# Every event line starts with this, so sequence numbers can be read
+# without parsing the whole line
+SEQ_PREFIX = '{"seq":'
+
+log_lock = threading.Lock()
+
+
+class WorkbookLock:
+    """
+    Serialises read-modify-write cycles on a workbook across threads and
+    gunicorn workers, using an flock on `<workbook>.lock`
+    Writers log their change before releasing it, so anyone holding it
+    sees a workbook and a log that agree.
+    Re-entrant within a thread, so a helper that takes the lock can be
+    called by code that already holds it.
+    """
+
+    def __init__(self, file_path):
+        self.lock_path = f"{file_path}.lock"
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and fcntl:
+            self.handle = open(self.lock_path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0 and self.handle:
+            # Closing releases the flock
+            self.handle.close()
+            self.handle = None
+        self.thread_lock.release()
+
+
+workbook_locks = {}
+workbook_locks_guard = threading.Lock()
+
+
+def workbook_lock(file_path):
+    """The shared WorkbookLock for a workbook path"""
+    with workbook_locks_guard:
+        key = os.path.abspath(file_path)
+        if key not in workbook_locks:
+            workbook_locks[key] = WorkbookLock(file_path)
+        return workbook_locks[key]
+
+
+def json_value(value):
+    """Make a DataFrame cell JSON friendly"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    if hasattr(value, 'item'):
+        # numpy scalar
+        return json_value(value.item())
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def line_sequence(line):
+    return int(line[len(SEQ_PREFIX):line.index(',', len(SEQ_PREFIX))])
+
+
+def last_sequence(log_file=CHANGE_LOG_FILE):
+    """Sequence number of the last event in the log (0 if it is empty)"""
+    if not os.path.exists(log_file):
+        return 0
+    with open(log_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        block = 4096
+        while True:
+            start = max(0, end - block)
+            f.seek(start)
+            lines = f.read(end - start).decode('utf-8').splitlines()
+            complete = [line for line in lines[1 if start else 0:] if line.startswith(SEQ_PREFIX)]
+            if complete:
+                return line_sequence(complete[-1])
+            if start == 0:
+                return 0
+            block *= 2
+
+
+def open_locked(log_file):
+    """
+    Open the log for appending with the cross-process lock held
+    Compaction replaces the file, so a process that was waiting for the
+    lock on the old file opens the new one and waits again.
+    """
+    while True:
+        f = open(log_file, 'a', encoding='utf-8')
+        if not fcntl:
+            return f
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if os.path.exists(log_file) and os.fstat(f.fileno()).st_ino == os.stat(log_file).st_ino:
+            return f
+        f.close()
+
+
+def record_changes(entity, op, rows, log_file=CHANGE_LOG_FILE):
+    """
+    Append one event per row; `op` is 'insert', 'update', 'delete' or
+    'restore' (the entity's file was replaced wholesale, key '*')
+    Each row is a dict holding at least the entity's key column. Updates
+    only need the changed columns. Returns the last sequence number used.
+    """
+    key_column = ENTITIES[entity]['key']
+    with log_lock, storage_timer('append_changelog', log_file):
+        f = open_locked(log_file)
+        try:
+            # Stamped under the lock too, so timestamps never run backwards against seq
+            ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            # Read under the lock so other processes appending to the log
+            # cannot hand out the same number
+            seq = last_sequence(log_file)
+            lines = []
+            for row in rows:
+                seq += 1
+                data = {column: json_value(value) for column, value in row.items()}
+                lines.append(json.dumps({'seq': seq, 'ts': ts, 'entity': entity, 'op': op,
+                                         'key': str(data[key_column]), 'data': data},
+                                        separators=(',', ':'), ensure_ascii=False))
+            if lines:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+            return seq
+        finally:
+            # Closing also releases the file lock
+            f.close()
+
+
+def record_change(entity, op, row, log_file=CHANGE_LOG_FILE):
+    try:
+        return record_changes(entity, op, [row], log_file)
+    except Exception as e:
+        # The data file is already written; a missing event only narrows recovery
+        print(f"Error writing change log: {e}")
+        return None
+
+
+def record_restore(file_path, log_file=CHANGE_LOG_FILE):
+    """Log that a data file was replaced from a backup, so readers reload it"""
+    for entity, config in ENTITIES.items():
+        if config['file'] == file_path:
+            record_change(entity, 'restore', {config['key']: '*'}, log_file)
+
+
+def compact_log(before_seq, log_file=CHANGE_LOG_FILE):
+    """
+    Drop events with seq <= before_seq, e.g. those already covered by the
+    oldest backup. The newest event is always kept because it numbers the
+    next one. Returns the number of events dropped.
+    """
+    if not os.path.exists(log_file):
+        return 0
+    with log_lock:
+        f = open_locked(log_file)
+        try:
+            before_seq = min(before_seq, last_sequence(log_file) - 1)
+            dropped = 0
+            temp_path = f"{log_file}.{os.getpid()}.tmp"
+            with open(log_file, 'r', encoding='utf-8') as source, \
+                    open(temp_path, 'w', encoding='utf-8') as target:
+                for line in source:
+                    if line.startswith(SEQ_PREFIX) and line_sequence(line) <= before_seq:
+                        dropped += 1
+                    else:
+                        target.write(line)
+            if dropped:
+                os.replace(temp_path, log_file)
+            else:
+                os.remove(temp_path)
+            return dropped
+        finally:
+            f.close()
+
+
+def first_sequence(log_file=CHANGE_LOG_FILE):
+    """Sequence number of the first event still in the log (0 if it is empty)"""
+    if not os.path.exists(log_file):
+        return 0
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith(SEQ_PREFIX):
+                return line_sequence(line)
+    return 0
+
+
+def apply_event(tables, event):
+    """Apply one event to {entity: {key: row}}; replaying an event twice is harmless"""
+    table = tables.setdefault(event['entity'], {})
+    if event['op'] == 'insert':
+        table[event['key']] = dict(event['data'])
+    elif event['op'] == 'update':
+        table.setdefault(event['key'], {}).update(event['data'])
+    elif event['op'] == 'delete':
+        table.pop(event['key'], None)
+
+
+def replay_log(tables, after_seq=0, to_seq=None, to_time=None, log_file=CHANGE_LOG_FILE):
+    """Apply events with after_seq < seq <= to_seq (and ts <= to_time); returns the last seq applied"""
+    applied = after_seq
+    if not os.path.exists(log_file):
+        return applied
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith(SEQ_PREFIX):
+                continue
+            seq = line_sequence(line)
+            if seq <= after_seq:
+                continue
+            if to_seq is not None and seq > to_seq:
+                break
+            event = json.loads(line)
+            # Compared at to_time's precision: 'YYYY-MM-DD HH:MM:SS' takes in
+            # every event within that second
+            if to_time is not None and event['ts'][:len(to_time)] > to_time:
+                break
+            apply_event(tables, event)
+            applied = seq
+    return applied
@@ -0,0 +1,334 @@
+# complaint_lifecycle.py - Complaint status state machine and time-in-state metrics
+import json
+import os
+import pickle
+import threading
+from datetime import datetime
+
+from change_log import fcntl, open_locked
+from complaint_merge import unified_view
+from technician_queues import normalise_status
+
+
+LIFECYCLE_EVENT_FILE = 'data/lifecycle_events.ndjson'
+# Aggregates of the events compacted out of the event file
+LIFECYCLE_STATE_FILE = 'data/lifecycle_state.pkl'
+STATES = ['Open', 'In Progress', 'Resolved', 'Closed']
+# Allowed moves, forward only: Open -> In Progress -> Resolved/Closed.
+# Staying in the same state (e.g. to add notes) is always allowed; a fault
+# that comes back is a new complaint.
+TRANSITIONS = {
+    'Open': {'In Progress'},
+    'In Progress': {'Resolved', 'Closed'},
+    'Resolved': {'Closed'},
+    'Closed': set(),
+}
+UNASSIGNED = 'Unassigned'
+
+event_lock = threading.Lock()
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def canonical_status(status):
+    """The state a stored status spelling stands for, or None if it is unknown"""
+    if str(status).strip().lower() == 'closed':
+        return 'Closed'
+    bucket = normalise_status(status)
+    return {'open': 'Open', 'in_progress': 'In Progress', 'resolved': 'Resolved'}.get(bucket)
+
+
+def can_transition(current, target):
+    """Whether a complaint with status `current` may move to the state `target`"""
+    source = canonical_status(current)
+    # Rows with a missing or unrecognised status may move anywhere
+    return source is None or source == target or target in TRANSITIONS[source]
+
+
+def check_transition(current, new):
+    """Canonical new state, or InvalidTransition if the move is not allowed"""
+    target = canonical_status(new)
+    if target is None:
+        raise InvalidTransition(f"Unknown status '{new}'")
+    if not can_transition(current, target):
+        raise InvalidTransition(f"A complaint cannot go from {canonical_status(current)} to {target}")
+    return target
+
+
+def transition_path(current, target):
+    """
+    States a complaint with status `current` passes through on the way to
+    the state `target`, ending with `target`, e.g. Open -> Resolved gives
+    ['In Progress', 'Resolved']. None if `target` is not ahead of it.
+    """
+    source = canonical_status(current)
+    if can_transition(current, target):
+        return [] if source == target else [target]
+    paths = {source: []}
+    pending = [source]
+    for state in pending:
+        for following in sorted(TRANSITIONS[state]):
+            if following not in paths:
+                paths[following] = paths[state] + [following]
+                pending.append(following)
+    return paths.get(target)
+
+
+def record_transitions(events, event_file=LIFECYCLE_EVENT_FILE):
+    """
+    Append state entries [(complaint_id, state, category, technician_id)]
+    all stamped with the current time
+    """
+    at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    lines = [json.dumps({'complaint_id': str(complaint_id), 'state': state, 'at': at,
+                         'category': str(category or ''), 'technician': str(technician or '')})
+             for complaint_id, state, category, technician in events]
+    if not lines:
+        return
+    try:
+        with event_lock:
+            # Cross-process lock, so no line lands in a file being compacted
+            f = open_locked(event_file)
+            try:
+                f.write('\n'.join(lines) + '\n')
+            finally:
+                f.close()
+    except Exception as e:
+        # The status is already written; only the metrics miss this entry
+        print(f"Error writing lifecycle events: {e}")
+
+
+def record_transition(complaint_id, state, category='', technician=''):
+    record_transitions([(complaint_id, state, category, technician)])
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+class LifecycleTracker:
+    """
+    Running time-in-state aggregates per category and technician
+
+    Each complaint's current state and entry time are kept, alongside
+    counters per (dimension, key, state): how many complaints are in the
+    state now plus the sum of their entry times (so the average backlog age
+    is one subtraction), and how many left the state and the total time
+    they spent in it. Reports read the counters and never scan the table.
+    Complaints with no recorded events are seeded from the unified view,
+    entering their current state at submission time.
+
+    compact_events() folds the event file into a checkpoint of these
+    counters and starts the file again, so a restart loads the checkpoint
+    and only reads the events written since.
+    """
+
+    def __init__(self, event_file=LIFECYCLE_EVENT_FILE, state_file=LIFECYCLE_STATE_FILE):
+        self.event_file = event_file
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.current = {}
+        self.members = {}
+        self.completed = {}
+        # (state, 'YYYY-MM-DD') -> complaints that entered the state that day
+        self.entered = {}
+        # Compactions folded into the counters, and the event file they continue into
+        self.epoch = 0
+        self.events_inode = None
+        self.events_read = 0
+        self.skip_events = False
+        self.synced_rows = 0
+        self.synced_generation = None
+
+    def load_checkpoint(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'rb') as f:
+                    state = pickle.load(f)
+                self.epoch = state['epoch']
+                self.current = state['current']
+                self.members = state['members']
+                self.completed = state['completed']
+                self.entered = state['entered']
+            except Exception as e:
+                print(f"Error loading lifecycle checkpoint, reading events only: {e}")
+        # A file without an epoch header predates the first compaction
+        self.skip_events = self.epoch != 0
+
+    def save_checkpoint(self):
+        state = {'epoch': self.epoch, 'current': self.current, 'members': self.members,
+                 'completed': self.completed, 'entered': self.entered}
+        temp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.state_file)
+
+    def keys(self, category, technician):
+        return [('category', category or 'Uncategorised'), ('technician', technician or UNASSIGNED)]
+
+    def count_member(self, key, state, entered_ts, sign):
+        counter = self.members.setdefault(key + (state,), [0, 0.0])
+        counter[0] += sign
+        counter[1] += sign * entered_ts
+
+    def enter(self, complaint_id, state, at, category, technician, seeded=False):
+        previous = self.current.get(complaint_id)
+        entered_at = at
+        if previous is not None:
+            old_state, old_entered, old_category, old_technician = previous
+            for key in self.keys(old_category, old_technician):
+                self.count_member(key, old_state, old_entered.timestamp(), -1)
+            if old_state == state:
+                # A reassignment or note; the time in the state carries on
+                entered_at = old_entered
+            else:
+                spent = max(0.0, (at - old_entered).total_seconds())
+                for key in self.keys(old_category, old_technician):
+                    counter = self.completed.setdefault(key + (old_state,), [0, 0.0])
+                    counter[0] += 1
+                    counter[1] += spent
+        if not seeded and (previous is None or previous[0] != state):
+            day = (state, at.strftime('%Y-%m-%d'))
+            self.entered[day] = self.entered.get(day, 0) + 1
+
+        self.current[complaint_id] = (state, entered_at, category, technician)
+        for key in self.keys(category, technician):
+            self.count_member(key, state, entered_at.timestamp(), 1)
+
+    def apply_events(self, f):
+        """Apply the complete lines of an open event file from events_read on; returns the events read"""
+        count = 0
+        f.seek(self.events_read)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            self.events_read += len(line)
+            event = json.loads(line)
+            if 'epoch' in event:
+                # Header written by compaction; if the checkpoint is from a
+                # later compaction these events are already counted in it
+                self.skip_events = event['epoch'] != self.epoch
+                continue
+            count += 1
+            if self.skip_events:
+                continue
+            at = parse_time(event['at'])
+            if at and event['state'] in TRANSITIONS:
+                self.enter(event['complaint_id'], event['state'], at,
+                           event['category'], event['technician'])
+        return count
+
+    def read_events(self):
+        while os.path.exists(self.event_file):
+            with open(self.event_file, 'rb') as f:
+                if fcntl:
+                    # Shared with other readers, excluded while compaction swaps the files
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    if os.fstat(f.fileno()).st_ino != os.stat(self.event_file).st_ino:
+                        # Compacted while we waited; open the new file
+                        continue
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self.events_inode:
+                    # First read, or compacted since the last one: start from the checkpoint
+                    self.clear()
+                    self.load_checkpoint()
+                    self.events_inode = inode
+                self.apply_events(f)
+                return
+
+    def sync(self, view=unified_view):
+        """Apply new lifecycle events, then seed complaints that have none"""
+        table = view.refresh()
+        with self.lock:
+            self.read_events()
+            if self.synced_generation != view.generation:
+                self.synced_rows = 0
+                self.synced_generation = view.generation
+            new_rows = table.iloc[self.synced_rows:]
+            for complaint_id, status, submitted, category, technician in zip(
+                    new_rows['complaint_id'], new_rows['status'], new_rows['submission_date'],
+                    new_rows['category'], new_rows['assigned_to']):
+                if not complaint_id or complaint_id in self.current:
+                    continue
+                state = canonical_status(status)
+                submitted_at = parse_time(submitted)
+                if state and submitted_at:
+                    self.enter(complaint_id, state, submitted_at, category, technician, seeded=True)
+            self.synced_rows = len(table)
+
+    def backlog(self, dimension='category', now=None):
+        """{key: {state: {'count', 'avg_age_hours'}}} for complaints still in each state"""
+        self.sync()
+        now_ts = (now or datetime.now()).timestamp()
+        report = {}
+        with self.lock:
+            for (kind, key, state), (count, entered_sum) in self.members.items():
+                if kind != dimension or count <= 0:
+                    continue
+                report.setdefault(key, {})[state] = {
+                    'count': count,
+                    'avg_age_hours': round((now_ts - entered_sum / count) / 3600, 2),
+                }
+        return report
+
+    def time_in_state(self, dimension='category'):
+        """{key: {state: {'exits', 'avg_hours'}}} for time spent before leaving a state"""
+        self.sync()
+        report = {}
+        with self.lock:
+            for (kind, key, state), (exits, total) in self.completed.items():
+                if kind == dimension and exits:
+                    report.setdefault(key, {})[state] = {
+                        'exits': exits,
+                        'avg_hours': round(total / exits / 3600, 2),
+                    }
+        return report
+
+    def throughput(self, state='Resolved'):
+        """{'YYYY-MM-DD': complaints that entered `state` that day}"""
+        self.sync()
+        with self.lock:
+            return {day: count for (entered_state, day), count in sorted(self.entered.items())
+                    if entered_state == state}
+
+
+def compact_events(event_file=LIFECYCLE_EVENT_FILE, state_file=LIFECYCLE_STATE_FILE):
+    """
+    Fold the event file into the checkpoint and start an empty one
+    Without this every worker start re-reads every transition ever made.
+    Returns the number of events folded.
+    """
+    if not os.path.exists(event_file):
+        return 0
+    with event_lock:
+        f = open_locked(event_file)
+        try:
+            tracker = LifecycleTracker(event_file, state_file)
+            tracker.load_checkpoint()
+            with open(event_file, 'rb') as source:
+                folded = tracker.apply_events(source)
+            if not folded:
+                return 0
+
+            # The new file names the checkpoint it continues from, so a crash
+            # between the two renames cannot count these events twice
+            tracker.epoch += 1
+            temp_path = f"{event_file}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as target:
+                target.write(json.dumps({'epoch': tracker.epoch}) + '\n')
+            tracker.save_checkpoint()
+            os.replace(temp_path, event_file)
+            return folded
+        finally:
+            f.close()
+
+
+lifecycle_tracker = LifecycleTracker()
@@ -0,0 +1,401 @@
+# complaint_merge.py - Incremental merge of web and voice complaints into one table
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from change_log import CHANGE_LOG_FILE, SEQ_PREFIX, line_sequence
+from metrics import count_cache, storage_timer
+
+
+UNIFIED_SNAPSHOT_FILE = 'data/unified_complaints.pkl'
+MERGE_STATE_FILE = 'data/merge_state.json'
+# In-place updates kept for readers that follow the view; older ones are trimmed
+MAX_UPDATE_IDS = 50000
+# The snapshot is rewritten at most this often; anything newer is rebuilt
+# from the source workbooks and change log on the next load
+SNAPSHOT_INTERVAL_SECONDS = 30
+
+UNIFIED_COLUMNS = [
+    'complaint_id', 'source', 'user_id', 'customer_name', 'phone_number',
+    'category', 'description', 'location', 'submission_date', 'status',
+    'priority', 'assigned_to', 'technician_name', 'attachment_path',
+    'resolution_notes', 'resolution_date'
+]
+
+# Source workbook -> unified column names
+SOURCES = {
+    'web': {
+        'file': 'data/complaints.xlsx',
+        'entity': 'complaint',
+        'columns': {
+            'complaint_id': 'complaint_id',
+            'user_id': 'user_id',
+            'category': 'category',
+            'description': 'description',
+            'location': 'location',
+            'submission_date': 'submission_date',
+            'status': 'status',
+            'assigned_to': 'assigned_to',
+            'technician_name': 'technician_name',
+            'attachment_path': 'attachment_path',
+            'resolution_notes': 'resolution_notes',
+            'resolution_date': 'resolution_date',
+        },
+    },
+    'voice': {
+        'file': 'data/voiceComplaint.xlsx',
+        'entity': 'voice_complaint',
+        'columns': {
+            'complaint_id': 'complaint_id',
+            'customer_name': 'customer_name',
+            'phone_number': 'phone_number',
+            'address': 'location',
+            'complaint_type': 'category',
+            'description': 'description',
+            'timestamp': 'submission_date',
+            'priority': 'priority',
+            'status': 'status',
+            # Added to the workbook when a voice complaint is assigned or resolved
+            'assigned_to': 'assigned_to',
+            'technician_name': 'technician_name',
+            'resolution_notes': 'resolution_notes',
+            'resolution_date': 'resolution_date',
+        },
+    },
+}
+
+
+def file_version(file_path):
+    """(mtime_ns, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(file_path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+def read_rows_after(file_path, rows_done):
+    """
+    Read the data rows of the first sheet that come after the first
+    `rows_done` rows. Returns (new_rows_df, total_data_rows).
+    """
+    with storage_timer('read_rows', file_path):
+        return read_sheet_rows_after(file_path, rows_done)
+
+
+def read_sheet_rows_after(file_path, rows_done):
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # The sheet's recorded dimension gives the row count without reading
+        # the rows; an in-place edit leaves it where the watermark is
+        if rows_done and sheet.max_row == rows_done + 1:
+            return pd.DataFrame(), rows_done
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame(), 0
+
+        new_rows = []
+        total = 0
+        for row in rows:
+            total += 1
+            if total > rows_done:
+                new_rows.append(row)
+        return pd.DataFrame(new_rows, columns=list(header)), total
+    finally:
+        workbook.close()
+
+
+def map_to_unified(rows_df, source):
+    """Rename a source's columns to the unified schema"""
+    mapping = SOURCES[source]['columns']
+    mapped = rows_df[[col for col in mapping if col in rows_df.columns]].rename(columns=mapping)
+    mapped = mapped.reindex(columns=UNIFIED_COLUMNS)
+    mapped['source'] = source
+
+    mapped['complaint_id'] = mapped['complaint_id'].fillna('').astype(str).str.strip()
+    # Voice timestamps are ISO strings; store every date the way the web form does
+    parsed = pd.to_datetime(mapped['submission_date'], errors='coerce')
+    mapped['submission_date'] = parsed.dt.strftime('%Y-%m-%d %H:%M:%S').fillna(
+        mapped['submission_date'].astype(str))
+    return mapped.fillna('').astype(str)
+
+
+class UnifiedComplaintView:
+    """
+    Web and voice complaints in one table, kept current incrementally
+    Each source has a watermark (rows already merged and the file version
+    seen then); a refresh only reads rows added after the watermark. Edits
+    to existing rows come from the change log, which every writer appends
+    to: updates are applied to the merged rows and published as updates,
+    while deletes and restores merge that source again from scratch.
+    """
+
+    def __init__(self, snapshot_file=UNIFIED_SNAPSHOT_FILE, state_file=MERGE_STATE_FILE,
+                 log_file=CHANGE_LOG_FILE):
+        self.snapshot_file = snapshot_file
+        self.state_file = state_file
+        self.log_file = log_file
+        # Re-entrant so versioned_table() can refresh while holding it
+        self.lock = threading.RLock()
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.watermarks = {}
+        # How far into the change log the table is: last seq applied, and the
+        # byte offset after it in the file with that inode
+        self.log_position = {'seq': 0, 'offset': 0, 'inode': None}
+        # complaint_id -> row position in the table
+        self.positions = {}
+        # Readers that follow the table incrementally (e.g. the search index)
+        # track rows appended since they last looked, plus these two:
+        # `generation` changes whenever existing rows are dropped or reordered,
+        # `updated_ids` lists the most recent complaints changed in place, in
+        # order; update number n is updated_ids[n - updates_base]
+        self.generation = 0
+        self.updated_ids = []
+        self.updates_base = 0
+        self.dirty = False
+        self.saved_at = 0.0
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        if not (os.path.exists(self.snapshot_file) and os.path.exists(self.state_file)):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.table = pd.read_pickle(self.snapshot_file)
+            self.watermarks = state['sources']
+            self.log_position = state['change_log']
+        except Exception as e:
+            print(f"Error loading unified complaints, rebuilding: {e}")
+            self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+            self.watermarks = {}
+            self.log_position = {'seq': 0, 'offset': 0, 'inode': None}
+        self.positions = {complaint_id: i for i, complaint_id in enumerate(self.table['complaint_id'])}
+
+    def save_snapshot(self):
+        # Written under temporary names and renamed, as every worker saves here
+        temp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with storage_timer('to_pickle', self.snapshot_file):
+            self.table.to_pickle(self.snapshot_file + temp_suffix)
+        with open(self.state_file + temp_suffix, 'w') as f:
+            json.dump({'sources': self.watermarks, 'change_log': self.log_position}, f, indent=2)
+        os.replace(self.snapshot_file + temp_suffix, self.snapshot_file)
+        os.replace(self.state_file + temp_suffix, self.state_file)
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def save_snapshot_if_due(self):
+        """Save the snapshot if it changed and the last save is old enough; call with the lock held"""
+        if self.dirty and time.monotonic() - self.saved_at >= SNAPSHOT_INTERVAL_SECONDS:
+            self.save_snapshot()
+
+    @property
+    def update_seq(self):
+        return self.updates_base + len(self.updated_ids)
+
+    def updates_since(self, seq):
+        """
+        (complaint IDs updated in place after update number `seq`, current
+        update number). The IDs are None if they were already trimmed; the
+        caller should then rebuild from the table.
+        """
+        with self.lock:
+            if seq < self.updates_base:
+                return None, self.update_seq
+            return self.updated_ids[seq - self.updates_base:], self.update_seq
+
+    def publish_updates(self, complaint_ids):
+        """Record in-place changes; call with the lock held"""
+        self.updated_ids.extend(complaint_ids)
+        if len(self.updated_ids) > MAX_UPDATE_IDS:
+            # Keep the newer half; readers further behind rebuild
+            dropped = len(self.updated_ids) - MAX_UPDATE_IDS // 2
+            del self.updated_ids[:dropped]
+            self.updates_base += dropped
+
+    def append_rows(self, source, rows_df):
+        if rows_df.empty:
+            return
+        mapped = map_to_unified(rows_df, source)
+        start = len(self.table)
+        self.table = pd.concat([self.table, mapped], ignore_index=True)
+        for i, complaint_id in enumerate(mapped['complaint_id'], start):
+            self.positions[complaint_id] = i
+
+    def replace_source(self, source, rows_df):
+        """Drop the table's rows for `source` and merge all of `rows_df` instead"""
+        kept = self.table[self.table['source'] != source]
+        if not rows_df.empty:
+            kept = pd.concat([kept, map_to_unified(rows_df, source)])
+        self.table = kept.reset_index(drop=True)
+        self.positions = {complaint_id: i for i, complaint_id in enumerate(self.table['complaint_id'])}
+        self.generation += 1
+
+    def set_values(self, complaint_id, changes):
+        """Write unified-column changes to a merged row; True if anything differed"""
+        i = self.positions.get(str(complaint_id))
+        if i is None:
+            return False
+        differs = False
+        for column, value in changes.items():
+            if column not in UNIFIED_COLUMNS:
+                continue
+            value = '' if value is None or pd.isna(value) else str(value)
+            if self.table.at[i, column] != value:
+                self.table.at[i, column] = value
+                differs = True
+        return differs
+
+    def read_change_log(self):
+        """New events since log_position, as (seq, line) pairs"""
+        try:
+            stat = os.stat(self.log_file)
+        except OSError:
+            return []
+        position = self.log_position
+        offset = position['offset']
+        if position['inode'] != stat.st_ino or stat.st_size < offset:
+            # Compacted (replaced) since last time; skip what was applied by seq
+            offset = 0
+        if stat.st_size == offset:
+            return []
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+        # A writer may be half way through a line; leave it for next time
+        end = data.rfind(b'\n') + 1
+        self.log_position = dict(position, offset=offset + end, inode=stat.st_ino)
+        events = []
+        for line in data[:end].decode('utf-8').splitlines():
+            if line.startswith(SEQ_PREFIX) and line_sequence(line) > position['seq']:
+                events.append((line_sequence(line), line))
+        return events
+
+    def apply_change_log(self):
+        """Apply logged edits to merged rows; returns True if the log moved on"""
+        previous = dict(self.log_position)
+        events = self.read_change_log()
+        sources = {config['entity']: source for source, config in SOURCES.items()}
+        updated = []
+        for seq, line in events:
+            event = json.loads(line)
+            self.log_position['seq'] = seq
+            source = sources.get(event['entity'])
+            if source is None or event['op'] == 'insert':
+                # New rows are read from the workbook past the watermark
+                continue
+            if event['op'] == 'update':
+                mapping = SOURCES[source]['columns']
+                changes = {mapping[column]: value for column, value in event['data'].items()
+                           if column in mapping and column != 'complaint_id'}
+                if self.set_values(event['key'], changes):
+                    updated.append(event['key'])
+            else:
+                # Deleted rows or a restored file: merge the source again
+                self.watermarks[source] = {'rows': 0, 'version': None}
+        if updated:
+            self.publish_updates(updated)
+        return self.log_position != previous
+
+    def refresh(self):
+        """Merge logged edits and the rows added to any source since its watermark"""
+        with self.lock:
+            changed = self.apply_change_log()
+            for source, config in SOURCES.items():
+                version = file_version(config['file'])
+                watermark = self.watermarks.get(source, {'rows': 0, 'version': None})
+                if version is None or version == watermark['version']:
+                    continue
+
+                new_rows, total = read_rows_after(config['file'], watermark['rows'])
+                if watermark['rows'] == 0 or total < watermark['rows']:
+                    # First merge, or rows were removed; merge the source from scratch
+                    if total < watermark['rows']:
+                        new_rows, total = read_rows_after(config['file'], 0)
+                    self.replace_source(source, new_rows)
+                else:
+                    self.append_rows(source, new_rows)
+                self.watermarks[source] = {'rows': total, 'version': version}
+                changed = True
+
+            count_cache('unified_view', not changed)
+            if changed:
+                self.dirty = True
+            self.save_snapshot_if_due()
+            return self.table
+
+    def versioned_table(self):
+        """
+        A copy of the table and {source: file version} it was merged from,
+        taken together so the versions describe exactly these rows
+        """
+        with self.lock:
+            table = self.refresh()
+            versions = {source: self.watermarks.get(source, {}).get('version') for source in SOURCES}
+            return table.copy(), versions
+
+    def source_of(self, complaint_id):
+        """'web' or 'voice' for a merged complaint, or None if it is unknown"""
+        with self.lock:
+            table = self.refresh()
+            i = self.positions.get(str(complaint_id))
+            return table.at[i, 'source'] if i is not None else None
+
+    def update(self, complaint_id, changes):
+        """Apply an in-place change (status, assignment, ...) made to a source row"""
+        return self.update_many([complaint_id], changes) > 0
+
+    def update_many(self, complaint_ids, changes):
+        """Apply the same change to several complaints; returns how many are merged"""
+        with self.lock:
+            complaint_ids = [str(complaint_id) for complaint_id in complaint_ids]
+            if any(complaint_id not in self.positions for complaint_id in complaint_ids):
+                # A just-submitted complaint may not be merged yet
+                self.refresh()
+            known = [complaint_id for complaint_id in complaint_ids if complaint_id in self.positions]
+            if not known:
+                return 0
+            for complaint_id in known:
+                self.set_values(complaint_id, changes)
+            self.publish_updates(known)
+            self.dirty = True
+            self.save_snapshot_if_due()
+            return len(known)
+
+    def query(self, status=None, category=None, source=None, user_id=None):
+        """Filter the unified table"""
+        table = self.refresh()
+        mask = pd.Series(True, index=table.index)
+        if status:
+            mask &= table['status'] == status
+        if category:
+            mask &= table['category'] == category
+        if source:
+            mask &= table['source'] == source
+        if user_id:
+            mask &= table['user_id'] == str(user_id)
+        return table[mask].copy()
+
+
+unified_view = UnifiedComplaintView()
+
+
+def load_unified_complaints():
+    """All web and voice complaints in the unified schema"""
+    return unified_view.refresh().copy()
+
+
+def update_unified_complaint(complaint_id, **changes):
+    """Mirror a change made to a complaint in its source workbook"""
+    return unified_view.update(complaint_id, changes)
+
+
+def update_unified_complaints(complaint_ids, **changes):
+    """Mirror a change made to several complaints at once"""
+    return unified_view.update_many(complaint_ids, changes)
@@ -0,0 +1,237 @@
+# complaint_search.py - BM25 full-text search over complaints
+import bisect
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from complaint_merge import unified_view
+
+
+# Text columns of the unified table that are indexed; voice complaints
+# keep the caller's transcript in 'description'
+SEARCH_FIELDS = ['description', 'location', 'resolution_notes']
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have',
+    'i', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'our', 'the', 'there', 'this',
+    'to', 'was', 'we', 'with',
+}
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Most frequent vocabulary terms a prefix expands to
+MAX_PREFIX_TERMS = 50
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class ComplaintSearchIndex:
+    """
+    Inverted index over complaint text, ranked with BM25
+
+    Postings are dicts (term -> {doc: term frequency}) so documents can be
+    added and replaced one at a time; each term's postings are turned into
+    numpy arrays the first time a query needs them, and those arrays are
+    dropped when the term's postings change. Per-document lengths and
+    filter fields live in numpy arrays that grow by doubling.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.key_to_doc = {}
+        # complaint_id -> row position in the unified table
+        self.rows = {}
+        self.doc_terms = []
+        self.postings = {}
+        self.compiled = {}
+        self.vocabulary = []
+        self.doc_len = np.zeros(1024, dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.status_codes = np.zeros(1024, dtype=np.int32)
+        self.category_codes = np.zeros(1024, dtype=np.int32)
+        self.codes = {'status': {}, 'category': {}}
+        self.total_len = 0
+        self.live_docs = 0
+        # Position in the unified view this index has caught up to
+        self.synced_rows = 0
+        self.synced_updates = 0
+        self.synced_generation = None
+
+    def code(self, field, value):
+        """Small integer for a status/category value, so filters are array compares"""
+        return self.codes[field].setdefault(str(value).strip().lower(), len(self.codes[field]) + 1)
+
+    def grow(self, size):
+        if size <= len(self.doc_len):
+            return
+        capacity = max(size, 2 * len(self.doc_len))
+        for name in ('doc_len', 'alive', 'status_codes', 'category_codes'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def remove_terms(self, doc):
+        for term in self.doc_terms[doc]:
+            postings = self.postings[term]
+            del postings[doc]
+            self.compiled.pop(term, None)
+            if not postings:
+                del self.postings[term]
+                index = bisect.bisect_left(self.vocabulary, term)
+                del self.vocabulary[index]
+
+    def add(self, key, text, status='', category=''):
+        """Index a complaint, replacing any earlier version with the same key"""
+        doc = self.key_to_doc.get(key)
+        if doc is None:
+            doc = len(self.keys)
+            self.keys.append(key)
+            self.doc_terms.append({})
+            self.key_to_doc[key] = doc
+            self.grow(doc + 1)
+        elif self.alive[doc]:
+            self.remove_terms(doc)
+            self.total_len -= int(self.doc_len[doc])
+            self.live_docs -= 1
+
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                bisect.insort(self.vocabulary, term)
+            postings[doc] = tf
+            self.compiled.pop(term, None)
+
+        length = sum(terms.values())
+        self.doc_terms[doc] = terms
+        self.doc_len[doc] = length
+        self.alive[doc] = True
+        self.status_codes[doc] = self.code('status', status)
+        self.category_codes[doc] = self.code('category', category)
+        self.total_len += length
+        self.live_docs += 1
+
+    def term_arrays(self, term):
+        arrays = self.compiled.get(term)
+        if arrays is None:
+            postings = self.postings[term]
+            arrays = (np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                      np.fromiter(postings.values(), dtype=np.float32, count=len(postings)))
+            self.compiled[term] = arrays
+        return arrays
+
+    def expand(self, token, prefix):
+        """The token itself, or for a prefix the most common terms starting with it"""
+        if not prefix:
+            return [token] if token in self.postings else []
+        start = bisect.bisect_left(self.vocabulary, token)
+        end = bisect.bisect_left(self.vocabulary, token + '\uffff')
+        matches = self.vocabulary[start:end]
+        if len(matches) > MAX_PREFIX_TERMS:
+            matches = sorted(matches, key=lambda term: len(self.postings[term]), reverse=True)[:MAX_PREFIX_TERMS]
+        return matches
+
+    def search(self, query, status=None, category=None, limit=20, prefix=True):
+        """
+        Return [(key, score)] best first. The last query word, and any word
+        ending in '*', also matches longer words that start with it.
+        """
+        words = []
+        pieces = query.lower().split()
+        for i, piece in enumerate(pieces):
+            tokens = TOKEN_PATTERN.findall(piece)
+            for j, token in enumerate(tokens):
+                last = j == len(tokens) - 1
+                words.append((token, prefix and last and (i == len(pieces) - 1 or piece.endswith('*'))))
+        with self.lock:
+            n_docs = len(self.keys)
+            if not n_docs or not self.live_docs:
+                return []
+            avg_len = self.total_len / self.live_docs
+            scores = np.zeros(n_docs, dtype=np.float32)
+            matched = False
+            for word, is_prefix in words:
+                if word in STOPWORDS and not is_prefix:
+                    continue
+                for term in self.expand(word, is_prefix):
+                    docs, tf = self.term_arrays(term)
+                    idf = math.log(1 + (self.live_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    norm = K1 * (1 - B + B * self.doc_len[docs] / avg_len)
+                    scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+                    matched = True
+            if not matched:
+                return []
+
+            mask = self.alive[:n_docs] & (scores > 0)
+            if status:
+                mask &= self.status_codes[:n_docs] == self.codes['status'].get(status.strip().lower(), -1)
+            if category:
+                mask &= self.category_codes[:n_docs] == self.codes['category'].get(category.strip().lower(), -1)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) > limit:
+                top = np.argpartition(-scores[candidates], limit)[:limit]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(self.keys[doc], float(scores[doc])) for doc in candidates]
+
+    def index_rows(self, table, positions):
+        rows_df = table.iloc[positions]
+        text = rows_df[SEARCH_FIELDS[0]].astype(str)
+        for field in SEARCH_FIELDS[1:]:
+            text = text + ' ' + rows_df[field].astype(str)
+        for position, key, doc_text, status, category in zip(positions, rows_df['complaint_id'], text,
+                                                             rows_df['status'], rows_df['category']):
+            if key:
+                self.add(key, doc_text, status, category)
+                self.rows[key] = position
+
+    def sync(self, view=unified_view):
+        """Catch up with complaints added to or changed in the unified view"""
+        table = view.refresh()
+        with self.lock:
+            updated, update_seq = view.updates_since(self.synced_updates)
+            if self.synced_generation != view.generation or updated is None:
+                # Rebuilt, or too far behind the view's updates: start again
+                self.clear()
+                self.synced_generation = view.generation
+                updated = []
+            if len(table) > self.synced_rows:
+                self.index_rows(table, range(self.synced_rows, len(table)))
+                self.synced_rows = len(table)
+            if updated:
+                self.index_rows(table, sorted({self.rows[key] for key in updated if key in self.rows}))
+            self.synced_updates = update_seq
+        return table
+
+
+search_index = ComplaintSearchIndex()
+
+
+def search_complaints(query, status=None, category=None, limit=20):
+    """Ranked complaint records matching a text query"""
+    started = time.perf_counter()
+    table = search_index.sync()
+    hits = search_index.search(query, status=status, category=category, limit=limit)
+    records = []
+    if hits:
+        rows = table.iloc[[search_index.rows[key] for key, _ in hits]].to_dict('records')
+        for record, (_, score) in zip(rows, hits):
+            record['score'] = round(score, 4)
+            records.append(record)
+    return {
+        'query': query,
+        'results': records,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
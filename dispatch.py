@@ -0,0 +1,205 @@
+# dispatch.py - Workload-aware automatic assignment of complaints to technicians
+import heapq
+import os
+import threading
+
+import pandas as pd
+
+from complaint_merge import file_version, unified_view
+from metrics import storage_timer
+from technician_queues import normalise_status
+
+
+TECHNICIAN_FILE = 'data/technician.xlsx'
+# Assign new web and voice complaints as they are saved
+AUTO_DISPATCH = os.getenv("AUTO_DISPATCH", "0") == "1"
+# Voice complaints are assigned through the same workbook helpers and show
+# up in technician queues, so both sources are dispatched and counted
+DISPATCH_SOURCES = {'web', 'voice'}
+PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+# Web complaints have no priority column; derive it from the category
+CATEGORY_PRIORITY = {
+    'power outage': 'high',
+    'voltage issue': 'high',
+    'voltage fluctuation': 'high',
+    'equipment fault': 'high',
+    'connection problem': 'medium',
+    'meter problem': 'medium',
+    'street light': 'medium',
+    'new connection': 'low',
+    'billing issue': 'low',
+}
+
+
+def complaint_priority(priority, category):
+    priority = str(priority or '').strip().lower()
+    if priority not in PRIORITY_RANK:
+        priority = CATEGORY_PRIORITY.get(str(category).strip().lower(), 'medium')
+    return PRIORITY_RANK[priority]
+
+
+class DispatchEngine:
+    """
+    Pairs unassigned complaints with the least loaded technicians
+
+    Unassigned open complaints sit in a heap ordered by (priority, age);
+    technicians sit in a min-heap keyed by their open workload. Both heaps
+    use lazy deletion: an entry that no longer matches the current state
+    (complaint assigned elsewhere, load changed, technician removed) is
+    discarded when it reaches the top, so every change is O(log n).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.queue = []
+        self.unassigned = {}
+        self.assigned = {}
+        self.loads = {}
+        self.names = {}
+        self.technician_heap = []
+        # complaint_id -> row position in the unified table
+        self.rows = {}
+        self.technician_version = None
+        self.synced_rows = 0
+        self.synced_updates = 0
+        self.synced_generation = None
+
+    def set_load(self, technician_id, load):
+        self.loads[technician_id] = load
+        if technician_id in self.names:
+            heapq.heappush(self.technician_heap, (load, technician_id))
+
+    def track(self, complaint_id, status, assigned_to, priority, category, submitted):
+        """Bring one complaint's queue/workload entries up to date"""
+        previous = self.assigned.pop(complaint_id, None)
+        if previous is not None:
+            self.set_load(previous, self.loads.get(previous, 1) - 1)
+        self.unassigned.pop(complaint_id, None)
+
+        if normalise_status(status) == 'resolved':
+            return
+        assigned_to = str(assigned_to or '').strip()
+        if assigned_to:
+            self.assigned[complaint_id] = assigned_to
+            self.set_load(assigned_to, self.loads.get(assigned_to, 0) + 1)
+        else:
+            entry = (complaint_priority(priority, category), str(submitted), complaint_id)
+            self.unassigned[complaint_id] = entry
+            heapq.heappush(self.queue, entry)
+
+    def load_technicians(self, file_path=TECHNICIAN_FILE):
+        version = file_version(file_path)
+        if version == self.technician_version:
+            return
+        self.technician_version = version
+        technicians_df = pd.DataFrame()
+        if os.path.exists(file_path):
+            with storage_timer('read_excel', file_path):
+                technicians_df = pd.read_excel(file_path)
+        self.names = {}
+        if not technicians_df.empty:
+            self.names = dict(zip(technicians_df['technician_id'].astype(str).str.strip(),
+                                  technicians_df['fullName'].astype(str)))
+        for technician_id in self.names:
+            self.set_load(technician_id, self.loads.get(technician_id, 0))
+
+    def track_rows(self, table, positions):
+        rows_df = table.iloc[positions]
+        for position, complaint_id, source, status, assigned_to, priority, category, submitted in zip(
+                positions, rows_df['complaint_id'], rows_df['source'], rows_df['status'],
+                rows_df['assigned_to'], rows_df['priority'], rows_df['category'],
+                rows_df['submission_date']):
+            if complaint_id and source in DISPATCH_SOURCES:
+                self.rows[complaint_id] = position
+                self.track(complaint_id, status, assigned_to, priority, category, submitted)
+
+    def sync(self, view=unified_view):
+        """Catch up with complaints added or changed since the last call"""
+        table = view.refresh()
+        updated, update_seq = view.updates_since(self.synced_updates)
+        if self.synced_generation != view.generation or updated is None:
+            # Rebuilt, or too far behind the view's updates: start again
+            self.clear()
+            self.synced_generation = view.generation
+            updated = []
+        self.load_technicians()
+        if len(table) > self.synced_rows:
+            self.track_rows(table, range(self.synced_rows, len(table)))
+            self.synced_rows = len(table)
+        if updated:
+            self.track_rows(table, sorted({self.rows[key] for key in updated if key in self.rows}))
+        self.synced_updates = update_seq
+
+    def next_technician(self):
+        while self.technician_heap:
+            load, technician_id = self.technician_heap[0]
+            if technician_id in self.names and self.loads.get(technician_id) == load:
+                return technician_id
+            heapq.heappop(self.technician_heap)
+        return None
+
+    def next_complaint(self):
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            if self.unassigned.get(entry[2]) == entry:
+                return entry
+        return None
+
+    def assign(self, complaint_id, technician_id):
+        self.unassigned.pop(complaint_id, None)
+        self.assigned[complaint_id] = technician_id
+        self.set_load(technician_id, self.loads[technician_id] + 1)
+        return (complaint_id, technician_id, self.names[technician_id])
+
+    def assign_new(self, complaint_id):
+        """
+        Pick a technician for a complaint that is about to be saved, so the
+        assignment goes into the same write as the complaint itself.
+        Returns (complaint_id, technician_id, technician_name) or None.
+        """
+        with self.lock:
+            self.sync()
+            technician_id = self.next_technician()
+            if technician_id is None:
+                return None
+            return self.assign(complaint_id, technician_id)
+
+    def plan(self, limit=None):
+        """
+        Choose technicians for up to `limit` waiting complaints (all by default)
+        Returns [(complaint_id, technician_id, technician_name)]; the caller
+        writes them and calls reset() if that fails.
+        """
+        with self.lock:
+            self.sync()
+            assignments = []
+            while limit is None or len(assignments) < limit:
+                technician_id = self.next_technician()
+                if technician_id is None:
+                    break
+                entry = self.next_complaint()
+                if entry is None:
+                    break
+                assignments.append(self.assign(entry[2], technician_id))
+            return assignments
+
+    def reset(self):
+        """Forget everything; the next call rebuilds from the stored data"""
+        with self.lock:
+            self.clear()
+
+    def workload(self):
+        """Open complaints per technician, plus the number still waiting"""
+        with self.lock:
+            self.sync()
+            return {
+                'technicians': {technician_id: self.loads.get(technician_id, 0)
+                                for technician_id in self.names},
+                'waiting': len(self.unassigned),
+            }
+
+
+dispatch_engine = DispatchEngine()
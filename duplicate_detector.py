@@ -0,0 +1,177 @@
+# duplicate_detector.py - Near-duplicate complaint detection with MinHash and LSH
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from complaint_lifecycle import canonical_status, parse_time
+from complaint_merge import unified_view
+
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs with a Jaccard similarity around 0.5 and above
+# share at least one band with high probability
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+# Estimated similarity needed to call two complaints duplicates
+DUPLICATE_THRESHOLD = 0.6
+# Complaints remembered per bucket; very common wording would otherwise
+# make a bucket, and so every lookup in it, grow without bound
+MAX_BUCKET_SIZE = 50
+# Only complaints submitted this recently can be duplicates; a fault that
+# comes back later is a new complaint
+DUPLICATE_WINDOW = timedelta(days=7)
+# Finished complaints are dropped from the index for the same reason
+FINISHED_STATES = ('Resolved', 'Closed')
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+rng = np.random.RandomState(20240601)
+HASH_A = rng.randint(1, MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+HASH_B = rng.randint(0, MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(description, location):
+    """Words and word pairs of the description, plus the location words"""
+    words = re.findall(r'[a-z0-9]+', str(description).lower())
+    features = set(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    features.update(f"loc:{word}" for word in re.findall(r'[a-z0-9]+', str(location).lower()))
+    return features
+
+
+def minhash(features):
+    """MinHash signature of a set of strings, or None if it is empty"""
+    if not features:
+        return None
+    hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                         dtype=np.uint64, count=len(features))
+    permuted = (np.outer(hashes, HASH_A) + HASH_B) % MERSENNE_PRIME & MAX_HASH
+    return permuted.min(axis=0)
+
+
+def same_customer(user_a, user_b):
+    """Voice complaints have no user_id, so they can match any customer"""
+    return not user_a or not user_b or user_a == user_b
+
+
+class DuplicateIndex:
+    """
+    LSH index of complaint MinHash signatures
+
+    Adding or looking up a complaint hashes its bands into at most
+    LSH_BANDS buckets, and each bucket holds at most MAX_BUCKET_SIZE
+    complaints, so the work per complaint does not depend on how many
+    complaints are indexed. Only unfinished complaints are indexed: one
+    that is resolved or closed later is removed when the view publishes
+    the update.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.buckets = {}
+        self.signatures = {}
+        self.users = {}
+        self.submitted = {}
+        # Table position of every complaint seen, to re-read updated rows
+        self.rows = {}
+        self.synced_rows = 0
+        self.synced_generation = None
+        self.synced_updates = 0
+
+    def band_keys(self, signature):
+        return [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes())
+                for band in range(LSH_BANDS)]
+
+    def add(self, complaint_id, description, location, user_id='', submitted='', status=''):
+        self.remove(complaint_id)
+        if canonical_status(status) in FINISHED_STATES:
+            return
+        signature = minhash(shingles(description, location))
+        if signature is None:
+            return
+        self.signatures[complaint_id] = signature
+        self.users[complaint_id] = str(user_id or '')
+        self.submitted[complaint_id] = parse_time(submitted)
+        for key in self.band_keys(signature):
+            bucket = self.buckets.setdefault(key, [])
+            bucket.append(complaint_id)
+            if len(bucket) > MAX_BUCKET_SIZE:
+                del bucket[0]
+
+    def remove(self, complaint_id):
+        signature = self.signatures.pop(complaint_id, None)
+        if signature is None:
+            return
+        del self.users[complaint_id]
+        del self.submitted[complaint_id]
+        for key in self.band_keys(signature):
+            bucket = self.buckets.get(key)
+            if bucket and complaint_id in bucket:
+                bucket.remove(complaint_id)
+
+    def candidates(self, description, location, user_id='', threshold=DUPLICATE_THRESHOLD, now=None):
+        """[(complaint_id, estimated_similarity)] best first"""
+        signature = minhash(shingles(description, location))
+        if signature is None:
+            return []
+        user_id = str(user_id or '')
+        since = (now or datetime.now()) - DUPLICATE_WINDOW
+        with self.lock:
+            seen = set()
+            matches = []
+            for key in self.band_keys(signature):
+                for complaint_id in self.buckets.get(key, ()):
+                    if complaint_id in seen:
+                        continue
+                    seen.add(complaint_id)
+                    if not same_customer(user_id, self.users[complaint_id]):
+                        continue
+                    submitted = self.submitted[complaint_id]
+                    if submitted is not None and submitted < since:
+                        continue
+                    similarity = float(np.mean(self.signatures[complaint_id] == signature))
+                    if similarity >= threshold:
+                        matches.append((complaint_id, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def index_rows(self, table, positions):
+        rows = table.iloc[positions]
+        for position, complaint_id, description, location, user_id, submitted, status in zip(
+                positions, rows['complaint_id'], rows['description'], rows['location'],
+                rows['user_id'], rows['submission_date'], rows['status']):
+            if complaint_id:
+                self.rows[complaint_id] = position
+                self.add(complaint_id, description, location, user_id, submitted, status)
+
+    def sync(self, view=unified_view):
+        """Index complaints added to the unified view, and re-index updated ones, since the last call"""
+        table = view.refresh()
+        with self.lock:
+            updated, update_seq = view.updates_since(self.synced_updates)
+            if self.synced_generation != view.generation or updated is None:
+                # Rebuilt, or too far behind the view's updates: start again
+                self.clear()
+                self.synced_generation = view.generation
+                updated = []
+            self.index_rows(table, range(self.synced_rows, len(table)))
+            self.synced_rows = len(table)
+            if updated:
+                # e.g. resolved since it was indexed
+                self.index_rows(table, sorted({self.rows[key] for key in updated if key in self.rows}))
+            self.synced_updates = update_seq
+
+
+duplicate_index = DuplicateIndex()
+
+
+def find_duplicates(description, location, user_id=''):
+    """Existing complaints (web or voice) that are probably the same as this one"""
+    duplicate_index.sync()
+    return duplicate_index.candidates(description, location, user_id)
@@ -2,9 +2,11 @@ from flask import Blueprint, render_template, request, jsonify, current_app
 import pandas as pd
 import os
 import json
+from change_log import ENTITIES, record_change
+from excel_handler import save_workbook, workbook_lock
 
 # Create a blueprint factory function instead of a direct blueprint
-def create_excel_editor_blueprint(name, excel_file, sheet_name):
+def create_excel_editor_blueprint(name, excel_file, sheet_name, entity=None):
     # Create a new blueprint instance with a unique name
     excel_bp = Blueprint(f'excel_editor_{name}', __name__, template_folder='templates')
     
@@ -17,7 +19,12 @@ def create_excel_editor_blueprint(name, excel_file, sheet_name):
 
     # Helper function to write to Excel file
     def write_excel(df):
-        df.to_excel(excel_file, index=False, sheet_name=sheet_name)
+        save_workbook(df, excel_file, sheet_name=sheet_name)
+    
+    # Helper function to add edits to the change log (if this sheet is a logged entity)
+    def log_change(op, row):
+        if entity and ENTITIES[entity]['key'] in row:
+            record_change(entity, op, row)
     
     
     @excel_bp.route('/')
@@ -41,67 +48,75 @@ def create_excel_editor_blueprint(name, excel_file, sheet_name):
     @excel_bp.route('/add', methods=['POST'])
     def add_record():
         try:
-            df = read_excel()
+            with workbook_lock(excel_file):
+                df = read_excel()
             
-            # Get new record data from form
-            new_record = {}
-            for column in df.columns:
-                new_record[column] = request.form.get(column)
+                # Get new record data from form
+                new_record = {}
+                for column in df.columns:
+                    new_record[column] = request.form.get(column)
             
-            # Determine new ID if 'id' is a column
-            if 'id' in df.columns:
-                if df['id'].dtype == 'int64':
-                    new_record['id'] = int(df['id'].max() + 1) if not df.empty else 1
+                # Determine new ID if 'id' is a column
+                if 'id' in df.columns:
+                    if df['id'].dtype == 'int64':
+                        new_record['id'] = int(df['id'].max() + 1) if not df.empty else 1
             
-            # Append new record to dataframe
-            df = pd.concat([df, pd.DataFrame([new_record])], ignore_index=True)
-            write_excel(df)
+                # Append new record to dataframe
+                df = pd.concat([df, pd.DataFrame([new_record])], ignore_index=True)
+                write_excel(df)
+                log_change('insert', new_record)
             
-            return jsonify({"success": True, "message": "Record added successfully"})
+                return jsonify({"success": True, "message": "Record added successfully"})
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
     @excel_bp.route('/update', methods=['POST'])
     def update_record():
         try:
-            df = read_excel()
-            data = json.loads(request.data)
+            with workbook_lock(excel_file):
+                df = read_excel()
+                data = json.loads(request.data)
             
-            # Extract record ID and updated data
-            record_id = data.get('id')
-            updated_data = data.get('data')
+                # Extract record ID and updated data
+                record_id = data.get('id')
+                updated_data = data.get('data')
             
-            # Find the row with matching ID and update it
-            if 'id' in df.columns:
-                idx = df.index[df['id'] == int(record_id)].tolist()
-                if idx:
-                    for key, value in updated_data.items():
-                        df.at[idx[0], key] = value
-                    write_excel(df)
-                    return jsonify({"success": True, "message": "Record updated successfully"})
+                # Find the row with matching ID and update it
+                if 'id' in df.columns:
+                    idx = df.index[df['id'] == int(record_id)].tolist()
+                    if idx:
+                        for key, value in updated_data.items():
+                            df.at[idx[0], key] = value
+                        write_excel(df)
+                        log_change('update', df.loc[idx[0]].to_dict())
+                        return jsonify({"success": True, "message": "Record updated successfully"})
+                    else:
+                        return jsonify({"success": False, "message": "Record not found"})
                 else:
-                    return jsonify({"success": False, "message": "Record not found"})
-            else:
-                return jsonify({"success": False, "message": "ID column not found in Excel file"})
+                    return jsonify({"success": False, "message": "ID column not found in Excel file"})
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
     @excel_bp.route('/delete', methods=['POST'])
     def delete_record():
         try:
-            df = read_excel()
-            data = json.loads(request.data)
+            with workbook_lock(excel_file):
+                df = read_excel()
+                data = json.loads(request.data)
             
-            # Get record ID to delete
-            record_id = data.get('id')
+                # Get record ID to delete
+                record_id = data.get('id')
             
-            # Delete the row with matching ID
-            if 'id' in df.columns:
-                df = df[df['id'] != int(record_id)]
-                write_excel(df)
-                return jsonify({"success": True, "message": "Record deleted successfully"})
-            else:
-                return jsonify({"success": False, "message": "ID column not found in Excel file"})
+                # Delete the row with matching ID
+                if 'id' in df.columns:
+                    deleted = df[df['id'] == int(record_id)]
+                    df = df[df['id'] != int(record_id)]
+                    write_excel(df)
+                    for row in deleted.to_dict('records'):
+                        log_change('delete', row)
+                    return jsonify({"success": True, "message": "Record deleted successfully"})
+                else:
+                    return jsonify({"success": False, "message": "ID column not found in Excel file"})
         except Exception as e:
             return jsonify({"success": False, "message": str(e)})
 
@@ -119,6 +134,7 @@ def register_excel_editors(app, editors):
         bp = create_excel_editor_blueprint(
             editor['name'],
             editor['excel_file'],
-            editor['sheet_name']
+            editor['sheet_name'],
+            editor.get('entity')
         )
         app.register_blueprint(bp, url_prefix=editor['url_prefix'])
\ No newline at end of file
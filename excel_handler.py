@@ -1,173 +1,404 @@
 # excel_handler.py - Excel integration functionality (continued)
 import pandas as pd
 import os
-from datetime import datetime
+from datetime import datetime, date
 import io
-from flask import send_file
+import json
+import math
+import tempfile
+import threading
+import xlsxwriter
+from openpyxl import load_workbook
+from backup_store import create_backup, prune_backups
+from change_log import record_changes, workbook_lock
+from metrics import storage_timer
+
+def save_workbook(df, file_path, **kwargs):
+    """
+    Write a DataFrame over a workbook through a temporary file, so readers
+    that take no lock never open a half-written one
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp.xlsx"
+    try:
+        with storage_timer('to_excel', file_path):
+            df.to_excel(temp_path, index=False, **kwargs)
+            os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Rows sampled when estimating column widths for streamed exports
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 60
+PROGRESS_EVERY_ROWS = 5000
+
+# Bulk import
+IMPORT_BATCH_ROWS = 5000
+COMPLAINT_COLUMNS = [
+    'complaint_id', 'user_id', 'category', 'description',
+    'location', 'submission_date', 'status', 'assigned_to',
+    'attachment_path', 'resolution_notes', 'resolution_date'
+]
+REQUIRED_IMPORT_COLUMNS = [
+    'complaint_id', 'user_id', 'category', 'description',
+    'location', 'submission_date', 'status'
+]
+COMPLAINT_ID_PATTERN = r'^CID\d+$'
+# Registered users get UID0001-style IDs; the seeded admin has a UUID
+USER_ID_PATTERN = r'^(UID\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$'
+# Accepted spellings (lower case, spaces removed) -> stored status
+IMPORT_STATUSES = {
+    'open': 'Open',
+    'inprogress': 'In Progress',
+    'resolved': 'Resolved',
+    'closed': 'Closed',
+}
 
 def generate_report_excel(complaints_df):
     """
     Generate Excel report from complaints data
     Returns a BytesIO object containing the Excel file
     """
-    # Create a BytesIO object to store the Excel file
     output = io.BytesIO()
+    # The workbook itself is built with constant memory; only the finished
+    # file is held here
+    write_report_excel_streaming(complaints_df, output)
+    output.seek(0)
+    return output
+
+def monthly_counts(complaints_df):
+    """Complaints per month, without touching the caller's DataFrame"""
+    submission_dates = pd.DataFrame({
+        'submission_date': pd.to_datetime(complaints_df['submission_date'], errors='coerce')
+    })
+    monthly_data = submission_dates.groupby(pd.Grouper(key='submission_date', freq='ME')).size().reset_index()
+    monthly_data.columns = ['Month', 'Count']
+    monthly_data['Month'] = monthly_data['Month'].dt.strftime('%Y-%m')
+    return monthly_data
+
+def estimate_column_widths(complaints_df, sample_rows=WIDTH_SAMPLE_ROWS):
+    """
+    Estimate column widths from an evenly spaced sample of rows
+    instead of converting the whole table to strings
+    """
+    step = max(1, len(complaints_df) // sample_rows)
+    sample = complaints_df.iloc[::step]
+    widths = []
+    for col in complaints_df.columns:
+        longest = sample[col].map(lambda value: len(str(value))).max() if len(sample) else 0
+        widths.append(min(MAX_COLUMN_WIDTH, max(len(str(col)), int(longest or 0))) + 2)
+    return widths
+
+def excel_cell_value(value):
+    """Convert a DataFrame value into something xlsxwriter can write"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'item'):
+        # numpy scalar
+        return value.item()
+    return value
+
+def write_summary_sheet(workbook, sheet_name, headers, rows, header_format):
+    """Write a small two-column summary table and return its worksheet"""
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, headers, header_format)
+    for row_num, row in enumerate(rows, start=1):
+        worksheet.write_row(row_num, 0, [excel_cell_value(value) for value in row])
+    return worksheet
+
+def write_report_excel_streaming(complaints_df, output, progress=None):
+    """
+    Write the complaints report (all complaints plus status, category and
+    monthly summaries with charts) with xlsxwriter's constant_memory mode:
+    rows are flushed to disk as they are written, so memory use does not
+    grow with the number of complaints.
+    `output` is a file path or a writable binary file object.
+    `progress`, if given, is called as progress(rows_written, total_rows).
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#D9D9D9',
+        'border': 1
+    })
     
-    # Create a Pandas Excel writer using XlsxWriter as the engine
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        # Write the complaints DataFrame to a sheet
-        complaints_df.to_excel(writer, sheet_name='All Complaints', index=False)
-        
-        # Get the xlsxwriter workbook and worksheet objects
-        workbook = writer.book
-        worksheet = writer.sheets['All Complaints']
-        
-        # Define formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'fg_color': '#D9D9D9',
-            'border': 1
-        })
-        
-        # Apply the header format to the first row
-        for col_num, value in enumerate(complaints_df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            
-        # Adjust column widths
-        for i, col in enumerate(complaints_df.columns):
-            column_width = max(len(str(col)), 
-                              complaints_df[col].astype(str).map(len).max())
-            worksheet.set_column(i, i, column_width + 2)
-        
-        # Create a status summary sheet
-        status_counts = complaints_df['status'].value_counts().reset_index()
-        status_counts.columns = ['Status', 'Count']
-        status_counts.to_excel(writer, sheet_name='Status Summary', index=False)
-        
-        # Create a category summary sheet
-        category_counts = complaints_df['category'].value_counts().reset_index()
-        category_counts.columns = ['Category', 'Count']
-        category_counts.to_excel(writer, sheet_name='Category Summary', index=False)
-        
-        # Create charts in the summary sheets
-        # Status chart
-        status_chart = workbook.add_chart({'type': 'pie'})
-        status_chart.add_series({
-            'name': 'Complaint Status',
-            'categories': ['Status Summary', 1, 0, len(status_counts), 0],
-            'values': ['Status Summary', 1, 1, len(status_counts), 1],
-            'data_labels': {'percentage': True}
-        })
-        status_chart.set_title({'name': 'Complaints by Status'})
-        status_chart.set_style(10)
-        worksheet_status = writer.sheets['Status Summary']
-        worksheet_status.insert_chart('D2', status_chart, {'x_scale': 1.5, 'y_scale': 1.5})
-        
-        # Category chart
-        category_chart = workbook.add_chart({'type': 'column'})
-        category_chart.add_series({
-            'name': 'Complaint Categories',
-            'categories': ['Category Summary', 1, 0, len(category_counts), 0],
-            'values': ['Category Summary', 1, 1, len(category_counts), 1],
+    # All complaints, written row by row in order
+    worksheet = workbook.add_worksheet('All Complaints')
+    for i, width in enumerate(estimate_column_widths(complaints_df)):
+        worksheet.set_column(i, i, width)
+    worksheet.write_row(0, 0, [str(col) for col in complaints_df.columns], header_format)
+    total_rows = len(complaints_df)
+    for row_num, row in enumerate(complaints_df.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_num, 0, [excel_cell_value(value) for value in row])
+        if progress and row_num % PROGRESS_EVERY_ROWS == 0:
+            progress(row_num, total_rows)
+    if progress:
+        progress(total_rows, total_rows)
+    
+    # Summary sheets
+    status_counts = complaints_df['status'].value_counts()
+    worksheet_status = write_summary_sheet(workbook, 'Status Summary', ['Status', 'Count'],
+                                           status_counts.items(), header_format)
+    status_chart = workbook.add_chart({'type': 'pie'})
+    status_chart.add_series({
+        'name': 'Complaint Status',
+        'categories': ['Status Summary', 1, 0, len(status_counts), 0],
+        'values': ['Status Summary', 1, 1, len(status_counts), 1],
+        'data_labels': {'percentage': True}
+    })
+    status_chart.set_title({'name': 'Complaints by Status'})
+    status_chart.set_style(10)
+    worksheet_status.insert_chart('D2', status_chart, {'x_scale': 1.5, 'y_scale': 1.5})
+    
+    category_counts = complaints_df['category'].value_counts()
+    worksheet_category = write_summary_sheet(workbook, 'Category Summary', ['Category', 'Count'],
+                                             category_counts.items(), header_format)
+    category_chart = workbook.add_chart({'type': 'column'})
+    category_chart.add_series({
+        'name': 'Complaint Categories',
+        'categories': ['Category Summary', 1, 0, len(category_counts), 0],
+        'values': ['Category Summary', 1, 1, len(category_counts), 1],
+        'data_labels': {'value': True}
+    })
+    category_chart.set_title({'name': 'Complaints by Category'})
+    category_chart.set_x_axis({'name': 'Category'})
+    category_chart.set_y_axis({'name': 'Number of Complaints'})
+    category_chart.set_style(11)
+    worksheet_category.insert_chart('D2', category_chart, {'x_scale': 1.5, 'y_scale': 1.5})
+    
+    if not complaints_df.empty:
+        monthly_data = monthly_counts(complaints_df)
+        worksheet_trends = write_summary_sheet(workbook, 'Monthly Trends', ['Month', 'Count'],
+                                               monthly_data.itertuples(index=False, name=None),
+                                               header_format)
+        trend_chart = workbook.add_chart({'type': 'line'})
+        trend_chart.add_series({
+            'name': 'Monthly Complaints',
+            'categories': ['Monthly Trends', 1, 0, len(monthly_data), 0],
+            'values': ['Monthly Trends', 1, 1, len(monthly_data), 1],
+            'marker': {'type': 'circle', 'size': 8},
             'data_labels': {'value': True}
         })
-        category_chart.set_title({'name': 'Complaints by Category'})
-        category_chart.set_x_axis({'name': 'Category'})
-        category_chart.set_y_axis({'name': 'Number of Complaints'})
-        category_chart.set_style(11)
-        worksheet_category = writer.sheets['Category Summary']
-        worksheet_category.insert_chart('D2', category_chart, {'x_scale': 1.5, 'y_scale': 1.5})
-        
-        # Monthly trends sheet (if we have enough data)
-        if not complaints_df.empty:
-            # Convert submission_date to datetime
-            complaints_df['submission_date'] = pd.to_datetime(complaints_df['submission_date'])
-            
-            # Group by month and count
-            monthly_data = complaints_df.groupby(pd.Grouper(key='submission_date', freq='M')).size().reset_index()
-            monthly_data.columns = ['Month', 'Count']
-            monthly_data['Month'] = monthly_data['Month'].dt.strftime('%Y-%m')
-            
-            # Write to sheet
-            monthly_data.to_excel(writer, sheet_name='Monthly Trends', index=False)
-            
-            # Create a line chart
-            trend_chart = workbook.add_chart({'type': 'line'})
-            trend_chart.add_series({
-                'name': 'Monthly Complaints',
-                'categories': ['Monthly Trends', 1, 0, len(monthly_data), 0],
-                'values': ['Monthly Trends', 1, 1, len(monthly_data), 1],
-                'marker': {'type': 'circle', 'size': 8},
-                'data_labels': {'value': True}
-            })
-            trend_chart.set_title({'name': 'Monthly Complaint Trends'})
-            trend_chart.set_x_axis({'name': 'Month'})
-            trend_chart.set_y_axis({'name': 'Number of Complaints'})
-            trend_chart.set_style(12)
-            worksheet_trends = writer.sheets['Monthly Trends']
-            worksheet_trends.insert_chart('D2', trend_chart, {'x_scale': 1.5, 'y_scale': 1.5})
+        trend_chart.set_title({'name': 'Monthly Complaint Trends'})
+        trend_chart.set_x_axis({'name': 'Month'})
+        trend_chart.set_y_axis({'name': 'Number of Complaints'})
+        trend_chart.set_style(12)
+        worksheet_trends.insert_chart('D2', trend_chart, {'x_scale': 1.5, 'y_scale': 1.5})
     
-    # Reset the pointer to the beginning of the BytesIO object
-    output.seek(0)
-    
-    return output
+    workbook.close()
 
-def export_complaints_excel(complaints_df):
+def iter_excel_chunks(file_path, chunksize=5000):
     """
-    Export complaints data to Excel file and return it as a downloadable response
+    Read the first sheet of a workbook as DataFrames of up to `chunksize`
+    rows, using openpyxl's read-only mode so the whole sheet is never
+    held in memory
     """
-    output = generate_report_excel(complaints_df)
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) for col in header]
+        
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+def iter_import_chunks(file_path, chunksize=IMPORT_BATCH_ROWS):
+    """Read an uploaded .xlsx or .csv file in chunks of raw rows"""
+    if file_path.lower().endswith('.csv'):
+        yield from pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=chunksize)
+    else:
+        yield from iter_excel_chunks(file_path, chunksize)
+
+def normalise_dates(values):
+    """Format parseable dates the way the web form stores them; others become NaN"""
+    parsed = pd.to_datetime(values.where(values != ''), errors='coerce', format='mixed')
+    return parsed.dt.strftime('%Y-%m-%d %H:%M:%S')
+
+def validate_import_chunk(chunk_df, known_ids):
+    """
+    Check one chunk of imported complaints with column-wise operations
+    Returns (valid_df, rejected_df); rejected rows carry a 'reason' column.
+    Accepted complaint IDs are added to `known_ids`.
+    """
+    chunk_df = chunk_df.astype(object).where(chunk_df.notna(), '').astype(str)
+    for col in chunk_df.columns:
+        chunk_df[col] = chunk_df[col].str.strip()
+    
+    reasons = pd.Series('', index=chunk_df.index)
+    def reject(mask, reason):
+        reasons[mask] = reasons[mask] + reason + '; '
     
-    # Create timestamp for filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"complaints_report_{timestamp}.xlsx"
+    for col in REQUIRED_IMPORT_COLUMNS:
+        reject(chunk_df[col] == '', f"missing {col}")
+    reject((chunk_df['complaint_id'] != '') & ~chunk_df['complaint_id'].str.match(COMPLAINT_ID_PATTERN),
+           "complaint_id must look like CID0001")
+    reject((chunk_df['user_id'] != '') & ~chunk_df['user_id'].str.match(USER_ID_PATTERN),
+           "user_id must look like UID0001")
     
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    status_key = chunk_df['status'].str.lower().str.replace(' ', '', regex=False)
+    statuses = status_key.map(IMPORT_STATUSES)
+    reject((status_key != '') & statuses.isna(),
+           f"status must be one of {', '.join(sorted(set(IMPORT_STATUSES.values())))}")
+    chunk_df['status'] = statuses.fillna(chunk_df['status'])
+    
+    for col in ('submission_date', 'resolution_date'):
+        if col not in chunk_df.columns:
+            continue
+        dates = normalise_dates(chunk_df[col])
+        reject((chunk_df[col] != '') & dates.isna(), f"{col} is not a valid date")
+        chunk_df[col] = dates.fillna(chunk_df[col])
+    
+    # Set lookups per row; Series.isin would copy the whole ID set for every chunk
+    exists = pd.Series([cid in known_ids for cid in chunk_df['complaint_id']], index=chunk_df.index)
+    reject(exists, "complaint_id already exists")
+    reject(chunk_df['complaint_id'].duplicated() & (chunk_df['complaint_id'] != ''),
+           "complaint_id repeated in file")
+    
+    valid = reasons == ''
+    valid_df = chunk_df[valid]
+    known_ids.update(valid_df['complaint_id'])
+    rejected_df = chunk_df[~valid].assign(reason=reasons[~valid].str.rstrip('; '))
+    return valid_df, rejected_df
 
-def import_complaints_from_excel(file_path):
+def import_complaints_from_excel(file_path, complaint_file='data/complaints.xlsx',
+                                 rejects_path=None, batch_rows=IMPORT_BATCH_ROWS):
     """
-    Import complaints from Excel file
-    Returns a DataFrame with the imported data
+    Import complaints from an Excel or CSV file without loading either the
+    upload or the complaint workbook into memory
+    
+    The current complaints are copied row by row into a new workbook
+    (collecting their IDs for deduplication), then the upload is read,
+    validated and appended in batches of `batch_rows`. The new workbook
+    replaces the old one only once every batch is written, so a failed
+    import leaves the complaints untouched. Rejected rows are written
+    with their reasons to `rejects_path` (CSV).
+    
+    Returns a dict with 'imported', 'rejected', 'rejects_path' and 'error'.
     """
+    result = {'imported': 0, 'rejected': 0, 'rejects_path': None, 'error': None}
+    temp_path = f"{complaint_file}.{os.getpid()}.importing"
+    # Accepted rows, added to the change log once the import is committed
+    accepted_spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+    version_before = os.stat(complaint_file).st_mtime_ns if os.path.exists(complaint_file) else None
     try:
-        df = pd.read_excel(file_path)
-        required_columns = [
-            'complaint_id', 'user_id', 'category', 'description', 
-            'location', 'submission_date', 'status'
-        ]
+        workbook = xlsxwriter.Workbook(temp_path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        known_ids = set()
+        
+        # Copy the existing complaints; constant_memory mode needs rows in order
+        row_num = 0
+        if os.path.exists(complaint_file):
+            source = load_workbook(complaint_file, read_only=True, data_only=True)
+            try:
+                rows = source.worksheets[0].iter_rows(values_only=True)
+                header = [str(col) for col in next(rows, None) or COMPLAINT_COLUMNS]
+                worksheet.write_row(0, 0, header)
+                id_col = header.index('complaint_id') if 'complaint_id' in header else None
+                for row in rows:
+                    row_num += 1
+                    worksheet.write_row(row_num, 0, [excel_cell_value(value) for value in row])
+                    if id_col is not None and row[id_col] is not None:
+                        known_ids.add(str(row[id_col]).strip())
+            finally:
+                source.close()
+        else:
+            header = list(COMPLAINT_COLUMNS)
+            worksheet.write_row(0, 0, header)
         
-        # Check if required columns exist
-        for col in required_columns:
-            if col not in df.columns:
-                return None, f"Required column '{col}' not found in Excel file"
+        # Validate and append the upload
+        first_chunk = True
+        for chunk_df in iter_import_chunks(file_path, batch_rows):
+            if first_chunk:
+                missing = [col for col in REQUIRED_IMPORT_COLUMNS if col not in chunk_df.columns]
+                if missing:
+                    result['error'] = f"Required column '{missing[0]}' not found in file"
+                    workbook.close()
+                    return result
+            # Spreadsheet row numbers, counting the header as row 1
+            chunk_df.index = range(result['imported'] + result['rejected'] + 2,
+                                   result['imported'] + result['rejected'] + 2 + len(chunk_df))
+            valid_df, rejected_df = validate_import_chunk(chunk_df, known_ids)
+            
+            for row in valid_df.reindex(columns=header).itertuples(index=False, name=None):
+                row_num += 1
+                worksheet.write_row(row_num, 0, [excel_cell_value(value) for value in row])
+            result['imported'] += len(valid_df)
+            if not valid_df.empty:
+                accepted_spool.write(valid_df.to_json(orient='records', lines=True).rstrip('\n') + '\n')
+            
+            if not rejected_df.empty:
+                if rejects_path:
+                    rejected_df.to_csv(rejects_path, mode='w' if result['rejected'] == 0 else 'a',
+                                       header=result['rejected'] == 0, index_label='row')
+                    result['rejects_path'] = rejects_path
+                result['rejected'] += len(rejected_df)
+            first_chunk = False
+        workbook.close()
         
-        return df, "Import successful"
+        if result['imported'] == 0:
+            return result
+        # Writers hold this lock from reading the workbook to writing it
+        # back, so none can slip in between the check and the replace
+        with workbook_lock(complaint_file):
+            version_now = os.stat(complaint_file).st_mtime_ns if os.path.exists(complaint_file) else None
+            if version_now != version_before:
+                result['imported'] = 0
+                result['error'] = "Complaints were modified during the import, please try again"
+                return result
+            os.replace(temp_path, complaint_file)
+        log_imported_rows(accepted_spool, batch_rows)
+        return result
     except Exception as e:
-        return None, f"Error importing Excel file: {str(e)}"
+        print(f"Error importing complaints: {e}")
+        result['imported'] = 0
+        result['error'] = f"Error importing file: {str(e)}"
+        return result
+    finally:
+        accepted_spool.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def log_imported_rows(spool, batch_rows=IMPORT_BATCH_ROWS):
+    """Add spooled imported complaints to the change log in batches"""
+    spool.seek(0)
+    batch = []
+    for line in spool:
+        batch.append(json.loads(line))
+        if len(batch) >= batch_rows:
+            record_changes('complaint', 'insert', batch)
+            batch = []
+    if batch:
+        record_changes('complaint', 'insert', batch)
 
 def backup_database():
     """
     Create a backup of the database files
+    Unchanged files are shared with earlier snapshots, so this only
+    costs as much as what changed since the last backup
     """
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_dir = 'backups'
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    # Backup complaints file
-    if os.path.exists('data/complaints.xlsx'):
-        complaints_df = pd.read_excel('data/complaints.xlsx')
-        complaints_df.to_excel(f"{backup_dir}/complaints_backup_{timestamp}.xlsx", index=False)
-    
-    # Backup users file
-    if os.path.exists('data/users.xlsx'):
-        users_df = pd.read_excel('data/users.xlsx')
-        users_df.to_excel(f"{backup_dir}/users_backup_{timestamp}.xlsx", index=False)
-    
-    return f"Backup created at {timestamp}"
\ No newline at end of file
+    try:
+        manifest = create_backup()
+        prune_backups()
+        return (f"Backup {manifest['backup_id']} created "
+                f"({len(manifest['files'])} files, {manifest['new_bytes'] // 1024} KB new)")
+    except Exception as e:
+        print(f"Error creating backup: {e}")
+        return f"Backup failed: {e}"
\ No newline at end of file
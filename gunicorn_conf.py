@@ -0,0 +1,26 @@
+# gunicorn_conf.py - Gunicorn settings; lets /metrics add up every worker's samples
+import os
+import shutil
+
+
+# Workers inherit this and write their metric samples to mmap files here
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', 'data/prometheus')
+
+
+def on_starting(server):
+    # Samples left by an earlier run would be counted again
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Each worker starts its scheduler once the app is loaded; the jobs
+    # that write shared files still run in the elected leader only
+    import app
+    if app.SCHEDULER_ENABLED:
+        app.scheduler.start()
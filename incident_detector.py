@@ -0,0 +1,162 @@
+# incident_detector.py - Group bursts of complaints from one area into incidents
+import re
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from complaint_merge import unified_view
+
+
+# Complaints about the same area and category less than this far apart
+# belong to the same incident
+INCIDENT_WINDOW = timedelta(minutes=30)
+# Complaints inside one window before a group is reported as an incident
+INCIDENT_MIN_COMPLAINTS = 3
+CLOSED_STATUSES = {'resolved', 'closed'}
+
+LOCATION_FILLER = {'near', 'opp', 'opposite', 'behind', 'beside', 'the', 'at', 'in', 'of', 'no', 'house'}
+LOCATION_ABBREVIATIONS = {
+    'rd': 'road', 'st': 'street', 'sec': 'sector', 'sect': 'sector', 'ngr': 'nagar',
+    'nr': 'near', 'col': 'colony', 'mkt': 'market', 'apt': 'apartment',
+}
+
+
+def normalise_location(location):
+    """'Sec-12, Main Rd.' and 'sector 12 main road' give the same area key"""
+    words = re.findall(r'[a-z]+|\d+', str(location).lower())
+    words = [LOCATION_ABBREVIATIONS.get(word, word) for word in words]
+    return ' '.join(word for word in words if word not in LOCATION_FILLER)
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+class Incident:
+    def __init__(self, incident_id, area, category, started_at):
+        self.incident_id = incident_id
+        self.area = area
+        self.category = category
+        self.started_at = started_at
+        self.last_at = started_at
+        self.members = []
+        # Submission times inside the current window
+        self.recent = deque()
+        self.resolved = False
+
+    def to_dict(self):
+        return {
+            'incident_id': self.incident_id,
+            'area': self.area,
+            'category': self.category,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_at': self.last_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'member_count': len(self.members),
+            'recent_count': len(self.recent),
+            'resolved': self.resolved,
+        }
+
+
+class IncidentDetector:
+    """
+    Streams complaints into incidents, O(1) amortised per complaint
+
+    Each (area, category) has at most one active incident. A complaint
+    joins it if it arrives within INCIDENT_WINDOW of the incident's last
+    complaint, otherwise it starts a new one. Each incident keeps a deque
+    of the submission times inside the window, so its current rate is a
+    length check rather than a scan.
+    """
+
+    def __init__(self, window=INCIDENT_WINDOW, min_complaints=INCIDENT_MIN_COMPLAINTS):
+        self.window = window
+        self.min_complaints = min_complaints
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.active = {}
+        self.incidents = {}
+        self.incident_of = {}
+        # complaint_id -> row position in the unified table
+        self.rows = {}
+        self.next_number = 1
+        self.synced_rows = 0
+        self.synced_generation = None
+
+    def add(self, complaint_id, location, category, submitted_at):
+        """Place one complaint in an incident and return that incident"""
+        key = (normalise_location(location), str(category).strip().lower())
+        incident = self.active.get(key)
+        if incident is None or incident.resolved or submitted_at - incident.last_at > self.window:
+            incident = Incident(f"INC{self.next_number:05d}", key[0], str(category).strip(), submitted_at)
+            self.next_number += 1
+            self.active[key] = incident
+            self.incidents[incident.incident_id] = incident
+
+        incident.members.append(complaint_id)
+        incident.last_at = max(incident.last_at, submitted_at)
+        incident.recent.append(submitted_at)
+        while incident.recent and incident.last_at - incident.recent[0] > self.window:
+            incident.recent.popleft()
+        self.incident_of[complaint_id] = incident.incident_id
+        return incident
+
+    def sync(self, view=unified_view):
+        """Feed complaints added to the unified view since the last call"""
+        table = view.refresh()
+        with self.lock:
+            if self.synced_generation != view.generation:
+                self.clear()
+                self.synced_generation = view.generation
+            new_rows = table.iloc[self.synced_rows:]
+            for position, complaint_id, location, category, submitted in zip(
+                    range(self.synced_rows, len(table)), new_rows['complaint_id'],
+                    new_rows['location'], new_rows['category'], new_rows['submission_date']):
+                submitted_at = parse_time(submitted)
+                if complaint_id and location and submitted_at:
+                    self.add(complaint_id, location, category, submitted_at)
+                    self.rows[complaint_id] = position
+            self.synced_rows = len(table)
+        return table
+
+    def list_incidents(self, include_resolved=False):
+        """Incidents with at least min_complaints members, newest first"""
+        table = self.sync()
+        status_column = table.columns.get_loc('status')
+        with self.lock:
+            incidents = []
+            for incident in self.incidents.values():
+                if len(incident.members) < self.min_complaints:
+                    continue
+                if incident.resolved and not include_resolved:
+                    continue
+                open_members = [cid for cid in incident.members
+                                if str(table.iat[self.rows[cid], status_column]).lower() not in CLOSED_STATUSES]
+                if not open_members:
+                    # Every member was closed individually
+                    incident.resolved = True
+                    if not include_resolved:
+                        continue
+                record = incident.to_dict()
+                record['open_count'] = len(open_members)
+                incidents.append(record)
+        incidents.sort(key=lambda record: record['last_at'], reverse=True)
+        return incidents
+
+    def members(self, incident_id):
+        with self.lock:
+            incident = self.incidents.get(incident_id)
+            return list(incident.members) if incident else []
+
+    def mark_resolved(self, incident_id):
+        with self.lock:
+            incident = self.incidents.get(incident_id)
+            if incident:
+                incident.resolved = True
+
+
+incident_detector = IncidentDetector()
@@ -0,0 +1,89 @@
+# ivr_loadtest.py - Replay recorded caller scripts against the IVR engine
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from ivr_server import IVRServer, SharedComplaintStore, WavScriptSource
+from voice22 import VOICE_COMPLAINT_FILE
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def run_load_test(script_dirs, calls, concurrency, use_transcripts, store_path):
+    """Run `calls` sessions, cycling through the scripts, and return their summaries"""
+    server = IVRServer(SharedComplaintStore(store_path), max_sessions=concurrency)
+    started = time.perf_counter()
+    futures = [
+        server.start_session(WavScriptSource.from_directory(script_dirs[i % len(script_dirs)], use_transcripts))
+        for i in range(calls)
+    ]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return results, elapsed
+
+
+def print_report(results, elapsed, concurrency):
+    durations = [result['duration'] for result in results]
+    turn_timings = [t for result in results for t in result['turn_timings']]
+    errors = [result for result in results if result['error']]
+    registered = sum(len(result['registered']) for result in results)
+
+    print("\n" + "="*80)
+    print("IVR LOAD TEST REPORT")
+    print("="*80)
+    print(f"Calls: {len(results)} at concurrency {concurrency} in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.1f} calls/s)")
+    print(f"Complaints registered: {registered}")
+    print(f"Errors: {len(errors)}")
+    print(f"Call duration  p50 {percentile(durations, 50):.3f}s  "
+          f"p95 {percentile(durations, 95):.3f}s  p99 {percentile(durations, 99):.3f}s")
+    if turn_timings:
+        print(f"Recognition    p50 {percentile(turn_timings, 50):.3f}s  "
+              f"p95 {percentile(turn_timings, 95):.3f}s  p99 {percentile(turn_timings, 99):.3f}s")
+    for result in errors[:10]:
+        print(f"  session {result['session_id']}: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded WAV caller scripts against the IVR engine. "
+                    "Each script is a directory of WAV files played in name order, one per caller turn.")
+    parser.add_argument('scripts', nargs='+', help="script directories")
+    parser.add_argument('--calls', type=int, default=50, help="total sessions to run")
+    parser.add_argument('--concurrency', type=int, default=10, help="sessions running at once")
+    parser.add_argument('--transcripts', action='store_true',
+                        help="use '<turn>.txt' files instead of calling the speech API")
+    parser.add_argument('--store', help="voice complaints workbook to write to "
+                                        "(default: a temporary copy of the real one)")
+    args = parser.parse_args()
+
+    temp_dir = None
+    store_path = args.store
+    if not store_path:
+        # Keep load-test complaints out of the real workbook
+        temp_dir = tempfile.mkdtemp(prefix='ivr_loadtest_')
+        store_path = os.path.join(temp_dir, 'voiceComplaint.xlsx')
+        if os.path.exists(VOICE_COMPLAINT_FILE):
+            shutil.copy(VOICE_COMPLAINT_FILE, store_path)
+
+    try:
+        results, elapsed = run_load_test(args.scripts, args.calls, args.concurrency,
+                                         args.transcripts, store_path)
+        print_report(results, elapsed, args.concurrency)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
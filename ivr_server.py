@@ -0,0 +1,303 @@
+# ivr_server.py - Multi-session IVR engine for the voice complaint system
+import argparse
+import datetime
+import io
+import os
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+
+import speech_recognition as sr
+
+from spoken_id_index import ComplaintIdIndex
+from tracing import span
+from voice22 import (Complaint, ElectricityComplaintSystem, VOICE_COMPLAINT_FILE,
+                     load_voice_complaints, save_complaint_to_excel)
+
+
+# Seconds a caller may go without sending anything before the call is dropped
+CALLER_TIMEOUT_SECONDS = 30
+
+
+class CallEnded(Exception):
+    """The caller hung up or the recorded script ran out"""
+
+
+class SharedComplaintStore:
+    """Voice complaint store shared by every IVR session"""
+
+    def __init__(self, file_path=VOICE_COMPLAINT_FILE):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.id_index = ComplaintIdIndex()
+        # (timestamp, sequence) of the newest ID handed out, so IDs issued
+        # within one second, or after a restart, never repeat
+        self.last_id = ('', 0)
+
+        for record in load_voice_complaints(file_path).to_dict('records'):
+            self.id_index.add(record['complaint_id'], record)
+            match = re.fullmatch(r'EC(\d{14})(\d*)', str(record['complaint_id']).strip())
+            if match:
+                self.last_id = max(self.last_id, (match.group(1), int(match.group(2) or 0)))
+
+    def __len__(self):
+        return len(self.id_index)
+
+    def next_complaint_id(self):
+        """
+        Timestamp-based complaint ID that stays unique across sessions
+        The first complaint in a second gets EC<YYYYmmddHHMMSS>; later ones
+        in the same second add a sequence number, e.g. EC2025060112000001
+        """
+        with self.lock:
+            stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            last_stamp, last_sequence = self.last_id
+            if stamp > last_stamp:
+                sequence = 0
+            else:
+                # Same second (or the clock went back): keep the last stamp
+                stamp, sequence = last_stamp, last_sequence + 1
+            self.last_id = (stamp, sequence)
+        return f"EC{stamp}{sequence:02d}" if sequence else f"EC{stamp}"
+
+    def add(self, complaint):
+        """
+        Save a complaint. The workbook write is serialised by the workbook's
+        own lock, so other sessions can look up IDs while it runs.
+        """
+        save_complaint_to_excel(complaint, self.file_path)
+        with self.lock:
+            self.id_index.add(complaint.complaint_id, asdict(complaint))
+
+    def find(self, spoken_id):
+        with self.lock:
+            return self.id_index.lookup(spoken_id)
+
+
+class WavScriptSource:
+    """
+    Caller audio replayed from WAV files, one file per utterance
+    With use_transcripts, a '<name>.txt' next to a WAV is returned as the
+    already-recognised text, so load tests do not call the speech API
+    """
+
+    def __init__(self, wav_paths, use_transcripts=False):
+        self.wav_paths = list(wav_paths)
+        self.use_transcripts = use_transcripts
+        self.position = 0
+
+    @classmethod
+    def from_directory(cls, script_dir, use_transcripts=False):
+        wav_files = sorted(name for name in os.listdir(script_dir) if name.lower().endswith('.wav'))
+        return cls([os.path.join(script_dir, name) for name in wav_files], use_transcripts)
+
+    def next_utterance(self, recognizer):
+        if self.position >= len(self.wav_paths):
+            raise CallEnded()
+        wav_path = self.wav_paths[self.position]
+        self.position += 1
+
+        transcript_path = os.path.splitext(wav_path)[0] + '.txt'
+        if self.use_transcripts and os.path.exists(transcript_path):
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+
+        with sr.AudioFile(wav_path) as source:
+            return recognizer.record(source)
+
+    def send_prompt(self, text):
+        pass
+
+
+class SocketAudioSource:
+    """
+    Caller audio read from a socket connection
+    Each utterance arrives as a 4-byte big-endian length followed by that
+    many bytes of WAV audio; a zero length means the caller stayed silent.
+    Prompts go back the same way as UTF-8 text. A caller that sends
+    nothing for `timeout` seconds is hung up on.
+    """
+
+    def __init__(self, connection, timeout=CALLER_TIMEOUT_SECONDS):
+        self.connection = connection
+        self.connection.settimeout(timeout)
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            try:
+                chunk = self.connection.recv(size - len(data))
+            except OSError:
+                # Timed out or reset; either way the caller is gone
+                raise CallEnded()
+            if not chunk:
+                raise CallEnded()
+            data += chunk
+        return data
+
+    def next_utterance(self, recognizer):
+        (size,) = struct.unpack('>I', self.read_exact(4))
+        if size == 0:
+            return None
+        with sr.AudioFile(io.BytesIO(self.read_exact(size))) as source:
+            return recognizer.record(source)
+
+    def send_prompt(self, text):
+        payload = text.encode('utf-8')
+        try:
+            self.connection.sendall(struct.pack('>I', len(payload)) + payload)
+        except OSError:
+            raise CallEnded()
+
+
+class IVRSession(ElectricityComplaintSystem):
+    """One caller's dialogue, driven by an audio source instead of the microphone"""
+
+    # Prompts go straight back over the connection; no pause between menus
+    menu_pause = 0
+
+    def __init__(self, source, store, session_id=None):
+        # Not the base __init__: that opens the microphone and TTS engine,
+        # while a session's audio comes from `source`
+        self.init_dialogue_state()
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self.source = source
+        self.store = store
+        self.prompts = []
+        self.registered = []
+        self.turns = 0
+
+    def speak(self, text: str):
+        self.prompts.append(text)
+        self.source.send_prompt(text)
+
+    def show_menu(self):
+        self.speak("What would you like to do? You can register a new complaint, check complaint status, view all complaints, or exit.")
+
+    def listen(self, timeout=5, phrase_time_limit=10) -> str:
+        self.turns += 1
+        utterance = self.source.next_utterance(self.recognizer)
+        if utterance is None:
+            return "timeout"
+        if isinstance(utterance, str):
+            return utterance.lower()
+
+        started = time.perf_counter()
+        try:
+            with span('transcribe', engine='google'):
+                text = self.recognizer.recognize_google(utterance)
+            return text.lower()
+        except sr.UnknownValueError:
+            return "unclear"
+        except sr.RequestError as e:
+            print(f"[{self.session_id}] Speech recognition error: {e}")
+            return "error"
+        finally:
+            self.turn_timings.append(time.perf_counter() - started)
+
+    def generate_complaint_id(self) -> str:
+        return self.store.next_complaint_id()
+
+    def store_complaint(self, complaint: Complaint):
+        self.store.add(complaint)
+        self.registered.append(complaint.complaint_id)
+
+    def find_complaint(self, spoken_id: str):
+        return self.store.find(spoken_id)
+
+    def view_all_complaints(self):
+        self.speak(f"Found {len(self.store)} complaints in total.")
+
+    def run(self):
+        """Run the call to completion and return a summary of it"""
+        started = time.perf_counter()
+        error = None
+        try:
+            self.speak("Welcome to the Electricity Complaint System. How can I help you today?")
+            self.dialogue_loop()
+        except CallEnded:
+            pass
+        except Exception as e:
+            print(f"[{self.session_id}] Session error: {e}")
+            error = str(e)
+
+        return {
+            'session_id': self.session_id,
+            'duration': time.perf_counter() - started,
+            'turns': self.turns,
+            'turn_timings': self.turn_timings,
+            'prompts': len(self.prompts),
+            'registered': self.registered,
+            'error': error,
+        }
+
+
+class IVRServer:
+    """Runs many caller sessions concurrently against one complaint store"""
+
+    def __init__(self, store=None, max_sessions=16, caller_timeout=CALLER_TIMEOUT_SECONDS):
+        self.store = store or SharedComplaintStore()
+        self.caller_timeout = caller_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix='ivr-session')
+        self.active_sessions = 0
+        self.lock = threading.Lock()
+
+    def start_session(self, source, on_finish=None):
+        """Queue a session for the given audio source; returns a Future of its summary"""
+        def run_session():
+            with self.lock:
+                self.active_sessions += 1
+            try:
+                return IVRSession(source, self.store).run()
+            finally:
+                with self.lock:
+                    self.active_sessions -= 1
+                if on_finish:
+                    on_finish()
+
+        return self.executor.submit(run_session)
+
+    def serve(self, host='0.0.0.0', port=5060):
+        """Accept callers over TCP until interrupted"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host, port))
+            server.listen()
+            print(f"IVR server listening on {host}:{port}")
+            try:
+                while True:
+                    connection, address = server.accept()
+                    print(f"Call from {address[0]}:{address[1]}")
+                    self.start_session(SocketAudioSource(connection, self.caller_timeout),
+                                       on_finish=connection.close)
+            except KeyboardInterrupt:
+                print("IVR server shutting down.")
+            finally:
+                self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-session IVR server for voice complaints")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5060)
+    parser.add_argument('--sessions', type=int, default=16, help="maximum concurrent calls")
+    parser.add_argument('--store', default=VOICE_COMPLAINT_FILE, help="voice complaints workbook")
+    parser.add_argument('--caller-timeout', type=float, default=CALLER_TIMEOUT_SECONDS,
+                        help="seconds of caller silence on the socket before hanging up")
+    args = parser.parse_args()
+
+    server = IVRServer(SharedComplaintStore(args.store), max_sessions=args.sessions,
+                       caller_timeout=args.caller_timeout)
+    server.serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
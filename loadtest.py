@@ -0,0 +1,474 @@
+# loadtest.py - Drive ECMS with a weighted mix of user journeys and report latency percentiles
+import argparse
+import json
+import os
+import random
+import shutil
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no gunicorn either, so there is nothing to serialise
+    fcntl = None
+
+from ivr_loadtest import percentile
+from synthetic_data import (ADMIN_EMAIL, ADMIN_PASSWORD, CATEGORIES, DESCRIPTIONS, LOCATIONS,
+                            SYNTHETIC_PASSWORD, cached_dataset, install_dataset, make_bills,
+                            make_complaints, parse_size, technician_email, user_email)
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATASET_CACHE_DIR = os.path.join(ROOT, 'data', 'synthetic')
+# Relative weights of each journey in the mix
+DEFAULT_MIX = {
+    'login': 10,
+    'submit_complaint': 10,
+    'user_dashboard': 20,
+    'track_complaint': 15,
+    'technician_dashboard': 10,
+    'admin_dashboard': 5,
+    'assign_technician': 10,
+    'update_status': 20,
+}
+REQUEST_TIMEOUT = 60
+SERVER_START_TIMEOUT = 120
+# The route is registered with a trailing space
+TRACK_PATH = '/track_complaint%20'
+IMPORT_LOCK_FILE = 'data/loadtest_import.lock'
+STUB_TRANSCRIPT = 'no power since morning in sector 4'
+
+
+class StubSMTP:
+    """Accepts and drops every message, so status updates never reach a mail server"""
+    sent = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, *args, **kwargs):
+        StubSMTP.sent += 1
+        return {}
+
+    def sendmail(self, *args, **kwargs):
+        StubSMTP.sent += 1
+        return {}
+
+    def __getattr__(self, name):
+        # starttls, login, ehlo, quit, ...
+        return lambda *args, **kwargs: None
+
+
+class StubTTS:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def install_stubs():
+    """Replace the SMTP and speech backends before the app is imported"""
+    import pyttsx3
+    import speech_recognition as sr
+
+    smtplib.SMTP = StubSMTP
+    smtplib.SMTP_SSL = StubSMTP
+    sr.Recognizer.recognize_google = lambda self, audio_data, *args, **kwargs: STUB_TRANSCRIPT
+    pyttsx3.init = lambda *args, **kwargs: StubTTS()
+
+
+def create_app():
+    """
+    The app with its backends stubbed, for gunicorn:
+    gunicorn 'loadtest:create_app()'
+    """
+    os.environ.setdefault('SCHEDULER_ENABLED', '0')
+    install_stubs()
+    if fcntl is None:
+        import app as ecms
+        return ecms.app
+    # Workers import the app one at a time: the import rewrites technician.xlsx,
+    # and a worker reading it while another writes it fails to boot
+    os.makedirs('data', exist_ok=True)
+    with open(IMPORT_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        import app as ecms
+    return ecms.app
+
+
+class TestClientTransport:
+    """Requests through Flask's test client, in this process"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        try:
+            return response.status_code, response.headers.get('Location', ''), response.get_data(as_text=True)
+        finally:
+            response.close()
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server, one cookie jar per virtual user"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        response = self.session.request(method, self.base_url + path, data=data,
+                                        allow_redirects=False, timeout=REQUEST_TIMEOUT)
+        return response.status_code, response.headers.get('Location', ''), response.text
+
+
+class WorkPool:
+    """
+    The ids the journeys act on, derived from the synthetic dataset: who
+    may log in and submit, which complaints are open for assignment and
+    which are in progress with each technician
+    """
+
+    def __init__(self, rows, seed=0):
+        technicians = max(10, rows // 100)
+        complaints = make_complaints(rows, rows, technicians, seed)
+        bills = make_bills(rows, seed)
+        unpaid = set(bills.loc[bills['Payment Status'] != 'Paid', 'Customer ID'])
+        self.lock = threading.Lock()
+        self.rows = rows
+        self.technicians = [f"TECH{number}" for number in range(1, technicians + 1)]
+        self.payers = [number for number in range(1, bills['Customer ID'].nunique() + 1)
+                       if user_email(number) not in unpaid]
+        self.complaint_ids = list(complaints['complaint_id'])
+        self.open_ids = list(complaints.loc[complaints['status'] == 'Open', 'complaint_id'])
+        random.Random(seed).shuffle(self.open_ids)
+        self.in_progress = {technician: [] for technician in self.technicians}
+        for complaint_id, technician in zip(
+                complaints.loc[complaints['status'] == 'In Progress', 'complaint_id'],
+                complaints.loc[complaints['status'] == 'In Progress', 'assigned_to']):
+            self.in_progress[technician].append(complaint_id)
+
+    def take_open(self):
+        with self.lock:
+            return self.open_ids.pop() if self.open_ids else None
+
+    def assigned(self, complaint_id, technician):
+        with self.lock:
+            self.in_progress[technician].append(complaint_id)
+
+    def take_in_progress(self, technician):
+        with self.lock:
+            work = self.in_progress[technician]
+            return work.pop() if work else None
+
+
+class VirtualUser:
+    """One simulated person per role (customer, admin, technician) sharing a thread"""
+
+    def __init__(self, number, transport_factory, pool, seed=0):
+        self.transport_factory = transport_factory
+        self.pool = pool
+        self.rng = random.Random(seed * 1000 + number)
+        self.customer = self.rng.choice(pool.payers)
+        self.technician = pool.technicians[number % len(pool.technicians)]
+        self.clients = {}
+        self.results = []
+
+    def call(self, route, client, method, path, data=None, expect=200, location=None, contains=None):
+        """
+        Time one request; it is an error unless it returns `expect`, and
+        redirects to `location` or shows `contains` when those are given
+        (the app's error pages are served with status 200)
+        """
+        started = time.perf_counter()
+        try:
+            status, redirect_to, body = client.request(method, path, data)
+            error = None
+            if status != expect:
+                error = f"{status} (expected {expect})"
+            elif location and not urlparse(redirect_to).path.startswith(location):
+                # '/view_complaint/CID0000042' -> '/view_complaint', so errors group by page
+                error = f"{status} to /{urlparse(redirect_to).path.split('/')[1:2][0] if redirect_to else '?'}"
+            elif contains and contains not in body:
+                error = f"{status} without the expected content"
+        except Exception as e:
+            status, error = None, type(e).__name__
+        self.results.append((route, started, time.perf_counter() - started, error))
+        return error is None
+
+    def login(self, role):
+        client = self.transport_factory()
+        if role == 'technician':
+            self.call('technician_login', client, 'POST', '/technicianLogin',
+                      {'login_identifier': technician_email(int(self.technician[4:])),
+                       'password': SYNTHETIC_PASSWORD},
+                      expect=302, location='/technician_dashboard')
+        elif role == 'admin':
+            self.call('login', client, 'POST', '/login',
+                      {'username': ADMIN_EMAIL, 'password': ADMIN_PASSWORD},
+                      expect=302, location='/admin_dashboard')
+        else:
+            self.call('login', client, 'POST', '/login',
+                      {'username': user_email(self.customer), 'password': SYNTHETIC_PASSWORD},
+                      expect=302, location='/user_dashboard')
+        return client
+
+    def client(self, role):
+        # Logged in on first use, then kept, as a browser keeps its cookie
+        if role not in self.clients:
+            self.clients[role] = self.login(role)
+        return self.clients[role]
+
+    def run_login(self):
+        self.customer = self.rng.choice(self.pool.payers)
+        self.clients['customer'] = self.login('customer')
+
+    def run_submit_complaint(self):
+        category = self.rng.choice(CATEGORIES)
+        self.call('submit_complaint', self.client('customer'), 'POST', '/submit_complaint', {
+            'category': category,
+            'description': self.rng.choice(DESCRIPTIONS[category]),
+            'location': self.rng.choice(LOCATIONS),
+        }, expect=302, location='/user_dashboard')
+
+    def run_user_dashboard(self):
+        self.call('user_dashboard', self.client('customer'), 'GET', '/user_dashboard')
+
+    def run_track_complaint(self):
+        complaint_id = self.rng.choice(self.pool.complaint_ids)
+        self.call('track_complaint', self.transport_factory(), 'POST', TRACK_PATH,
+                  {'complaint_id': complaint_id}, contains=complaint_id)
+
+    def run_technician_dashboard(self):
+        self.call('technician_dashboard', self.client('technician'), 'GET', '/technician_dashboard')
+
+    def run_admin_dashboard(self):
+        self.call('admin_dashboard', self.client('admin'), 'GET', '/admin_dashboard')
+
+    def run_assign_technician(self):
+        complaint_id = self.pool.take_open()
+        if complaint_id is None:
+            return self.run_admin_dashboard()
+        technician = self.rng.choice(self.pool.technicians)
+        if self.call('assign_technician', self.client('admin'), 'POST', f"/assign_technician/{complaint_id}",
+                     {'technician_id': technician}, expect=302, location='/admin_dashboard'):
+            self.pool.assigned(complaint_id, technician)
+
+    def run_update_status(self):
+        complaint_id = self.pool.take_in_progress(self.technician)
+        if complaint_id is None:
+            return self.run_technician_dashboard()
+        self.call('update_status', self.client('technician'), 'POST',
+                  f"/update_technician_complaint/{complaint_id}",
+                  {'status': 'Resolved', 'notes': 'Fixed on site'},
+                  expect=302, location='/technician_dashboard')
+
+
+def run_load_test(transport_factory, pool, mix, concurrency, duration, max_journeys=None, seed=0):
+    """Run virtual users until `duration` seconds pass (or `max_journeys` are done); return results"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+    remaining = [max_journeys]
+    remaining_lock = threading.Lock()
+    users = [VirtualUser(number, transport_factory, pool, seed) for number in range(concurrency)]
+
+    def take_turn():
+        if time.perf_counter() >= deadline:
+            return False
+        if remaining[0] is None:
+            return True
+        with remaining_lock:
+            remaining[0] -= 1
+            return remaining[0] >= 0
+
+    def worker(user):
+        while take_turn():
+            journey = user.rng.choices(names, weights)[0]
+            getattr(user, f"run_{journey}")()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(user,), name=f"vu-{number}")
+               for number, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return [result for user in users for result in user.results], started, elapsed
+
+
+def summarise(results, started, elapsed, warmup=0.0):
+    """Per-route throughput, latency percentiles (ms) and error rates"""
+    measured = [result for result in results if result[1] - started >= warmup]
+    window = max(elapsed - warmup, 1e-9)
+    routes = {}
+    for route, _, seconds, error in measured:
+        routes.setdefault(route, []).append((seconds, error))
+
+    def figures(samples):
+        durations = [seconds * 1000 for seconds, _ in samples]
+        errors = Counter(error for _, error in samples if error)
+        return {
+            'requests': len(samples),
+            'throughput': round(len(samples) / window, 2),
+            'errors': sum(errors.values()),
+            'error_rate': round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+            'error_kinds': dict(errors),
+            'p50_ms': round(percentile(durations, 50), 1),
+            'p95_ms': round(percentile(durations, 95), 1),
+            'p99_ms': round(percentile(durations, 99), 1),
+            'max_ms': round(max(durations), 1) if durations else 0.0,
+        }
+
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'warmup_seconds': warmup,
+        'total': figures([(seconds, error) for _, _, seconds, error in measured]),
+        'routes': {route: figures(samples) for route, samples in sorted(routes.items())},
+    }
+
+
+def print_report(report, concurrency, mode):
+    total = report['total']
+    print("\n" + "="*96)
+    print("ECMS LOAD TEST REPORT")
+    print("="*96)
+    print(f"Mode: {mode}, {concurrency} virtual users for {report['elapsed_seconds']}s "
+          f"(first {report['warmup_seconds']}s not counted)")
+    print(f"Requests: {total['requests']} ({total['throughput']} req/s), "
+          f"errors: {total['errors']} ({total['error_rate']:.2%})")
+    print(f"\n{'Route':<24}{'Requests':>9}{'Req/s':>9}{'Errors':>8}{'Err %':>8}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Max ms':>10}")
+    for route, figures in report['routes'].items():
+        print(f"{route:<24}{figures['requests']:>9}{figures['throughput']:>9}{figures['errors']:>8}"
+              f"{figures['error_rate']:>8.1%}{figures['p50_ms']:>10}{figures['p95_ms']:>10}"
+              f"{figures['p99_ms']:>10}{figures['max_ms']:>10}")
+    for route, figures in report['routes'].items():
+        if figures['error_kinds']:
+            kinds = ', '.join(f"{kind} x{count}" for kind, count in figures['error_kinds'].items())
+            print(f"  {route}: {kinds}")
+
+
+def parse_mix(text):
+    """'login=10,user_dashboard=30' -> weights, starting from DEFAULT_MIX"""
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown journey '{name}', use one of {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workdir, workers, threads):
+    """Start gunicorn on the stubbed app in `workdir`; returns (process, base_url)"""
+    port = free_port()
+    env = dict(os.environ, SCHEDULER_ENABLED='0',
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn_conf.py'),
+         '--workers', str(workers), '--threads', str(threads), '--timeout', str(REQUEST_TIMEOUT * 2),
+         '--bind', f"127.0.0.1:{port}", 'loadtest:create_app()'],
+        cwd=workdir, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, base_url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive ECMS with a weighted mix of logins, submissions, dashboards, tracking "
+                    "lookups, assignments and status updates, against a synthetic dataset.")
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn', 'url'], default='inprocess',
+                        help="Flask test client in this process, a local gunicorn started here, "
+                             "or a server already running at --url")
+    parser.add_argument('--url', help="base URL for --mode url; the server must run "
+                                      "'loadtest:create_app()' on the dataset of --size and --seed")
+    parser.add_argument('--size', default='1k', help="dataset rows: 1k, 10k, 100k, 1M or a number")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8, help="virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--journeys', type=int, help="stop after this many journeys")
+    parser.add_argument('--warmup', type=float, default=0, help="seconds at the start not counted")
+    parser.add_argument('--mix', help="journey weights, e.g. 'login=5,admin_dashboard=0' "
+                                      f"(default: {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())})")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+    if args.mode == 'url' and not args.url:
+        parser.error("--mode url needs --url")
+
+    rows = parse_size(args.size)
+    mix = parse_mix(args.mix)
+    pool = WorkPool(rows, args.seed)
+    workdir = None
+    server = None
+    previous_dir = os.getcwd()
+    try:
+        if args.mode != 'url':
+            # Load-test writes go to a scratch copy of the dataset, never the real workbooks
+            workdir = tempfile.mkdtemp(prefix='ecms_loadtest_')
+            install_dataset(cached_dataset(rows, args.seed, cache_dir=DATASET_CACHE_DIR),
+                            os.path.join(workdir, 'data'))
+        if args.mode == 'inprocess':
+            os.chdir(workdir)
+            flask_app = create_app()
+            transport_factory = lambda: TestClientTransport(flask_app)
+        else:
+            if args.mode == 'gunicorn':
+                server, base_url = start_gunicorn(workdir, args.workers, args.threads)
+            else:
+                base_url = args.url
+            transport_factory = lambda: HttpTransport(base_url)
+
+        results, started, elapsed = run_load_test(transport_factory, pool, mix, args.concurrency,
+                                                  args.duration, args.journeys, args.seed)
+        report = summarise(results, started, elapsed, args.warmup)
+        report.update({'mode': args.mode, 'size': rows, 'concurrency': args.concurrency, 'mix': mix})
+        print_report(report, args.concurrency, args.mode)
+        if args.json:
+            with open(os.path.join(previous_dir, args.json), 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        os.chdir(previous_dir)
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
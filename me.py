@@ -1,8 +1,7 @@
-import pandas as pd
+from complaint_merge import load_unified_complaints
 
-df1 = pd.read_excel('data/complaints.xlsx')
-df2 = pd.read_excel("data/voiceComplaint.xlsx")
+# Web and voice complaints in one schema; the source workbooks are read
+# only past the rows already merged, and edits come from the change log
+merged_df = load_unified_complaints()
 
-merged_df = pd.concat([df1, df2], ignore_index=True)
-
-merged_df.to_excel('merged_file.xlsx', index=False)
\ No newline at end of file
+merged_df.to_excel('merged_file.xlsx', index=False)
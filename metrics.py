@@ -0,0 +1,102 @@
+# metrics.py - Prometheus metrics for requests, storage calls, caches and jobs
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, REGISTRY)
+from prometheus_client import multiprocess
+
+from tracing import span
+
+
+# Set (by gunicorn_conf.py) when several worker processes serve the app;
+# each worker then writes its samples to mmap files in this directory and
+# /metrics adds them up
+METRICS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+# If set, /metrics requires 'Authorization: Bearer <token>'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STORAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram('ecms_request_duration_seconds', 'Request latency by endpoint',
+                            ['endpoint', 'method'], buckets=REQUEST_BUCKETS)
+REQUEST_COUNT = Counter('ecms_requests_total', 'Requests by endpoint and status code',
+                        ['endpoint', 'method', 'status'])
+IN_FLIGHT = Gauge('ecms_requests_in_flight', 'Requests being served',
+                  ['endpoint'], multiprocess_mode='livesum')
+STORAGE_LATENCY = Histogram('ecms_storage_duration_seconds', 'Time spent reading and writing data files',
+                            ['operation', 'file'], buckets=STORAGE_BUCKETS)
+CACHE_LOOKUPS = Counter('ecms_cache_lookups_total', 'Cache lookups by result', ['cache', 'result'])
+JOB_DURATION = Histogram('ecms_scheduler_job_duration_seconds', 'Scheduled job run time',
+                         ['job'], buckets=STORAGE_BUCKETS)
+JOB_FAILURES = Counter('ecms_scheduler_job_failures_total', 'Scheduled job runs that raised', ['job'])
+
+
+def file_label(path):
+    """Data file name for a label; buffers and streams are grouped together"""
+    if isinstance(path, (str, os.PathLike)):
+        return os.path.basename(os.fspath(path))
+    return 'buffer'
+
+
+@contextmanager
+def storage_timer(operation, path=None):
+    started = time.perf_counter()
+    try:
+        # Also a tracing span, so slow requests show their storage calls
+        with span(operation, file=file_label(path)):
+            yield
+    finally:
+        STORAGE_LATENCY.labels(operation, file_label(path)).observe(time.perf_counter() - started)
+
+
+def count_cache(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_job(name, duration, failed):
+    JOB_DURATION.labels(name).observe(duration)
+    if failed:
+        JOB_FAILURES.labels(name).inc()
+
+
+def endpoint_label():
+    # Rule endpoint names, not raw paths, so complaint ids do not explode the label set
+    return request.endpoint or 'unmatched'
+
+
+def init_metrics(app):
+    """Instrument a Flask app and add the /metrics route"""
+    @app.before_request
+    def start_request_timer():
+        request.metrics_started = time.perf_counter()
+        request.metrics_endpoint = endpoint_label()
+        IN_FLIGHT.labels(request.metrics_endpoint).inc()
+
+    @app.after_request
+    def record_request(response):
+        endpoint = getattr(request, 'metrics_endpoint', None) or endpoint_label()
+        REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+        return response
+
+    @app.teardown_request
+    def finish_request_timer(error=None):
+        started = getattr(request, 'metrics_started', None)
+        if started is None:
+            return
+        REQUEST_LATENCY.labels(request.metrics_endpoint, request.method).observe(time.perf_counter() - started)
+        IN_FLIGHT.labels(request.metrics_endpoint).dec()
+
+    @app.route('/metrics')
+    def metrics():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        if METRICS_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
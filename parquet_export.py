@@ -0,0 +1,125 @@
+# parquet_export.py - Incremental, month-partitioned Parquet export for analytics
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+from complaint_merge import load_unified_complaints
+
+
+PARQUET_EXPORT_DIR = 'exports/complaints'
+MANIFEST_NAME = '_manifest.json'
+
+
+def load_manifest(export_dir):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {'watermark': '', 'partitions': {}}
+
+
+def save_manifest(export_dir, manifest):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def partition_key(submission_dates):
+    """'YYYY-MM' month of each submission date, 'unknown' if it has none"""
+    months = submission_dates.str.slice(0, 7)
+    return months.where(months.str.match(r'^\d{4}-\d{2}$'), 'unknown')
+
+
+def partition_hash(partition_df):
+    """Order-independent fingerprint of a partition's rows"""
+    return str(int(pd.util.hash_pandas_object(partition_df, index=False).sum() % (2 ** 63)))
+
+
+def export_parquet(export_dir=PARQUET_EXPORT_DIR, full=False):
+    """
+    Write complaints as export_dir/month=YYYY-MM/complaints.parquet and
+    rewrite only the months whose rows changed since the last run.
+
+    A month is rewritten when one of its rows was submitted or resolved
+    after the manifest watermark, or when its row fingerprint differs
+    from the one in the manifest (catches edits that do not touch either
+    timestamp, such as an assignment). Returns the list of months written.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = {'watermark': '', 'partitions': {}} if full else load_manifest(export_dir)
+    watermark = manifest.get('watermark', '')
+
+    complaints_df = load_unified_complaints()
+    months = partition_key(complaints_df['submission_date'])
+    # Dates are stored as 'YYYY-MM-DD HH:MM:SS' strings, so the latest
+    # change per row is a plain string max
+    changed_at = complaints_df[['submission_date', 'resolution_date']].max(axis=1)
+    touched_months = set(months[changed_at > watermark])
+
+    written = []
+    partitions = {}
+    for month, partition_df in complaints_df.groupby(months, sort=True):
+        fingerprint = partition_hash(partition_df)
+        previous = manifest['partitions'].get(month)
+        relative_path = os.path.join(f"month={month}", 'complaints.parquet')
+        path = os.path.join(export_dir, relative_path)
+
+        if (previous and previous['hash'] == fingerprint and month not in touched_months
+                and os.path.exists(path)):
+            partitions[month] = previous
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        partition_df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+        partitions[month] = {
+            'path': relative_path,
+            'rows': len(partition_df),
+            'hash': fingerprint,
+            'max_changed_at': str(changed_at[partition_df.index].max()),
+            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        written.append(month)
+
+    # Months that no longer have any complaints; a full export starts from
+    # an empty manifest, so it goes by the partition directories on disk
+    stale = set(manifest['partitions'])
+    if full:
+        stale.update(name[len('month='):] for name in os.listdir(export_dir)
+                     if name.startswith('month=') and os.path.isdir(os.path.join(export_dir, name)))
+    for month in stale - set(partitions):
+        shutil.rmtree(os.path.join(export_dir, f"month={month}"), ignore_errors=True)
+        written.append(month)
+
+    manifest = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'watermark': str(changed_at.max()) if len(changed_at) else watermark,
+        'row_count': len(complaints_df),
+        'partitions': partitions,
+    }
+    save_manifest(export_dir, manifest)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export complaints to month-partitioned Parquet")
+    parser.add_argument('--output', default=PARQUET_EXPORT_DIR, help="export directory")
+    parser.add_argument('--full', action='store_true', help="ignore the manifest and rewrite every month")
+    args = parser.parse_args()
+
+    written = export_parquet(args.output, full=args.full)
+    if written:
+        print(f"Rewrote {len(written)} partitions: {', '.join(sorted(written))}")
+    else:
+        print("No partitions changed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# point_in_time_restore.py - Rebuild data files as of a sequence number or time
+import argparse
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from backup_store import BACKUP_DIR, create_backup, decompress_file, list_backups
+from change_log import (CHANGE_LOG_FILE, ENTITIES, first_sequence, json_value, record_restore, replay_log,
+                        workbook_lock)
+
+
+def choose_snapshot(to_seq=None, to_time=None, backup_dir=BACKUP_DIR):
+    """Newest backup taken at or before the target, or None"""
+    for manifest in list_backups(backup_dir):
+        if 'change_seq' not in manifest:
+            continue
+        if to_seq is not None and manifest['change_seq'] > to_seq:
+            continue
+        if to_time is not None and manifest['created_at'] > to_time:
+            continue
+        return manifest
+    return None
+
+
+def load_snapshot_tables(manifest, backup_dir=BACKUP_DIR):
+    """Read the entity workbooks of a backup into {entity: {key: row}} plus their column order"""
+    tables, columns = {}, {}
+    temp_dir = tempfile.mkdtemp(prefix='ecms_restore_')
+    try:
+        for entity, config in ENTITIES.items():
+            entry = manifest['files'].get(config['file']) if manifest else None
+            if not entry:
+                continue
+            temp_path = os.path.join(temp_dir, os.path.basename(config['file']))
+            decompress_file(os.path.join(backup_dir, entry['object']), temp_path)
+            df = pd.read_excel(temp_path)
+            df[config['key']] = df[config['key']].astype(str).str.strip()
+            columns[entity] = list(df.columns)
+            tables[entity] = {row[config['key']]: {column: json_value(value) for column, value in row.items()}
+                              for row in df.to_dict('records')}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return tables, columns
+
+
+def restore_point_in_time(to_seq=None, to_time=None, output_dir='restored',
+                          backup_dir=BACKUP_DIR, log_file=CHANGE_LOG_FILE):
+    """
+    Rebuild the complaint, user, technician and voice complaint workbooks as they were at a
+    sequence number or timestamp: load the nearest earlier backup, then
+    replay the change log from the sequence number recorded with it.
+    Writes the workbooks to `output_dir` and returns a summary dict.
+    """
+    manifest = choose_snapshot(to_seq, to_time, backup_dir)
+    tables, columns = load_snapshot_tables(manifest, backup_dir)
+    base_seq = manifest['change_seq'] if manifest else 0
+    if first_sequence(log_file) > base_seq + 1:
+        raise ValueError("That point is older than the oldest backup and the change log "
+                         "before it has been compacted")
+    last_seq = replay_log(tables, base_seq, to_seq, to_time, log_file)
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for entity, config in ENTITIES.items():
+        rows = list(tables.get(entity, {}).values())
+        df = pd.DataFrame(rows)
+        if entity in columns:
+            df = df.reindex(columns=columns[entity] + [c for c in df.columns if c not in columns[entity]])
+        path = os.path.join(output_dir, os.path.basename(config['file']))
+        df.to_excel(path, index=False, engine='xlsxwriter')
+        written.append(path)
+
+    return {
+        'snapshot': manifest['backup_id'] if manifest else None,
+        'snapshot_seq': base_seq,
+        'restored_to_seq': last_seq,
+        'files': written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point-in-time restore from the backups and change log")
+    parser.add_argument('--seq', type=int, help="restore up to and including this sequence number")
+    parser.add_argument('--at', help="restore to this time ('YYYY-MM-DD HH:MM:SS')")
+    parser.add_argument('--output', default='restored', help="directory for the restored workbooks")
+    parser.add_argument('--apply', action='store_true',
+                        help="back up the current data, then replace it with the restored workbooks")
+    args = parser.parse_args()
+    if args.seq is None and args.at is None:
+        parser.error("give --seq or --at")
+
+    summary = restore_point_in_time(args.seq, args.at, args.output)
+    print(f"Snapshot {summary['snapshot'] or '(none, replayed from the start)'} at seq "
+          f"{summary['snapshot_seq']}, replayed to seq {summary['restored_to_seq']}")
+    if args.apply:
+        print(f"Current data backed up as {create_backup()['backup_id']}")
+        for entity, config in ENTITIES.items():
+            # Copied next to the workbook and renamed over it, so readers
+            # never see a half-copied file
+            temp_path = f"{config['file']}.restoring"
+            shutil.copy(os.path.join(args.output, os.path.basename(config['file'])), temp_path)
+            with workbook_lock(config['file']):
+                os.replace(temp_path, config['file'])
+                record_restore(config['file'])
+            print(f"Restored {config['file']}")
+    else:
+        for path in summary['files']:
+            print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
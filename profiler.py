@@ -0,0 +1,254 @@
+# profiler.py - On-demand request profiling and tracemalloc snapshots for admins
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+
+
+PROFILE_DIR = 'data/profiles'
+SAMPLE_INTERVAL = 0.005
+MAX_REQUESTS = 100
+# tracemalloc snapshots kept in memory, oldest dropped first
+MAX_SNAPSHOTS = 10
+MEMORY_DIFF_LINES = 25
+
+
+class StackSampler:
+    """Samples one thread's stack on a timer and counts the collapsed stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+class ProfilingMiddleware:
+    """
+    WSGI wrapper installed only while a profiling run is active
+
+    Requests to the chosen endpoint are profiled one at a time (cProfile
+    can only follow one thread); requests that arrive while one is being
+    profiled, or that go to other endpoints, pass straight through.
+    """
+
+    def __init__(self, profiler, app, wsgi_app):
+        self.profiler = profiler
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.busy = threading.Lock()
+
+    def endpoint(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except Exception:
+            return None
+
+    def __call__(self, environ, start_response):
+        run = self.profiler.run
+        if run is None or self.endpoint(environ) != run['endpoint'] or not self.busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            started = time.perf_counter()
+            if run['mode'] == 'cprofile':
+                profile = cProfile.Profile()
+                body = profile.runcall(self.respond, environ, start_response)
+                self.profiler.add_profile(profile, time.perf_counter() - started)
+            else:
+                with StackSampler(threading.get_ident()) as sampler:
+                    body = self.respond(environ, start_response)
+                self.profiler.add_samples(sampler.stacks, time.perf_counter() - started)
+            return [body]
+        finally:
+            self.busy.release()
+
+    def respond(self, environ, start_response):
+        # Read the whole body here so the time spent streaming it is profiled too
+        result = self.wsgi_app(environ, start_response)
+        try:
+            return b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+class Profiler:
+    """
+    Profiles the next N requests to one endpoint
+
+    Nothing is hooked into the app until start() is called: it wraps
+    app.wsgi_app, and the original is put back when the run finishes or
+    is stopped, so a disabled profiler costs nothing per request.
+    """
+
+    def __init__(self, profile_dir=PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        self.app = None
+        self.original_wsgi_app = None
+        self.run = None
+        self.last_result = None
+        self.snapshots = {}
+
+    def start(self, app, endpoint, requests=10, mode='cprofile'):
+        if mode not in ('cprofile', 'sampler'):
+            raise ValueError("mode must be 'cprofile' or 'sampler'")
+        if endpoint not in app.view_functions:
+            raise ValueError(f"Unknown endpoint '{endpoint}'")
+        requests = max(1, min(int(requests), MAX_REQUESTS))
+        with self.lock:
+            if self.run is not None:
+                raise ValueError(f"Already profiling '{self.run['endpoint']}'")
+            self.run = {
+                'id': f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}",
+                'endpoint': endpoint, 'mode': mode, 'requested': requests, 'done': 0,
+                'total_seconds': 0.0, 'stats': None, 'stacks': Counter(),
+            }
+            self.app = app
+            self.original_wsgi_app = app.wsgi_app
+            app.wsgi_app = ProfilingMiddleware(self, app, app.wsgi_app)
+            return self.status()
+
+    def add_profile(self, profile, seconds):
+        with self.lock:
+            run = self.run
+            if run is None:
+                return
+            if run['stats'] is None:
+                run['stats'] = pstats.Stats(profile)
+            else:
+                run['stats'].add(profile)
+            self.count_request(run, seconds)
+
+    def add_samples(self, stacks, seconds):
+        with self.lock:
+            run = self.run
+            if run is None:
+                return
+            run['stacks'].update(stacks)
+            self.count_request(run, seconds)
+
+    def count_request(self, run, seconds):
+        run['done'] += 1
+        run['total_seconds'] += seconds
+        if run['done'] >= run['requested']:
+            self.finish()
+
+    def finish(self):
+        """Save the output and unhook; call with the lock held"""
+        run = self.run
+        if run is None:
+            return
+        self.app.wsgi_app = self.original_wsgi_app
+        self.run = None
+        if not run['done']:
+            self.last_result = None
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if run['mode'] == 'cprofile':
+            filename = f"{run['id']}_{run['endpoint']}.pstats"
+            run['stats'].dump_stats(os.path.join(self.profile_dir, filename))
+        else:
+            # Collapsed stacks, the input format of flamegraph.pl and speedscope
+            filename = f"{run['id']}_{run['endpoint']}.folded"
+            with open(os.path.join(self.profile_dir, filename), 'w', encoding='utf-8') as f:
+                for stack, count in run['stacks'].most_common():
+                    f.write(f"{stack} {count}\n")
+        self.last_result = {
+            'file': filename, 'endpoint': run['endpoint'], 'mode': run['mode'],
+            'requests': run['done'], 'avg_ms': round(run['total_seconds'] / run['done'] * 1000, 2),
+        }
+
+    def stop(self):
+        with self.lock:
+            self.finish()
+            return self.last_result
+
+    def status(self):
+        run = self.run
+        files = sorted(os.listdir(self.profile_dir), reverse=True) if os.path.isdir(self.profile_dir) else []
+        return {
+            'active': None if run is None else {key: run[key] for key in ('id', 'endpoint', 'mode', 'requested', 'done')},
+            'last_result': self.last_result,
+            'files': files,
+            'tracemalloc': tracemalloc.is_tracing(),
+            'snapshots': list(self.snapshots),
+        }
+
+    def profile_path(self, filename):
+        """Path of a saved profile, or None if there is no such file"""
+        path = os.path.join(self.profile_dir, os.path.basename(filename))
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def top_functions(filename, limit=30):
+        """Text summary of a .pstats file, sorted by cumulative time"""
+        out = io.StringIO()
+        pstats.Stats(filename, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    # tracemalloc hooks. Tracing slows every allocation, so it only runs
+    # between memory_start() and memory_stop().
+
+    def memory_start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def memory_stop(self):
+        tracemalloc.stop()
+        self.snapshots = {}
+
+    def memory_snapshot(self, label=None):
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not running")
+        label = label or datetime.now().strftime('%H%M%S')
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        with self.lock:
+            self.snapshots[label] = snapshot
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                del self.snapshots[next(iter(self.snapshots))]
+        current, peak = tracemalloc.get_traced_memory()
+        return {'label': label, 'current_kb': current // 1024, 'peak_kb': peak // 1024}
+
+    def memory_diff(self, before, after, limit=MEMORY_DIFF_LINES):
+        """Source lines whose allocations grew the most between two snapshots"""
+        if before not in self.snapshots or after not in self.snapshots:
+            raise ValueError("Unknown snapshot label")
+        differences = self.snapshots[after].compare_to(self.snapshots[before], 'lineno')
+        return [{'location': str(stat.traceback), 'size_diff_kb': round(stat.size_diff / 1024, 1),
+                 'size_kb': round(stat.size / 1024, 1), 'count_diff': stat.count_diff}
+                for stat in differences[:limit]]
+
+
+profiler = Profiler()
@@ -0,0 +1,195 @@
+# report_cache.py - Background Excel report builds with a versioned artifact cache
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from complaint_merge import SOURCES, file_version, unified_view
+from excel_handler import write_report_excel_streaming
+from metrics import count_cache
+
+
+REPORT_CACHE_DIR = 'data/report_cache'
+# Stale artifacts are removed once older than this...
+REPORT_MAX_AGE_SECONDS = 24 * 60 * 60
+# ...or, oldest first, while the cache is larger than this
+REPORT_MAX_CACHE_BYTES = 200 * 1024 * 1024
+# A queued or running job not heard from for this long died with its worker
+REPORT_JOB_TIMEOUT_SECONDS = 10 * 60
+
+os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+
+
+def version_hash(versions):
+    """Short hash of {source: file version} for the complaint workbooks"""
+    parts = [f"{config['file']}:{versions.get(source)}" for source, config in SOURCES.items()]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def complaint_data_version():
+    """Short hash identifying the current contents of the complaint workbooks"""
+    return version_hash({source: file_version(config['file']) for source, config in SOURCES.items()})
+
+
+def report_path(version):
+    return os.path.join(REPORT_CACHE_DIR, f"complaints_report_{version}.xlsx")
+
+
+def job_path(version):
+    return os.path.join(REPORT_CACHE_DIR, f"complaints_report_{version}.json")
+
+
+def read_job(version):
+    try:
+        with open(job_path(version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_job(job):
+    # Next to the artifact, so every worker sees builds started by the others
+    path = job_path(job['version'])
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    os.replace(temp_path, path)
+
+
+def job_active(job):
+    return (job is not None and job['status'] in ('queued', 'running')
+            and time.time() - job.get('updated', 0) < REPORT_JOB_TIMEOUT_SECONDS)
+
+
+class ReportBuilder:
+    """
+    Builds report artifacts on a background thread, one per data version
+    Job state is kept in a JSON file beside the artifact, so any worker
+    can report on (and avoids repeating) a build another one started.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report-builder')
+        self.lock = threading.Lock()
+
+    def status(self, version=None):
+        """Build state for a data version (the current one by default)"""
+        version = version or complaint_data_version()
+        if os.path.exists(report_path(version)):
+            return {'version': version, 'status': 'done', 'progress': 100, 'stage': 'Ready'}
+        job = read_job(version)
+        if job and (job['status'] == 'failed' or job_active(job)):
+            return job
+        return {'version': version, 'status': 'missing', 'progress': 0, 'stage': 'Not built'}
+
+    def request(self):
+        """
+        Return (version, path) if the report for the current data is cached,
+        otherwise start building it and return (version, None)
+        """
+        version = complaint_data_version()
+        path = report_path(version)
+        count_cache('report', os.path.exists(path))
+        if os.path.exists(path):
+            # Touch so age-based eviction keeps reports that are still used
+            os.utime(path)
+            return version, path
+
+        with self.lock:
+            if job_active(read_job(version)):
+                return version, None
+            write_job({'version': version, 'status': 'queued', 'progress': 0,
+                       'stage': 'Waiting to start', 'error': None, 'updated': time.time()})
+        self.executor.submit(self.build, version)
+        return version, None
+
+    def update_job(self, versions, **fields):
+        """Update the job files of every version this build answers for"""
+        with self.lock:
+            for version in versions:
+                job = read_job(version) or {'version': version, 'error': None}
+                job.update(fields, updated=time.time())
+                write_job(job)
+
+    def build(self, requested_version):
+        versions = [requested_version]
+        path = temp_path = None
+        started = time.perf_counter()
+        try:
+            self.update_job(versions, status='running', progress=5, stage='Loading complaints')
+            # The version is taken from the same read as the rows, so the
+            # artifact is filed under the data it actually holds
+            complaints_df, source_versions = unified_view.versioned_table()
+            version = version_hash(source_versions)
+            if version != requested_version:
+                versions.append(version)
+            path = report_path(version)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+
+            def on_progress(rows_written, total_rows):
+                done = rows_written / total_rows if total_rows else 1
+                self.update_job(versions, progress=10 + int(done * 85),
+                                stage=f'Writing rows ({rows_written}/{total_rows})')
+
+            write_report_excel_streaming(complaints_df, temp_path, progress=on_progress)
+            os.replace(temp_path, path)
+            self.update_job(versions, status='done', progress=100, stage='Ready',
+                            seconds=round(time.perf_counter() - started, 2))
+        except Exception as e:
+            print(f"Error building report {requested_version}: {e}")
+            self.update_job(versions, status='failed', stage='Failed', error=str(e))
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+        finally:
+            evict_stale_reports(keep_version=versions[-1])
+
+
+def evict_stale_reports(keep_version=None, max_age=REPORT_MAX_AGE_SECONDS,
+                        max_bytes=REPORT_MAX_CACHE_BYTES):
+    """Remove cached reports by age, then oldest first until under the size cap"""
+    keep = report_path(keep_version) if keep_version else None
+    now = time.time()
+    artifacts = []
+    for name in os.listdir(REPORT_CACHE_DIR):
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        if name.endswith('.json') and not os.path.exists(path[:-len('.json')] + '.xlsx'):
+            # Job files without an artifact (failed or superseded builds) only age out
+            try:
+                if now - os.stat(path).st_mtime > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+            continue
+        if not name.endswith('.xlsx') or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if now - stat.st_mtime > max_age:
+            remove_report(path)
+        else:
+            artifacts.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in artifacts)
+    if keep and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(artifacts):
+        if total <= max_bytes:
+            break
+        remove_report(path)
+        total -= size
+
+
+def remove_report(path):
+    """Remove an artifact and its job file"""
+    for name in (path, path[:-len('.xlsx')] + '.json'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+report_builder = ReportBuilder()
@@ -0,0 +1,254 @@
+# scheduler.py - In-process scheduler for periodic maintenance jobs
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metrics import observe_job
+from tracing import span
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process lock, every process runs its jobs
+    fcntl = None
+
+
+SCHEDULER_LOCK_FILE = 'data/scheduler.lock'
+SCHEDULER_WORKERS = 2
+# How often a process that is not the leader tries to take over
+LEADER_RETRY_SECONDS = 30
+# Ranges of the five cron fields: minute hour day-of-month month day-of-week
+CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def parse_cron_field(field, low, high):
+    """'*', '5', '1-5', '*/15', '10-50/10' or a comma list of those -> set of values"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression):
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression '{expression}' needs 5 fields")
+    parsed = [parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES)]
+    # As in cron, when both day fields are restricted either one may match
+    parsed.append((fields[2] != '*', fields[4] != '*'))
+    return parsed
+
+
+def next_cron_time(cron, after):
+    """First minute strictly after `after` that matches a parsed cron expression"""
+    minutes, hours, days, months, weekdays, (days_set, weekdays_set) = cron
+    when = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = when + timedelta(days=366 * 5)
+    while when < limit:
+        if when.month not in months:
+            when = (when.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        day_match = when.day in days
+        weekday_match = (when.weekday() + 1) % 7 in weekdays
+        if days_set and weekdays_set:
+            day_ok = day_match or weekday_match
+        else:
+            day_ok = day_match and weekday_match
+        if not day_ok:
+            when = when.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if when.hour not in hours:
+            when = when.replace(minute=0) + timedelta(hours=1)
+            continue
+        if when.minute not in minutes:
+            when += timedelta(minutes=1)
+            continue
+        return when
+    raise ValueError("Cron expression never matches")
+
+
+class Job:
+    def __init__(self, name, func, interval=None, cron=None, jitter=0, leader_only=True):
+        if (interval is None) == (cron is None):
+            raise ValueError(f"Job '{name}' needs exactly one of interval or cron")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = parse_cron(cron) if cron else None
+        self.jitter = jitter
+        # Jobs that write shared files run in one process only; jobs that
+        # warm a process's own memory run in every process
+        self.leader_only = leader_only
+        self.running = False
+        self.metrics = {'runs': 0, 'failures': 0, 'skipped': 0, 'last_started': None,
+                        'last_duration': None, 'total_duration': 0.0, 'max_duration': 0.0,
+                        'last_error': None}
+
+    def next_run(self, now):
+        if self.cron:
+            when = next_cron_time(self.cron, datetime.fromtimestamp(now)).timestamp()
+        else:
+            when = now + self.interval
+        # Spread runs out so processes and jobs do not all fire together
+        return when + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    """
+    Runs registered jobs on intervals or cron expressions
+
+    One thread waits for the next due time in a heap of (time, job) and
+    hands due jobs to a small thread pool; a job still running from its
+    last turn is skipped rather than started twice. Under gunicorn every
+    worker runs a scheduler, and an exclusive lock on SCHEDULER_LOCK_FILE
+    decides which one runs the leader-only jobs; if that worker exits the
+    lock is released and another worker takes over.
+    """
+
+    def __init__(self, lock_file=SCHEDULER_LOCK_FILE, workers=SCHEDULER_WORKERS):
+        self.lock_file = lock_file
+        self.workers = workers
+        self.jobs = {}
+        self.heap = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.executor = None
+        self.lock_handle = None
+        self.leader_checked = 0
+
+    def add_job(self, name, func, interval=None, cron=None, jitter=0, leader_only=True):
+        job = Job(name, func, interval, cron, jitter, leader_only)
+        with self.lock:
+            self.jobs[name] = job
+            heapq.heappush(self.heap, (job.next_run(time.time()), name))
+        self.wake.set()
+        return job
+
+    def is_leader(self):
+        if fcntl is None or self.lock_handle is not None:
+            return True
+        now = time.monotonic()
+        if now - self.leader_checked < LEADER_RETRY_SECONDS:
+            return False
+        self.leader_checked = now
+        handle = open(self.lock_file, 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        # Held for the life of the process
+        self.lock_handle = handle
+        return True
+
+    def run_job(self, job):
+        started = time.perf_counter()
+        job.metrics['last_started'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        failed = False
+        try:
+            with span(f"job {job.name}"):
+                job.func()
+        except Exception as e:
+            print(f"Error in scheduled job {job.name}: {e}")
+            failed = True
+            with self.lock:
+                job.metrics['failures'] += 1
+                job.metrics['last_error'] = str(e)
+        finally:
+            duration = time.perf_counter() - started
+            observe_job(job.name, duration, failed)
+            with self.lock:
+                job.running = False
+                job.metrics['runs'] += 1
+                job.metrics['last_duration'] = round(duration, 4)
+                job.metrics['total_duration'] += duration
+                job.metrics['max_duration'] = max(job.metrics['max_duration'], duration)
+
+    def run_due(self, now):
+        """Start the jobs that are due and return seconds until the next one"""
+        with self.lock:
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                _, name = heapq.heappop(self.heap)
+                job = self.jobs[name]
+                heapq.heappush(self.heap, (job.next_run(now), name))
+                due.append(job)
+            wait = self.heap[0][0] - now if self.heap else LEADER_RETRY_SECONDS
+
+        leader = None
+        for job in due:
+            if job.leader_only:
+                if leader is None:
+                    leader = self.is_leader()
+                if not leader:
+                    continue
+            with self.lock:
+                if job.running:
+                    job.metrics['skipped'] += 1
+                    continue
+                job.running = True
+            self.executor.submit(self.run_job, job)
+        return wait
+
+    def loop(self):
+        while not self.stopped.is_set():
+            try:
+                wait = self.run_due(time.time())
+            except Exception as e:
+                print(f"Error in scheduler: {e}")
+                wait = LEADER_RETRY_SECONDS
+            self.wake.wait(timeout=max(0.1, min(wait, LEADER_RETRY_SECONDS)))
+            self.wake.clear()
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        os.makedirs(os.path.dirname(self.lock_file) or '.', exist_ok=True)
+        self.stopped.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler')
+        self.thread = threading.Thread(target=self.loop, name='scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    def status(self):
+        """Per-job schedule and duration metrics"""
+        with self.lock:
+            next_runs = {name: when for when, name in self.heap}
+            return {
+                'leader': self.lock_handle is not None or fcntl is None,
+                'jobs': {
+                    name: dict(job.metrics,
+                               total_duration=round(job.metrics['total_duration'], 4),
+                               max_duration=round(job.metrics['max_duration'], 4),
+                               running=job.running,
+                               leader_only=job.leader_only,
+                               next_run=datetime.fromtimestamp(next_runs[name]).strftime('%Y-%m-%d %H:%M:%S'))
+                    for name, job in self.jobs.items()
+                },
+            }
+
+
+scheduler = Scheduler()
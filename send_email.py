@@ -2,7 +2,9 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import speech_recognition as sr
+from tracing import traced
 
+@traced()
 def send_email_smtp(sender_email, receiver_email, subject, message, password, smtp_server="smtp.gmail.com", smtp_port=587, html_message=None):
     """
     Send an email using SMTP protocol.
@@ -0,0 +1,185 @@
+# sla_engine.py - Resolution deadlines, overdue escalation and resolution-time stats
+import heapq
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from complaint_merge import unified_view
+from dispatch import complaint_priority
+from metrics import count_cache
+from technician_queues import normalise_status
+
+
+SLA_ESCALATION_FILE = 'data/sla_escalations.ndjson'
+# Resolution targets by priority rank (0 high, 1 medium, 2 low)...
+SLA_TARGET_HOURS = {0: 8, 1: 48, 2: 120}
+# ...unless the contract sets one for the category
+CATEGORY_SLA_HOURS = {
+    'power outage': 4,
+    'voltage issue': 12,
+    'voltage fluctuation': 12,
+    'billing issue': 168,
+}
+STATS_PERCENTILES = [50, 90, 99]
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def sla_hours(priority, category):
+    hours = CATEGORY_SLA_HOURS.get(str(category).strip().lower())
+    return hours if hours is not None else SLA_TARGET_HOURS[complaint_priority(priority, category)]
+
+
+def resolution_stats(table):
+    """p50/p90/p99 hours from submission to resolution, per category"""
+    submitted = pd.to_datetime(table['submission_date'], errors='coerce')
+    resolved = pd.to_datetime(table['resolution_date'], errors='coerce')
+    hours = (resolved - submitted).dt.total_seconds().to_numpy() / 3600
+    valid = ~np.isnan(hours) & (hours >= 0)
+    hours = hours[valid]
+    categories = table['category'].to_numpy()[valid]
+    stats = {}
+    if not len(hours):
+        return stats
+    # Sort once by category, then each category is a contiguous slice
+    order = np.argsort(categories, kind='stable')
+    categories, hours = categories[order], hours[order]
+    names, starts = np.unique(categories, return_index=True)
+    ends = np.append(starts[1:], len(categories))
+    for name, start, end in zip(names, starts, ends):
+        values = np.percentile(hours[start:end], STATS_PERCENTILES)
+        stats[name or 'Uncategorised'] = dict(
+            {'count': int(end - start)},
+            **{f"p{p}": round(float(v), 2) for p, v in zip(STATS_PERCENTILES, values)})
+    return stats
+
+
+class SLAEngine:
+    """
+    Tracks the resolution deadline of every unresolved complaint
+
+    Deadlines sit in a min-heap of (due, complaint_id); `deadlines` holds
+    each complaint's current due time, so a resolved or re-dated complaint
+    leaves a stale heap entry that is skipped when it reaches the top.
+    Checking for breaches only pops entries that are already due.
+    """
+
+    def __init__(self, escalation_file=SLA_ESCALATION_FILE):
+        self.escalation_file = escalation_file
+        self.lock = threading.Lock()
+        # Complaints escalated before, by this or another process, so they
+        # are not escalated twice
+        self.escalated = set()
+        self.escalations_read = 0
+        self.stats_cache = (None, None)
+        self.clear()
+
+    def clear(self):
+        self.heap = []
+        self.deadlines = {}
+        self.rows = {}
+        self.synced_rows = 0
+        self.synced_updates = 0
+        self.synced_generation = None
+
+    def track(self, complaint_id, status, priority, category, submitted):
+        submitted_at = parse_time(submitted)
+        if normalise_status(status) == 'resolved' or submitted_at is None:
+            self.deadlines.pop(complaint_id, None)
+            return
+        due = submitted_at + timedelta(hours=sla_hours(priority, category))
+        if self.deadlines.get(complaint_id) != due:
+            self.deadlines[complaint_id] = due
+            heapq.heappush(self.heap, (due, complaint_id))
+
+    def track_rows(self, table, positions):
+        rows_df = table.iloc[positions]
+        for position, complaint_id, status, priority, category, submitted in zip(
+                positions, rows_df['complaint_id'], rows_df['status'], rows_df['priority'],
+                rows_df['category'], rows_df['submission_date']):
+            if complaint_id:
+                self.rows[complaint_id] = position
+                self.track(complaint_id, status, priority, category, submitted)
+
+    def sync(self, view=unified_view):
+        """Catch up with complaints added to or changed in the unified view"""
+        table = view.refresh()
+        with self.lock:
+            updated, update_seq = view.updates_since(self.synced_updates)
+            if self.synced_generation != view.generation or updated is None:
+                # Rebuilt, or too far behind the view's updates: start again
+                self.clear()
+                self.synced_generation = view.generation
+                updated = []
+            if len(table) > self.synced_rows:
+                self.track_rows(table, range(self.synced_rows, len(table)))
+                self.synced_rows = len(table)
+            if updated:
+                self.track_rows(table, sorted({self.rows[key] for key in updated if key in self.rows}))
+            self.synced_updates = update_seq
+        return table
+
+    def load_escalations(self):
+        """Read escalations appended to the file since the last read"""
+        if not os.path.exists(self.escalation_file):
+            return
+        with open(self.escalation_file, 'rb') as f:
+            f.seek(self.escalations_read)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.escalated.add(json.loads(line)['complaint_id'])
+                self.escalations_read += len(line)
+
+    def check(self, now=None):
+        """Escalate complaints that went overdue since the last check"""
+        table = self.sync()
+        now = now or datetime.now()
+        escalations = []
+        with self.lock:
+            self.load_escalations()
+            while self.heap and self.heap[0][0] <= now:
+                due, complaint_id = heapq.heappop(self.heap)
+                if self.deadlines.get(complaint_id) != due:
+                    continue
+                del self.deadlines[complaint_id]
+                if complaint_id in self.escalated:
+                    continue
+                self.escalated.add(complaint_id)
+                row = table.iloc[self.rows[complaint_id]]
+                escalations.append({
+                    'complaint_id': complaint_id,
+                    'category': row['category'],
+                    'status': row['status'],
+                    'assigned_to': row['assigned_to'],
+                    'due': due.strftime('%Y-%m-%d %H:%M:%S'),
+                    'escalated_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+                })
+            if escalations:
+                with open(self.escalation_file, 'a', encoding='utf-8') as f:
+                    for escalation in escalations:
+                        f.write(json.dumps(escalation) + '\n')
+        return escalations
+
+    def stats(self, view=unified_view):
+        """Resolution-time percentiles, recomputed only when complaints changed"""
+        table = self.sync(view)
+        version = (view.generation, len(table), view.update_seq)
+        cached_version, cached = self.stats_cache
+        count_cache('sla_stats', cached_version == version)
+        if cached_version != version:
+            cached = resolution_stats(table)
+            self.stats_cache = (version, cached)
+        return cached
+
+
+sla_engine = SLAEngine()
@@ -0,0 +1,322 @@
+import re
+from bisect import bisect_right
+from collections import Counter
+
+
+# Words the recogniser returns for spoken digits and letters of a complaint ID
+SPOKEN_DIGITS = {
+    "zero": "0", "nil": "0",
+    "one": "1",
+    "two": "2",
+    "three": "3", "tree": "3",
+    "four": "4",
+    "five": "5",
+    "six": "6",
+    "seven": "7",
+    "eight": "8",
+    "nine": "9",
+}
+
+# Homophones of digits that are also everyday words ("I want to check it
+# for you"); they only count as digits between other parts of the ID
+AMBIGUOUS_DIGITS = {
+    "oh": "0",
+    "won": "1",
+    "to": "2", "too": "2",
+    "for": "4", "fore": "4",
+    "ate": "8",
+}
+
+SPOKEN_LETTERS = {
+    "e": "E", "ee": "E", "ea": "E",
+    "c": "C", "see": "C", "sea": "C", "cee": "C", "si": "C",
+    "ec": "EC",
+}
+
+REPEATS = {"double": 2, "triple": 3}
+
+
+def normalise_spoken_id(text):
+    """Turn a transcript like 'E C two zero double five' into 'EC2055'"""
+    if not text:
+        return ""
+
+    tokens = re.findall(r"[a-z]+|\d+", str(text).lower())
+
+    # Which tokens are part of the ID; other single letters ("X" in "E C
+    # two X five") only next to those, as "I" and "a" are words too, and
+    # runs of homophones only with ID tokens on both sides ("two to five",
+    # not "want to check")
+    core = [token.isdigit() or token in SPOKEN_DIGITS or token in SPOKEN_LETTERS or token in REPEATS
+            for token in tokens]
+    in_id = [wanted or (len(token) == 1 and token not in AMBIGUOUS_DIGITS
+                        and ((i > 0 and core[i - 1]) or (i + 1 < len(tokens) and core[i + 1])))
+             for i, (token, wanted) in enumerate(zip(tokens, core))]
+    start = None
+    for i, token in enumerate(tokens + [""]):
+        if token in AMBIGUOUS_DIGITS:
+            if start is None:
+                start = i
+            continue
+        if start is not None:
+            if start > 0 and i < len(tokens) and in_id[start - 1] and in_id[i]:
+                in_id[start:i] = [True] * (i - start)
+            start = None
+
+    result = []
+    repeat = 1
+    for token, wanted in zip(tokens, in_id):
+        if not wanted:
+            # Filler words such as "my", "id", "is", "number", "to"
+            continue
+        if token in REPEATS:
+            repeat = REPEATS[token]
+            continue
+
+        if token.isdigit():
+            piece = token
+        elif token in SPOKEN_DIGITS:
+            piece = SPOKEN_DIGITS[token]
+        elif token in AMBIGUOUS_DIGITS:
+            piece = AMBIGUOUS_DIGITS[token]
+        elif token in SPOKEN_LETTERS:
+            piece = SPOKEN_LETTERS[token]
+        else:
+            piece = token.upper()
+
+        # "double five" repeats a single following character
+        if repeat > 1 and len(piece) >= 1:
+            piece = piece[0] * repeat + piece[1:]
+        repeat = 1
+        result.append(piece)
+
+    return "".join(result)
+
+
+def bounded_levenshtein(a, b, max_distance):
+    """Edit distance between a and b, or max_distance + 1 when it is larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Matching ends cost nothing; IDs share long prefixes ("EC2025...")
+    start = 0
+    limit = min(len(a), len(b))
+    while start < limit and a[start] == b[start]:
+        start += 1
+    end = 0
+    limit -= start
+    while end < limit and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(max(len(a), len(b)), max_distance + 1)
+
+    # Myers' bit-parallel algorithm: bit i of `plus`/`minus` says whether
+    # the distance goes up or down between rows i and i + 1 of the column
+    over = max_distance + 1
+    columns = {}
+    for i, char in enumerate(a):
+        columns[char] = columns.get(char, 0) | 1 << i
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    plus, minus, distance = full, 0, len(a)
+    remaining = len(b)
+    for char in b:
+        match = columns.get(char, 0)
+        vertical = match | minus
+        horizontal = (((match & plus) + plus) ^ plus) | match
+        up = minus | (full & ~(horizontal | plus))
+        down = plus & horizontal
+        if up & last:
+            distance += 1
+        elif down & last:
+            distance -= 1
+        remaining -= 1
+        if distance - remaining > max_distance:
+            # Each remaining character lowers the distance by one at most
+            return over
+        up = (up << 1) | 1
+        down <<= 1
+        plus = down | (full & ~(vertical | up))
+        minus = up & vertical
+    return min(distance, over)
+
+
+def positional_grams(text, size=3):
+    """Overlapping (position, gram) pairs of text"""
+    if len(text) < size:
+        return [(0, text)] if text else []
+    return [(i, text[i:i + size]) for i in range(len(text) - size + 1)]
+
+
+def edits_to_destroy(positions, size, insertions=0):
+    """
+    Fewest edits that can destroy every gram starting at `positions`,
+    when at least `insertions` of them are insertions
+
+    Replacing or deleting a character destroys the grams covering it;
+    inserting between two characters only those covering both, which is
+    why a query shorter than an ID is held to a tighter bound.
+    """
+    positions = sorted(positions)
+
+    def fewest(i, insertions):
+        # Edits for positions[i:], each reaching as far right as it can
+        if i == len(positions):
+            return insertions
+        reach = positions[i] + size - 1
+        replaced = fewest(bisect_right(positions, reach, i), insertions)
+        if not insertions:
+            return 1 + replaced
+        return 1 + min(replaced, fewest(bisect_right(positions, reach - 1, i), insertions - 1))
+
+    return fewest(0, insertions)
+
+
+class ComplaintIdIndex:
+    """
+    In-memory complaint ID index with exact and fuzzy spoken-ID lookup
+
+    Fuzzy matches come from a positional trigram index. A candidate ID has
+    to share enough grams with the query to be within max_distance edits
+    (the q-gram count filter); the survivors are checked fewest missing
+    grams first, and only those the missing grams' positions and the
+    difference in length still allow reach the exact edit-distance check.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, prefix="EC"):
+        self.prefix = prefix
+        self.records = {}
+        self.grams = {}
+        # ID length -> number of IDs that long
+        self.lengths = Counter()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, complaint_id, record):
+        key = str(complaint_id).strip().upper()
+        if not key:
+            return
+        if key not in self.records:
+            for gram in positional_grams(key, self.GRAM_SIZE):
+                self.grams.setdefault(gram, set()).add(key)
+            self.lengths[len(key)] += 1
+        self.records[key] = record
+
+    def clear(self):
+        self.records = {}
+        self.grams = {}
+        self.lengths = Counter()
+
+    def _fuzzy_matches(self, query, max_distance):
+        """Return (distance, complaint_id) pairs within max_distance"""
+        # Grams shared by many IDs (the "EC2025" prefix, the month) say
+        # little about which complaint was meant, so the rarest are
+        # counted, and more only while max_distance edits could still
+        # destroy every counted gram of a close ID
+        longer = [length - len(query) for length in self.lengths if abs(length - len(query)) <= max_distance]
+        if not longer:
+            return []
+        # A gram moves by the insertions less the deletions before it, and
+        # an ID `d` characters longer needs d more insertions than deletions
+        shifts = range(-((max_distance - min(longer)) // 2), (max_distance + max(longer)) // 2 + 1)
+        postings = []
+        for position, gram in positional_grams(query, self.GRAM_SIZE):
+            shifted = [self.grams[key] for key in ((position + shift, gram) for shift in shifts)
+                       if key in self.grams]
+            postings.append((sum(len(posting) for posting in shifted), position, shifted))
+        postings.sort(key=lambda entry: entry[:2])
+
+        stop_size = max(32, len(self.records) // 20)
+        counted = []
+        for size, position, shifted in postings:
+            if size > stop_size and edits_to_destroy([p for p, _ in counted], self.GRAM_SIZE) > max_distance:
+                break
+            counted.append((position, shifted[0] if len(shifted) == 1 else set().union(*shifted)))
+
+        if edits_to_destroy([position for position, _ in counted], self.GRAM_SIZE) <= max_distance:
+            # Too short to filter; every ID of a close enough length is checked
+            counted = []
+            candidates = [(0, complaint_id) for complaint_id in self.records
+                          if abs(len(complaint_id) - len(query)) <= max_distance]
+        else:
+            counts = Counter()
+            for _, gram_set in counted:
+                counts.update(gram_set)
+            # An edit destroys at most GRAM_SIZE grams, an insertion one fewer
+            needed = len(counted) - max_distance * self.GRAM_SIZE + max(min(longer), 0)
+            candidates = sorted((len(counted) - shared, complaint_id)
+                                for complaint_id, shared in counts.items() if shared >= needed)
+        return self._closest(query, candidates, counted, max_distance)
+
+    def _closest(self, query, candidates, counted, max_distance):
+        """
+        Edit-distance check of (missing grams, complaint_id) candidates,
+        fewest missing first, against the (position, IDs) grams counted
+        """
+        best = max_distance
+        matches = []
+        bounds = {}
+        for missing_count, complaint_id in candidates:
+            if -(-missing_count // self.GRAM_SIZE) > best:
+                # No later candidate can be closer
+                break
+            longer = len(complaint_id) - len(query)
+            if missing_count > best * self.GRAM_SIZE - max(longer, 0):
+                continue
+            # Tighter lower bound: the edits needed to destroy the grams
+            # this ID misses, where they are, and the difference in length
+            missing = tuple([position for position, gram_set in counted if complaint_id not in gram_set])
+            bound = bounds.get((missing, longer))
+            if bound is None:
+                # A longer ID needs insertions into the query, a shorter one deletions
+                bound = bounds[missing, longer] = max(-longer, edits_to_destroy(
+                    missing, self.GRAM_SIZE, max(longer, 0)))
+            if bound > best:
+                continue
+            distance = bounded_levenshtein(query, complaint_id, best)
+            if distance <= best:
+                # Later candidates only need to tie this one to matter
+                best = distance
+                matches.append((distance, complaint_id))
+        matches.sort()
+        return matches
+
+    def lookup(self, spoken_text, max_distance=2):
+        """
+        Find the complaint for a spoken ID
+        Returns (complaint_id, record), or (None, None) when nothing or
+        more than one complaint is equally close
+        """
+        query = normalise_spoken_id(spoken_text)
+        if not query:
+            return None, None
+
+        # Stray letters before the prefix ("a E C two ...") are not part of it
+        start = query.find(self.prefix)
+        if start > 0 and query[:start].isalpha():
+            query = query[start:]
+
+        candidates = [query]
+        # Callers often drop the "EC" and read out only the digits
+        if not query.startswith(self.prefix):
+            candidates.append(self.prefix + query)
+
+        for candidate in candidates:
+            if candidate in self.records:
+                return candidate, self.records[candidate]
+
+        best = []
+        for candidate in candidates:
+            best.extend(self._fuzzy_matches(candidate, max_distance))
+        if not best:
+            return None, None
+
+        best.sort()
+        closest = {word for distance, word in best if distance == best[0][0]}
+        if len(closest) > 1:
+            return None, None
+        complaint_id = closest.pop()
+        return complaint_id, self.records[complaint_id]
@@ -0,0 +1,81 @@
+# stream_export.py - Chunked CSV and NDJSON exports of complaints
+import csv
+import io
+import json
+import os
+
+from complaint_merge import SOURCES, UNIFIED_COLUMNS, map_to_unified
+from excel_handler import iter_excel_chunks
+
+
+EXPORT_CHUNK_ROWS = 5000
+
+
+def export_filters(args):
+    """Export filters from request arguments"""
+    return {
+        'status': args.get('status') or None,
+        'category': args.get('category') or None,
+        'date_from': args.get('date_from') or None,
+        'date_to': args.get('date_to') or None,
+    }
+
+
+def export_sources(args):
+    """Which workbooks to export: ?source=web, ?source=voice, or both"""
+    source = args.get('source')
+    return [source] if source in SOURCES else None
+
+
+def filter_chunk(chunk_df, status=None, category=None, date_from=None, date_to=None):
+    """Apply the export filters to one chunk of unified complaints"""
+    mask = chunk_df['complaint_id'] != ''
+    if status:
+        mask &= chunk_df['status'].str.lower() == status.lower()
+    if category:
+        mask &= chunk_df['category'].str.lower() == category.lower()
+    # submission_date is stored as 'YYYY-MM-DD HH:MM:SS', so plain string
+    # comparison orders it correctly
+    if date_from:
+        mask &= chunk_df['submission_date'] >= date_from
+    if date_to:
+        mask &= chunk_df['submission_date'] <= f"{date_to} 23:59:59"
+    return chunk_df[mask]
+
+
+def iter_complaint_chunks(filters, sources=None, chunksize=EXPORT_CHUNK_ROWS):
+    """Filtered complaints from the source workbooks, one chunk at a time"""
+    for source in sources or SOURCES:
+        file_path = SOURCES[source]['file']
+        if not os.path.exists(file_path):
+            continue
+        for chunk_df in iter_excel_chunks(file_path, chunksize):
+            chunk_df = filter_chunk(map_to_unified(chunk_df, source), **filters)
+            if not chunk_df.empty:
+                yield chunk_df
+
+
+def csv_stream(filters, sources=None):
+    """Yield the complaints as CSV text, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(UNIFIED_COLUMNS)
+    # Sent before any workbook is opened, so the first byte goes out at once
+    yield buffer.getvalue()
+
+    for chunk_df in iter_complaint_chunks(filters, sources):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk_df[UNIFIED_COLUMNS].itertuples(index=False, name=None))
+        yield buffer.getvalue()
+
+
+def ndjson_stream(filters, sources=None):
+    """Yield the complaints as newline-delimited JSON"""
+    # NDJSON has no header line; an empty first chunk still makes the server
+    # send the response headers before any workbook is opened
+    yield ''
+
+    for chunk_df in iter_complaint_chunks(filters, sources):
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                      for record in chunk_df[UNIFIED_COLUMNS].to_dict('records'))
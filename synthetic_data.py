@@ -0,0 +1,233 @@
+# synthetic_data.py - Synthetic ECMS datasets in the real workbook schemas
+import argparse
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from werkzeug.security import generate_password_hash
+
+from excel_handler import COMPLAINT_COLUMNS
+
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+DATASET_CACHE_DIR = 'data/synthetic'
+# Every synthetic user and technician logs in with this password (one
+# hash is shared, hashing a million passwords would take hours)
+SYNTHETIC_PASSWORD = 'password123'
+ADMIN_EMAIL = 'admin@123.com'
+ADMIN_PASSWORD = 'admin123'
+
+CATEGORIES = ['Power Outage', 'Voltage Issue', 'Meter Problem', 'Billing Issue',
+              'Connection Problem', 'Others']
+CATEGORY_WEIGHTS = [0.35, 0.2, 0.15, 0.15, 0.1, 0.05]
+STATUSES = ['Open', 'In Progress', 'Resolved', 'Closed']
+STATUS_WEIGHTS = [0.25, 0.2, 0.45, 0.1]
+LOCATIONS = ['Sector 4', 'Sector 9', 'MG Road', 'Station Road', 'Civil Lines', 'Old Market',
+             'Industrial Area', 'Ram Nagar', 'Gandhi Chowk', 'Lake View Colony']
+DESCRIPTIONS = {
+    'Power Outage': ['No power since morning', 'Power cut in the whole street', 'Supply trips every hour'],
+    'Voltage Issue': ['Low voltage in the evening', 'Voltage fluctuation damaging appliances'],
+    'Meter Problem': ['Meter not working', 'Meter display is blank', 'Meter running fast'],
+    'Billing Issue': ['Bill amount too high', 'Payment not reflected in bill'],
+    'Connection Problem': ['Loose wire at the pole', 'Sparking from the service line'],
+    'Others': ['Street light not working', 'Transformer making noise'],
+}
+VOICE_COLUMNS = ['complaint_id', 'customer_name', 'phone_number', 'address', 'complaint_type',
+                 'description', 'timestamp', 'priority', 'status']
+USER_COLUMNS = ['user_id', 'fullName', 'aadhar', 'email', 'phone', 'address',
+                'password', 'role', 'registration_date']
+TECHNICIAN_COLUMNS = ['technician_id', 'fullName', 'aadhar', 'email', 'phone', 'address',
+                      'password', 'role']
+BILL_MONTHS = ['Jan 2025', 'Feb 2025', 'Mar 2025']
+RATE_PER_UNIT = 5.5
+# Share of customers with an unpaid bill (they cannot submit complaints)
+UNPAID_SHARE = 0.1
+
+
+def parse_size(label):
+    """'10k' or '10000' -> 10000"""
+    if label in SIZES:
+        return SIZES[label]
+    try:
+        return int(label)
+    except ValueError:
+        raise ValueError(f"Unknown dataset size '{label}', use one of {', '.join(SIZES)} or a row count")
+
+
+def user_email(number):
+    return f"user{number}@example.com"
+
+
+def technician_email(number):
+    return f"tech{number}@example.com"
+
+
+def random_times(rng, rows, start='2024-01-01', end='2025-06-30'):
+    """Sorted 'YYYY-MM-DD HH:MM:SS' strings, as the app stores them"""
+    low = pd.Timestamp(start).value // 10**9
+    high = pd.Timestamp(end).value // 10**9
+    seconds = np.sort(rng.integers(low, high, rows))
+    return pd.to_datetime(seconds, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+
+
+def make_complaints(rows, users, technicians, seed=0, first_id=1):
+    """Complaints spread over `users`, the handled ones assigned to `technicians`"""
+    rng = np.random.default_rng(seed)
+    categories = rng.choice(CATEGORIES, rows, p=CATEGORY_WEIGHTS)
+    statuses = rng.choice(STATUSES, rows, p=STATUS_WEIGHTS)
+    submitted = random_times(rng, rows)
+    descriptions = [DESCRIPTIONS[category][i % len(DESCRIPTIONS[category])]
+                    for i, category in enumerate(categories)]
+    assigned = np.where(statuses == 'Open', '',
+                        np.char.add('TECH', rng.integers(1, technicians + 1, rows).astype(str)))
+    handled = np.isin(statuses, ['Resolved', 'Closed'])
+    resolved_at = (pd.to_datetime(submitted) + pd.to_timedelta(rng.integers(1, 96, rows), unit='h')
+                   ).strftime('%Y-%m-%d %H:%M:%S')
+    return pd.DataFrame({
+        'complaint_id': [f"CID{number:07d}" for number in range(first_id, first_id + rows)],
+        'user_id': [f"UID{number:07d}" for number in rng.integers(1, users + 1, rows)],
+        'category': categories,
+        'description': descriptions,
+        'location': rng.choice(LOCATIONS, rows),
+        'submission_date': submitted,
+        'status': statuses,
+        'assigned_to': assigned,
+        'attachment_path': '',
+        'resolution_notes': np.where(handled, 'Fixed on site', ''),
+        'resolution_date': np.where(handled, resolved_at, ''),
+    }, columns=COMPLAINT_COLUMNS)
+
+
+def make_users(rows, seed=0):
+    """The seeded admin followed by `rows` customers"""
+    rng = np.random.default_rng(seed + 1)
+    password = generate_password_hash(SYNTHETIC_PASSWORD)
+    numbers = np.arange(1, rows + 1)
+    users = pd.DataFrame({
+        'user_id': [f"UID{number:07d}" for number in numbers],
+        'fullName': [f"Customer {number}" for number in numbers],
+        'aadhar': 100000000000 + numbers,
+        'email': [user_email(number) for number in numbers],
+        'phone': 9000000000 + numbers,
+        'address': [f"{number % 500 + 1} {location}" for number, location
+                    in zip(numbers, rng.choice(LOCATIONS, rows))],
+        'password': password,
+        'role': 'customer',
+        'registration_date': random_times(rng, rows, '2023-01-01', '2024-01-01'),
+    }, columns=USER_COLUMNS)
+    admin = pd.DataFrame([{
+        'user_id': 'b8100284-d8d7-42cc-bae6-5110aa73bbb1', 'fullName': '1Admin User',
+        'aadhar': 0, 'email': ADMIN_EMAIL, 'phone': 1234567891, 'address': 'Admin Office',
+        'password': generate_password_hash(ADMIN_PASSWORD), 'role': 'admin',
+        'registration_date': '2023-01-01 00:00:00',
+    }], columns=USER_COLUMNS)
+    return pd.concat([admin, users], ignore_index=True)
+
+
+def make_technicians(rows):
+    password = generate_password_hash(SYNTHETIC_PASSWORD)
+    numbers = np.arange(1, rows + 1)
+    return pd.DataFrame({
+        'technician_id': [f"TECH{number}" for number in numbers],
+        'fullName': [f"Technician {number}" for number in numbers],
+        'aadhar': 200000000000 + numbers,
+        'email': [technician_email(number) for number in numbers],
+        'phone': 8000000000 + numbers,
+        'address': [LOCATIONS[number % len(LOCATIONS)] for number in numbers],
+        'password': password,
+        'role': 'technician',
+    }, columns=TECHNICIAN_COLUMNS)
+
+
+def make_bills(rows, seed=0):
+    """
+    Three months of bills per customer for the first rows // 3 users
+    The customer ID is the user's email, which is what the submit page
+    looks bills up by.
+    """
+    rng = np.random.default_rng(seed + 2)
+    customers = max(1, rows // len(BILL_MONTHS))
+    numbers = np.repeat(np.arange(1, customers + 1), len(BILL_MONTHS))
+    units = rng.integers(50, 600, len(numbers))
+    unpaid = np.repeat(rng.random(customers) < UNPAID_SHARE, len(BILL_MONTHS))
+    return pd.DataFrame({
+        'Customer ID': [user_email(number) for number in numbers],
+        'Customer Name': [f"Customer {number}" for number in numbers],
+        'Address': [f"{number % 500 + 1} Main Street" for number in numbers],
+        'Month': np.tile(BILL_MONTHS, customers),
+        'Units Consumed': units,
+        'Rate per Unit': RATE_PER_UNIT,
+        'Bill Amount': units * RATE_PER_UNIT,
+        'Payment Status': np.where(unpaid, 'Unpaid', 'Paid'),
+    })
+
+
+def write_workbook(df, path):
+    """Write a sheet row by row; pandas' own writer is far slower at a million rows"""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row_num, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_num, 0, row)
+    workbook.close()
+
+
+def write_dataset(data_dir, rows, seed=0):
+    """
+    Write complaints, users and bills with `rows` rows each, one technician
+    per hundred complaints, and an empty voice workbook
+    Returns {name: path}
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    technicians = max(10, rows // 100)
+    tables = {
+        'complaints.xlsx': make_complaints(rows, rows, technicians, seed),
+        'users.xlsx': make_users(rows, seed),
+        'technician.xlsx': make_technicians(technicians),
+        'Electricity_Bills_3Months.xlsx': make_bills(rows, seed),
+        'voiceComplaint.xlsx': pd.DataFrame(columns=VOICE_COLUMNS),
+    }
+    paths = {}
+    for name, df in tables.items():
+        paths[name] = os.path.join(data_dir, name)
+        write_workbook(df, paths[name])
+    return paths
+
+
+def cached_dataset(rows, seed=0, cache_dir=DATASET_CACHE_DIR):
+    """Directory holding the dataset for `rows`, generated on first use"""
+    path = os.path.join(cache_dir, f"{rows}_{seed}")
+    if not os.path.isdir(path):
+        # Written under a temporary name so an interrupted run leaves no half dataset
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        write_dataset(temp_path, rows, seed)
+        os.replace(temp_path, path)
+    return path
+
+
+def install_dataset(source_dir, data_dir):
+    """Copy a generated dataset over the workbooks in `data_dir`"""
+    os.makedirs(data_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        shutil.copy(os.path.join(source_dir, name), os.path.join(data_dir, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic ECMS workbooks")
+    parser.add_argument('size', help=f"rows per table: {', '.join(SIZES)} or a number")
+    parser.add_argument('--out', required=True, help="directory to write the workbooks to")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = datetime.now()
+    paths = write_dataset(args.out, parse_size(args.size), args.seed)
+    print(f"Wrote {len(paths)} workbooks to {args.out} in {(datetime.now() - started).total_seconds():.1f}s")
+
+
+if __name__ == '__main__':
+    main()
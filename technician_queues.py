@@ -0,0 +1,113 @@
+# technician_queues.py - Per-technician complaint queues for the technician dashboard
+import threading
+
+from complaint_merge import unified_view
+
+
+# Status spellings found in the workbooks -> the three dashboard buckets
+STATUS_BUCKETS = {
+    'open': 'open',
+    'pending': 'open',
+    'new': 'open',
+    'in progress': 'in_progress',
+    'inprogress': 'in_progress',
+    'in_progress': 'in_progress',
+    'in-progress': 'in_progress',
+    'assigned': 'in_progress',
+    'resolved': 'resolved',
+    'closed': 'resolved',
+    'completed': 'resolved',
+}
+
+
+def normalise_status(status):
+    """'Open', 'open' and 'Pending' all count as open, and so on; None if unknown"""
+    return STATUS_BUCKETS.get(str(status).strip().lower())
+
+
+class TechnicianQueues:
+    """
+    Complaints grouped by the technician they are assigned to
+
+    Each technician's queue maps complaint_id -> row position in the
+    unified table, alongside running counts per normalised status. New
+    rows and in-place changes (assignments, status updates) are applied
+    from the unified view's feed, so a dashboard load only touches the
+    technician's own complaints.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.queues = {}
+        self.counts = {}
+        # complaint_id -> (technician_id, status bucket) it is counted under
+        self.placed = {}
+        self.rows = {}
+        self.synced_rows = 0
+        self.synced_updates = 0
+        self.synced_generation = None
+
+    def place(self, complaint_id, position, technician_id, status):
+        """Move one complaint to the queue and status bucket it now belongs in"""
+        previous = self.placed.pop(complaint_id, None)
+        if previous is not None:
+            old_technician, old_bucket = previous
+            del self.queues[old_technician][complaint_id]
+            self.counts[old_technician][old_bucket] -= 1
+
+        technician_id = str(technician_id or '').strip()
+        if not technician_id:
+            return
+        bucket = normalise_status(status) or 'other'
+        self.queues.setdefault(technician_id, {})[complaint_id] = position
+        counts = self.counts.setdefault(technician_id, {})
+        counts[bucket] = counts.get(bucket, 0) + 1
+        self.placed[complaint_id] = (technician_id, bucket)
+
+    def place_rows(self, table, positions):
+        rows_df = table.iloc[positions]
+        for position, complaint_id, technician_id, status in zip(
+                positions, rows_df['complaint_id'], rows_df['assigned_to'], rows_df['status']):
+            if complaint_id:
+                self.rows[complaint_id] = position
+                self.place(complaint_id, position, technician_id, status)
+
+    def sync(self, view=unified_view):
+        """Catch up with complaints added to or changed in the unified view"""
+        table = view.refresh()
+        with self.lock:
+            updated, update_seq = view.updates_since(self.synced_updates)
+            if self.synced_generation != view.generation or updated is None:
+                # Rebuilt, or too far behind the view's updates: start again
+                self.clear()
+                self.synced_generation = view.generation
+                updated = []
+            if len(table) > self.synced_rows:
+                self.place_rows(table, range(self.synced_rows, len(table)))
+                self.synced_rows = len(table)
+            if updated:
+                self.place_rows(table, sorted({self.rows[key] for key in updated if key in self.rows}))
+            self.synced_updates = update_seq
+        return table
+
+    def queue(self, technician_id):
+        """(complaint records, status counts) for one technician"""
+        table = self.sync()
+        technician_id = str(technician_id).strip()
+        with self.lock:
+            positions = sorted(self.queues.get(technician_id, {}).values())
+            counts = dict(self.counts.get(technician_id, {}))
+        records = table.iloc[positions].to_dict('records') if positions else []
+        stats = {
+            'total': len(positions),
+            'open': counts.get('open', 0),
+            'in_progress': counts.get('in_progress', 0),
+            'resolved': counts.get('resolved', 0),
+        }
+        return records, stats
+
+
+technician_queues = TechnicianQueues()
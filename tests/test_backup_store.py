@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup_store import (  # noqa: E402
+    BACKUP_ID_FORMAT, backups_to_keep, create_backup, list_backups, prune_backups, restore_backup,
+)
+from change_log import CHANGE_LOG_FILE  # noqa: E402
+
+
+COMPLAINTS = 'data/complaints.xlsx'
+USERS = 'data/users.xlsx'
+FILES = [COMPLAINTS, USERS]
+
+
+def write(file_path, content):
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+
+def read(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    write(COMPLAINTS, b'complaints v1' * 100)
+    write(USERS, b'users v1' * 100)
+    return tmp_path
+
+
+def manifests(*times):
+    return [{'backup_id': when.strftime(BACKUP_ID_FORMAT)} for when in sorted(times, reverse=True)]
+
+
+def test_unchanged_files_are_not_stored_again(data_dir):
+    first = create_backup(FILES)
+    write(COMPLAINTS, b'complaints v2' * 100)
+    second = create_backup(FILES)
+
+    assert first['new_bytes'] > 0
+    assert second['files'][USERS] == first['files'][USERS]
+    assert second['files'][COMPLAINTS]['sha256'] != first['files'][COMPLAINTS]['sha256']
+    assert [manifest['backup_id'] for manifest in list_backups()] == [second['backup_id'], first['backup_id']]
+
+
+def test_restore_brings_back_the_snapshot_and_logs_it(data_dir):
+    backup = create_backup(FILES)
+    write(COMPLAINTS, b'complaints v2')
+    write(USERS, b'users v2')
+
+    assert restore_backup(backup['backup_id'], files=[COMPLAINTS]) == [COMPLAINTS]
+    assert read(COMPLAINTS) == b'complaints v1' * 100
+    assert read(USERS) == b'users v2'
+    with open(CHANGE_LOG_FILE) as f:
+        events = [json.loads(line) for line in f]
+    assert [(event['entity'], event['op']) for event in events] == [('complaint', 'restore')]
+
+
+def test_corrupt_or_missing_backups_are_refused(data_dir):
+    backup = create_backup(FILES)
+    with pytest.raises(ValueError, match='not found'):
+        restore_backup('20000101_000000_000000')
+
+    write(COMPLAINTS, b'complaints v2')
+    object_path = os.path.join('backups', backup['files'][COMPLAINTS]['object'])
+    stored = read(object_path)
+    # A damaged stream, then a readable one holding other content
+    for damaged in (stored[:-8] + b'\0' * 8, gzip.compress(b'complaints v3')):
+        write(object_path, damaged)
+        with pytest.raises(ValueError, match='is corrupt'):
+            restore_backup(backup['backup_id'], files=[COMPLAINTS])
+        assert read(COMPLAINTS) == b'complaints v2'
+        assert not os.path.exists(f'{COMPLAINTS}.restoring')
+
+
+def test_retention_keeps_the_newest_of_each_period():
+    start = datetime(2025, 6, 2, 9, 0)
+    hourly = [start + timedelta(minutes=20 * i) for i in range(9)]
+
+    keep = backups_to_keep(manifests(*hourly), {'latest': 1, 'hourly': 2})
+
+    newest = hourly[-1].strftime(BACKUP_ID_FORMAT)
+    # 11:40 is the newest; the newest of the 10:00 hour is 10:40
+    assert keep == {newest, (start + timedelta(minutes=100)).strftime(BACKUP_ID_FORMAT)}
+
+
+def test_retention_spans_days_and_weeks():
+    days = [datetime(2025, 6, 2, 12) + timedelta(days=i) for i in range(14)]
+
+    keep = backups_to_keep(manifests(*days), {'latest': 1, 'daily': 3, 'weekly': 2})
+
+    # Three newest days, then the newest of the week before
+    assert sorted(keep) == sorted(when.strftime(BACKUP_ID_FORMAT) for when in
+                                  [days[13], days[12], days[11], days[6]])
+
+
+def test_prune_deletes_unreferenced_objects(data_dir):
+    old = create_backup(FILES)
+    write(COMPLAINTS, b'complaints v2' * 100)
+    new = create_backup(FILES)
+
+    assert prune_backups(retention={'latest': 1}) == 1
+    assert [manifest['backup_id'] for manifest in list_backups()] == [new['backup_id']]
+    assert not os.path.exists(os.path.join('backups', old['files'][COMPLAINTS]['object']))
+    # Still shared with the kept snapshot
+    assert os.path.exists(os.path.join('backups', old['files'][USERS]['object']))
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complaint_lifecycle import (  # noqa: E402
+    InvalidTransition, LifecycleTracker, canonical_status, check_transition, compact_events,
+    record_transitions, transition_path,
+)
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+
+
+class FakeView:
+    """The parts of UnifiedComplaintView the tracker follows"""
+
+    def __init__(self):
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.generation = 0
+
+    def add(self, complaint_id, status, submitted, category='Power Outage', assigned_to=''):
+        row = {column: '' for column in UNIFIED_COLUMNS}
+        row.update(complaint_id=complaint_id, status=status, category=category, assigned_to=assigned_to,
+                   source='web', submission_date=submitted)
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+
+    def refresh(self):
+        return self.table
+
+
+def write_events(event_file, *events):
+    """Append (complaint_id, state, at, technician) entries"""
+    with open(event_file, 'a') as f:
+        for complaint_id, state, at, technician in events:
+            f.write(json.dumps({'complaint_id': complaint_id, 'state': state, 'at': at,
+                                'category': 'Power Outage', 'technician': technician}) + '\n')
+
+
+def following(view, tmp_path):
+    tracker = LifecycleTracker(str(tmp_path / 'events.ndjson'), str(tmp_path / 'state.pkl'))
+    tracker.sync = lambda: LifecycleTracker.sync(tracker, view)
+    return tracker
+
+
+def reports(tracker):
+    return (tracker.backlog('technician', now=datetime(2025, 6, 2)), tracker.time_in_state('technician'),
+            tracker.throughput('Resolved'))
+
+
+def test_status_spellings_and_allowed_moves():
+    assert canonical_status(' in progress ') == 'In Progress'
+    assert canonical_status('closed') == 'Closed'
+    assert canonical_status('Rejected') is None
+
+    assert check_transition('Open', 'in progress') == 'In Progress'
+    assert check_transition('Resolved', 'Resolved') == 'Resolved'
+    # Rows with an unknown status can be set to anything
+    assert check_transition('', 'Closed') == 'Closed'
+    with pytest.raises(InvalidTransition):
+        check_transition('Resolved', 'Open')
+    with pytest.raises(InvalidTransition):
+        check_transition('Open', 'Reopened')
+
+
+def test_path_through_intermediate_states():
+    assert transition_path('Open', 'Resolved') == ['In Progress', 'Resolved']
+    assert transition_path('Open', 'Closed') == ['In Progress', 'Closed']
+    assert transition_path('In Progress', 'Resolved') == ['Resolved']
+    assert transition_path('Resolved', 'Resolved') == []
+    assert transition_path('Closed', 'Open') is None
+
+
+def test_time_in_state_and_backlog_from_events(tmp_path):
+    view = FakeView()
+    tracker = following(view, tmp_path)
+    write_events(tracker.event_file,
+                 ('CID1', 'Open', '2025-06-01 08:00:00', ''),
+                 ('CID1', 'In Progress', '2025-06-01 10:00:00', 'TECH1'),
+                 # Reassigned: the time in progress carries on
+                 ('CID1', 'In Progress', '2025-06-01 11:00:00', 'TECH2'),
+                 ('CID1', 'Resolved', '2025-06-01 14:00:00', 'TECH2'),
+                 ('CID2', 'Open', '2025-06-01 20:00:00', ''))
+
+    backlog, time_in_state, throughput = reports(tracker)
+
+    assert backlog == {'TECH2': {'Resolved': {'count': 1, 'avg_age_hours': 10.0}},
+                       'Unassigned': {'Open': {'count': 1, 'avg_age_hours': 4.0}}}
+    assert time_in_state['Unassigned']['Open'] == {'exits': 1, 'avg_hours': 2.0}
+    assert time_in_state['TECH2']['In Progress'] == {'exits': 1, 'avg_hours': 4.0}
+    assert throughput == {'2025-06-01': 1}
+
+
+def test_complaints_without_events_are_seeded_at_submission(tmp_path):
+    view = FakeView()
+    view.add('CID1', 'Open', '2025-06-01 12:00:00')
+    view.add('CID2', 'Pending', '2025-06-01 18:00:00')
+    tracker = following(view, tmp_path)
+    write_events(tracker.event_file, ('CID2', 'In Progress', '2025-06-01 20:00:00', 'TECH1'))
+
+    backlog = tracker.backlog('technician', now=datetime(2025, 6, 2))
+
+    assert backlog == {'Unassigned': {'Open': {'count': 1, 'avg_age_hours': 12.0}},
+                       'TECH1': {'In Progress': {'count': 1, 'avg_age_hours': 4.0}}}
+    # Seeding is not a transition that happened that day
+    assert tracker.throughput('Open') == {}
+
+
+def test_recorded_transitions_are_read_incrementally(tmp_path):
+    tracker = following(FakeView(), tmp_path)
+    record_transitions([('CID1', 'Open', 'Power Outage', '')], tracker.event_file)
+    assert sum(tracker.throughput('Open').values()) == 1
+
+    record_transitions([('CID1', 'In Progress', 'Power Outage', 'TECH1'),
+                        ('CID2', 'Open', 'Power Outage', '')], tracker.event_file)
+    assert sum(tracker.throughput('Open').values()) == 2
+    assert sum(tracker.throughput('In Progress').values()) == 1
+
+
+def test_compaction_keeps_the_reports(tmp_path):
+    view = FakeView()
+    tracker = following(view, tmp_path)
+    write_events(tracker.event_file,
+                 ('CID1', 'Open', '2025-06-01 08:00:00', ''),
+                 ('CID1', 'In Progress', '2025-06-01 10:00:00', 'TECH1'),
+                 ('CID2', 'Open', '2025-06-01 09:00:00', ''))
+    before = reports(tracker)
+
+    assert compact_events(tracker.event_file, tracker.state_file) == 3
+    with open(tracker.event_file) as f:
+        assert [json.loads(line) for line in f] == [{'epoch': 1}]
+    # A running tracker notices the new file; a new one starts from the checkpoint
+    assert reports(tracker) == before
+    assert reports(following(view, tmp_path)) == before
+    assert compact_events(tracker.event_file, tracker.state_file) == 0
+
+    # Events after the compaction are added on top, once
+    write_events(tracker.event_file, ('CID1', 'Resolved', '2025-06-01 16:00:00', 'TECH1'))
+    assert compact_events(tracker.event_file, tracker.state_file) == 1
+    for reader in (tracker, following(view, tmp_path)):
+        assert reader.throughput('Resolved') == {'2025-06-01': 1}
+        assert reader.time_in_state('technician')['TECH1']['In Progress'] == {'exits': 1, 'avg_hours': 6.0}
+
+
+def test_checkpoint_newer_than_the_event_file_is_not_counted_twice(tmp_path):
+    view = FakeView()
+    tracker = following(view, tmp_path)
+    write_events(tracker.event_file, ('CID1', 'Open', '2025-06-01 08:00:00', ''))
+    compact_events(tracker.event_file, tracker.state_file)
+    write_events(tracker.event_file, ('CID1', 'In Progress', '2025-06-01 10:00:00', 'TECH1'),
+                 ('CID1', 'Resolved', '2025-06-01 12:00:00', 'TECH1'))
+
+    # Crash between saving the checkpoint and swapping in the new file:
+    # the file the checkpoint already covers is still in place
+    with open(tracker.event_file) as f:
+        covered = f.read()
+    compact_events(tracker.event_file, tracker.state_file)
+    with open(tracker.event_file, 'w') as f:
+        f.write(covered)
+
+    reader = following(view, tmp_path)
+    assert reader.throughput('Resolved') == {'2025-06-01': 1}
+    assert reader.time_in_state('category')['Power Outage']['In Progress']['exits'] == 1
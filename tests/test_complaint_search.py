@@ -0,0 +1,115 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import complaint_search  # noqa: E402
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+from complaint_search import ComplaintSearchIndex, tokenize  # noqa: E402
+
+
+class FakeView:
+    """The parts of UnifiedComplaintView the index follows"""
+
+    def __init__(self):
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.generation = 0
+        self.updated_ids = []
+
+    def add(self, complaint_id, description, status='Open', category='Power Outage'):
+        row = {column: '' for column in UNIFIED_COLUMNS}
+        row.update(complaint_id=complaint_id, description=description, location='Sector 4',
+                   status=status, category=category, source='web')
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+
+    def set_values(self, complaint_id, **changes):
+        for column, value in changes.items():
+            self.table.loc[self.table['complaint_id'] == complaint_id, column] = value
+        self.updated_ids.append(complaint_id)
+
+    def refresh(self):
+        return self.table
+
+    def updates_since(self, seq):
+        return self.updated_ids[seq:], len(self.updated_ids)
+
+
+def index_of(*documents):
+    index = ComplaintSearchIndex()
+    for key, text, status, category in documents:
+        index.add(key, text, status, category)
+    return index
+
+
+def keys(hits):
+    return [key for key, _ in hits]
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize('The meter at my house is SPARKING!') == ['meter', 'house', 'sparking']
+
+
+def test_rarer_and_repeated_terms_rank_higher():
+    index = index_of(('CID1', 'meter sparking sparking sparking', 'Open', 'Meter'),
+                     ('CID2', 'meter sparking', 'Open', 'Meter'),
+                     ('CID3', 'meter reading wrong', 'Open', 'Billing'),
+                     ('CID4', 'meter box loose', 'Open', 'Meter'))
+
+    assert keys(index.search('sparking', prefix=False)) == ['CID1', 'CID2']
+    # 'meter' is in every complaint, so 'wrong' decides
+    assert keys(index.search('meter wrong', prefix=False))[0] == 'CID3'
+
+
+def test_last_word_matches_as_a_prefix():
+    index = index_of(('CID1', 'transformer burst', 'Open', 'Outage'),
+                     ('CID2', 'transmission line down', 'Open', 'Outage'),
+                     ('CID3', 'tree on wire', 'Open', 'Outage'))
+
+    assert sorted(keys(index.search('trans'))) == ['CID1', 'CID2']
+    assert index.search('trans', prefix=False) == []
+    # Earlier words match whole unless they end in '*'
+    assert keys(index.search('trans down')) == ['CID2']
+    assert keys(index.search('trans* down')) == ['CID2', 'CID1']
+
+
+def test_prefix_expands_to_the_most_common_terms(monkeypatch):
+    monkeypatch.setattr(complaint_search, 'MAX_PREFIX_TERMS', 2)
+    index = index_of(('CID1', 'volt', 'Open', ''), ('CID2', 'volt', 'Open', ''),
+                     ('CID3', 'voltage', 'Open', ''), ('CID4', 'voltage', 'Open', ''),
+                     ('CID5', 'voltmeter', 'Open', ''))
+
+    assert sorted(keys(index.search('volt'))) == ['CID1', 'CID2', 'CID3', 'CID4']
+
+
+def test_filters_and_limit():
+    index = index_of(*[(f'CID{i}', 'no power in street', 'Open' if i % 2 else 'Resolved',
+                        'Outage' if i < 6 else 'Billing') for i in range(1, 11)])
+
+    assert sorted(keys(index.search('power', status='open', category='Outage'))) == ['CID1', 'CID3', 'CID5']
+    assert len(index.search('power', limit=4)) == 4
+    assert index.search('power', status='Unknown') == []
+
+
+def test_sync_follows_new_and_changed_complaints():
+    view = FakeView()
+    view.add('CID1', 'street light flickering')
+    view.add('CID2', 'meter sparking')
+    index = ComplaintSearchIndex()
+    index.sync(view)
+    assert keys(index.search('flicker')) == ['CID1']
+
+    view.set_values('CID1', description='street light dead', status='Resolved')
+    view.add('CID3', 'flickering voltage')
+    index.sync(view)
+
+    assert keys(index.search('flicker')) == ['CID3']
+    assert keys(index.search('dead', status='Resolved')) == ['CID1']
+
+    # A rebuilt view starts the index again
+    view.generation += 1
+    view.table = view.table.iloc[1:].reset_index(drop=True)
+    index.sync(view)
+    assert index.search('dead') == []
+    assert index.rows == {'CID2': 0, 'CID3': 1}
@@ -0,0 +1,90 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+from duplicate_detector import DUPLICATE_WINDOW, DuplicateIndex  # noqa: E402
+
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+DESCRIPTION = 'Transformer near the school is sparking and power keeps tripping'
+LOCATION = 'Sector 4'
+
+
+class FakeView:
+    """The parts of UnifiedComplaintView the index follows"""
+
+    def __init__(self):
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.generation = 0
+        self.updated_ids = []
+
+    def add(self, complaint_id, status='Open', submitted=NOW - timedelta(hours=1), user_id='UID1'):
+        row = {column: '' for column in UNIFIED_COLUMNS}
+        row.update(complaint_id=complaint_id, user_id=user_id, description=DESCRIPTION,
+                   location=LOCATION, status=status, source='web',
+                   submission_date=submitted.strftime('%Y-%m-%d %H:%M:%S'))
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+
+    def set_status(self, complaint_id, status):
+        self.table.loc[self.table['complaint_id'] == complaint_id, 'status'] = status
+        self.updated_ids.append(complaint_id)
+
+    def refresh(self):
+        return self.table
+
+    def updates_since(self, seq):
+        return self.updated_ids[seq:], len(self.updated_ids)
+
+
+def synced_index(view):
+    index = DuplicateIndex()
+    index.sync(view)
+    return index
+
+
+def matches(index, user_id='UID1'):
+    return [complaint_id for complaint_id, _ in
+            index.candidates(DESCRIPTION, LOCATION, user_id, now=NOW)]
+
+
+def test_open_complaint_is_a_duplicate():
+    view = FakeView()
+    view.add('CID1')
+    assert matches(synced_index(view)) == ['CID1']
+
+
+def test_recurring_fault_after_resolution_is_not_a_duplicate():
+    # The same fault reported again once the first complaint was fixed
+    view = FakeView()
+    view.add('CID1', status='Resolved')
+    view.add('CID2', status='Closed')
+    assert matches(synced_index(view)) == []
+
+
+def test_complaint_resolved_after_indexing_is_dropped():
+    view = FakeView()
+    view.add('CID1')
+    index = synced_index(view)
+    assert matches(index) == ['CID1']
+
+    view.set_status('CID1', 'Resolved')
+    index.sync(view)
+    assert matches(index) == []
+
+
+def test_complaint_outside_the_window_is_not_a_duplicate():
+    view = FakeView()
+    view.add('CID1', submitted=NOW - DUPLICATE_WINDOW - timedelta(hours=1))
+    view.add('CID2', submitted=NOW - DUPLICATE_WINDOW + timedelta(hours=1))
+    assert matches(synced_index(view)) == ['CID2']
+
+
+def test_other_customers_complaints_are_not_duplicates():
+    view = FakeView()
+    view.add('CID1', user_id='UID2')
+    assert matches(synced_index(view)) == []
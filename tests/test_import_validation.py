@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_log import CHANGE_LOG_FILE  # noqa: E402
+from excel_handler import (  # noqa: E402
+    REQUIRED_IMPORT_COLUMNS, import_complaints_from_excel, validate_import_chunk,
+)
+
+
+def upload(*rows):
+    """Import rows from (complaint_id, user_id, submission_date, status)"""
+    records = []
+    for complaint_id, user_id, submitted, status in rows:
+        records.append({'complaint_id': complaint_id, 'user_id': user_id, 'category': 'Power Outage',
+                        'description': 'No power since morning', 'location': 'Sector 4',
+                        'submission_date': submitted, 'status': status})
+    return pd.DataFrame(records, columns=REQUIRED_IMPORT_COLUMNS)
+
+
+def reasons(rejected_df):
+    return dict(zip(rejected_df['complaint_id'], rejected_df['reason']))
+
+
+def test_valid_rows_are_normalised():
+    valid_df, rejected_df = validate_import_chunk(
+        upload(('CID1', 'UID1', '2025-01-05 10:00', ' in progress ')), set())
+
+    assert rejected_df.empty
+    assert valid_df.iloc[0]['status'] == 'In Progress'
+    assert valid_df.iloc[0]['submission_date'] == '2025-01-05 10:00:00'
+
+
+def test_each_problem_is_given_as_a_reason():
+    _, rejected_df = validate_import_chunk(upload(
+        ('C-1', 'UID1', '2025-01-05 10:00:00', 'Open'),
+        ('CID2', 'someone', '2025-01-05 10:00:00', 'Open'),
+        ('CID3', 'UID1', 'yesterday', 'Open'),
+        ('CID4', 'UID1', '2025-01-05 10:00:00', 'Pending review'),
+        ('CID5', '', '2025-01-05 10:00:00', 'Open')), set())
+
+    found = reasons(rejected_df)
+    assert found['C-1'] == 'complaint_id must look like CID0001'
+    assert found['CID2'] == 'user_id must look like UID0001'
+    assert found['CID3'] == 'submission_date is not a valid date'
+    assert found['CID4'].startswith('status must be one of')
+    assert found['CID5'] == 'missing user_id'
+
+
+def test_known_and_repeated_ids_are_rejected():
+    known_ids = {'CID1'}
+    valid_df, rejected_df = validate_import_chunk(upload(
+        ('CID1', 'UID1', '2025-01-05 10:00:00', 'Open'),
+        ('CID2', 'UID1', '2025-01-05 10:00:00', 'Open'),
+        ('CID2', 'UID1', '2025-01-05 11:00:00', 'Open')), known_ids)
+
+    assert list(valid_df['complaint_id']) == ['CID2']
+    assert list(rejected_df['reason']) == ['complaint_id already exists', 'complaint_id repeated in file']
+    assert known_ids == {'CID1', 'CID2'}
+
+    # Later chunks of the same upload see the IDs accepted before them
+    _, rejected_df = validate_import_chunk(upload(('CID2', 'UID1', '2025-01-06 10:00:00', 'Open')), known_ids)
+    assert list(rejected_df['reason']) == ['complaint_id already exists']
+
+
+def test_import_appends_valid_rows_and_logs_them(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    upload(('CID1', 'UID1', '2025-01-05 10:00:00', 'Open'),
+           ('CID2', 'UID2', '2025-01-05 11:00:00', 'closed'),
+           ('CID1', 'UID3', '2025-01-05 12:00:00', 'Open')).to_csv('upload.csv', index=False)
+
+    result = import_complaints_from_excel('upload.csv', 'data/complaints.xlsx',
+                                          rejects_path='rejects.csv', batch_rows=2)
+
+    assert result == {'imported': 2, 'rejected': 1, 'rejects_path': 'rejects.csv', 'error': None}
+    complaints_df = pd.read_excel('data/complaints.xlsx', dtype=str)
+    assert list(complaints_df['complaint_id']) == ['CID1', 'CID2']
+    assert list(complaints_df['status']) == ['Open', 'Closed']
+    # Rows are numbered as in the spreadsheet, header first
+    rejects_df = pd.read_csv('rejects.csv', dtype=str)
+    assert list(rejects_df['row']) == ['4']
+    with open(CHANGE_LOG_FILE) as f:
+        events = [json.loads(line) for line in f]
+    assert [(event['op'], event['key']) for event in events] == [('insert', 'CID1'), ('insert', 'CID2')]
+
+
+def test_missing_column_stops_the_import(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    upload(('CID1', 'UID1', '2025-01-05 10:00:00', 'Open')).drop(columns='location').to_csv('upload.csv', index=False)
+
+    result = import_complaints_from_excel('upload.csv', 'data/complaints.xlsx')
+
+    assert result['error'] == "Required column 'location' not found in file"
+    assert not os.path.exists('data/complaints.xlsx')
@@ -0,0 +1,112 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+from incident_detector import INCIDENT_WINDOW, IncidentDetector, normalise_location  # noqa: E402
+
+
+START = datetime(2025, 6, 1, 18, 0, 0)
+
+
+class FakeView:
+    """The parts of UnifiedComplaintView the detector follows"""
+
+    def __init__(self):
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.generation = 0
+
+    def add(self, complaint_id, submitted, location='Sector 12, Main Rd.', category='Power Outage'):
+        row = {column: '' for column in UNIFIED_COLUMNS}
+        row.update(complaint_id=complaint_id, location=location, category=category, status='Open',
+                   source='web', submission_date=submitted.strftime('%Y-%m-%d %H:%M:%S'))
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+
+    def set_status(self, complaint_id, status):
+        self.table.loc[self.table['complaint_id'] == complaint_id, 'status'] = status
+
+    def refresh(self):
+        return self.table
+
+
+def following(view):
+    detector = IncidentDetector()
+    detector.sync = lambda: IncidentDetector.sync(detector, view)
+    return detector
+
+
+def test_spellings_of_one_area_share_a_key():
+    assert normalise_location('Sec-12, Main Rd.') == 'sector 12 main road'
+    assert normalise_location('near the Sector 12 main road') == 'sector 12 main road'
+    assert normalise_location('Sector 13 Main Road') != normalise_location('Sector 12 Main Road')
+
+
+def test_complaints_within_the_window_join_one_incident():
+    detector = IncidentDetector()
+    # Each within the window of the one before, though not of the first
+    times = [START + i * (INCIDENT_WINDOW - timedelta(minutes=5)) for i in range(4)]
+    incidents = {detector.add(f'CID{i}', 'Sector 12, Main Rd.', 'Power Outage', at).incident_id
+                 for i, at in enumerate(times)}
+
+    assert len(incidents) == 1
+    incident = detector.incidents[incidents.pop()]
+    assert incident.members == ['CID0', 'CID1', 'CID2', 'CID3']
+    # Only the complaints inside the last window count towards the rate
+    assert list(incident.recent) == times[2:]
+
+
+def test_gap_category_or_area_starts_a_new_incident():
+    detector = IncidentDetector()
+    first = detector.add('CID1', 'Sector 12', 'Power Outage', START)
+
+    assert detector.add('CID2', 'Sector 12', 'Voltage Issue', START) is not first
+    assert detector.add('CID3', 'Sector 14', 'Power Outage', START) is not first
+    assert detector.add('CID4', 'Sector 12', 'Power Outage', START + INCIDENT_WINDOW + timedelta(seconds=1)) is not first
+
+
+def test_only_groups_of_the_minimum_size_are_listed():
+    view = FakeView()
+    for i in range(3):
+        view.add(f'CID{i}', START + timedelta(minutes=i))
+    view.add('CID9', START, location='Sector 40')
+    detector = following(view)
+
+    incidents = detector.list_incidents()
+    assert [(incident['area'], incident['member_count'], incident['open_count']) for incident in incidents] == [
+        ('sector 12 main road', 3, 3)]
+    assert detector.members(incidents[0]['incident_id']) == ['CID0', 'CID1', 'CID2']
+
+
+def test_resolved_incidents_are_hidden_and_not_joined():
+    view = FakeView()
+    for i in range(3):
+        view.add(f'CID{i}', START + timedelta(minutes=i))
+    detector = following(view)
+    incident_id = detector.list_incidents()[0]['incident_id']
+
+    detector.mark_resolved(incident_id)
+    assert detector.list_incidents() == []
+    assert [incident['incident_id'] for incident in detector.list_incidents(include_resolved=True)] == [incident_id]
+
+    # A complaint after the fix is a new outage, even inside the window
+    view.add('CID3', START + timedelta(minutes=5))
+    detector.sync()
+    assert detector.incident_of['CID3'] != incident_id
+
+
+def test_incident_closes_when_every_member_is_closed():
+    view = FakeView()
+    for i in range(3):
+        view.add(f'CID{i}', START + timedelta(minutes=i))
+    detector = following(view)
+
+    view.set_status('CID0', 'Resolved')
+    assert detector.list_incidents()[0]['open_count'] == 2
+    view.set_status('CID1', 'Closed')
+    view.set_status('CID2', 'Resolved')
+    assert detector.list_incidents() == []
+    assert detector.list_incidents(include_resolved=True)[0]['resolved']
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parquet_export  # noqa: E402
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+from parquet_export import MANIFEST_NAME, export_parquet  # noqa: E402
+
+
+def complaints(*rows):
+    """Unified rows from (complaint_id, submission_date, status)"""
+    records = []
+    for complaint_id, submitted, status in rows:
+        record = {column: '' for column in UNIFIED_COLUMNS}
+        record.update(complaint_id=complaint_id, submission_date=submitted, status=status, source='web')
+        records.append(record)
+    return pd.DataFrame(records, columns=UNIFIED_COLUMNS)
+
+
+def serve(monkeypatch, complaints_df):
+    monkeypatch.setattr(parquet_export, 'load_unified_complaints', lambda: complaints_df.copy())
+
+
+def partitions(export_dir):
+    return sorted(name for name in os.listdir(export_dir) if name.startswith('month='))
+
+
+def test_rows_are_split_by_submission_month(tmp_path, monkeypatch):
+    serve(monkeypatch, complaints(('CID1', '2025-01-05 10:00:00', 'Open'),
+                                  ('CID2', '2025-01-20 10:00:00', 'Open'),
+                                  ('CID3', '2025-02-01 09:00:00', 'Open'),
+                                  ('CID4', '', 'Open')))
+    written = export_parquet(str(tmp_path))
+
+    assert sorted(written) == ['2025-01', '2025-02', 'unknown']
+    assert partitions(tmp_path) == ['month=2025-01', 'month=2025-02', 'month=unknown']
+    january = pd.read_parquet(tmp_path / 'month=2025-01' / 'complaints.parquet')
+    assert sorted(january['complaint_id']) == ['CID1', 'CID2']
+    with open(tmp_path / MANIFEST_NAME) as f:
+        assert json.load(f)['row_count'] == 4
+
+
+def test_only_changed_months_are_rewritten(tmp_path, monkeypatch):
+    rows = [('CID1', '2025-01-05 10:00:00', 'Open'), ('CID2', '2025-02-01 09:00:00', 'Open')]
+    serve(monkeypatch, complaints(*rows))
+    export_parquet(str(tmp_path))
+    assert export_parquet(str(tmp_path)) == []
+
+    # A status change touches neither timestamp; the fingerprint catches it
+    rows[1] = ('CID2', '2025-02-01 09:00:00', 'In Progress')
+    serve(monkeypatch, complaints(*rows))
+    assert export_parquet(str(tmp_path)) == ['2025-02']
+
+
+def test_full_export_removes_months_that_are_gone(tmp_path, monkeypatch):
+    serve(monkeypatch, complaints(('CID1', '2025-01-05 10:00:00', 'Open'),
+                                  ('CID2', '2025-02-01 09:00:00', 'Open')))
+    export_parquet(str(tmp_path))
+
+    serve(monkeypatch, complaints(('CID1', '2025-01-05 10:00:00', 'Open')))
+    written = export_parquet(str(tmp_path), full=True)
+
+    assert sorted(written) == ['2025-01', '2025-02']
+    assert partitions(tmp_path) == ['month=2025-01']
@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import Job, next_cron_time, parse_cron, parse_cron_field  # noqa: E402
+
+
+def next_times(expression, after, count=3):
+    cron = parse_cron(expression)
+    times = []
+    for _ in range(count):
+        after = next_cron_time(cron, after)
+        times.append(after.strftime('%Y-%m-%d %H:%M %a'))
+    return times
+
+
+def test_field_forms():
+    assert parse_cron_field('*', 0, 6) == {0, 1, 2, 3, 4, 5, 6}
+    assert parse_cron_field('5', 0, 59) == {5}
+    assert parse_cron_field('1-5', 0, 6) == {1, 2, 3, 4, 5}
+    assert parse_cron_field('*/15', 0, 59) == {0, 15, 30, 45}
+    assert parse_cron_field('10-50/20', 0, 59) == {10, 30, 50}
+    assert parse_cron_field('1,3,20-22', 1, 31) == {1, 3, 20, 21, 22}
+
+
+@pytest.mark.parametrize('expression', ['60 * * * *', '* 24 * * *', '* * 0 * *', '5-1 * * * *',
+                                        '*/0 * * * *', '* * * *', 'x * * * *'])
+def test_bad_expressions_are_refused(expression):
+    with pytest.raises(ValueError):
+        parse_cron(expression)
+
+
+def test_next_time_is_strictly_later():
+    assert next_times('*/15 * * * *', datetime(2025, 6, 2, 10, 7, 30)) == [
+        '2025-06-02 10:15 Mon', '2025-06-02 10:30 Mon', '2025-06-02 10:45 Mon']
+    assert next_times('0 2 * * *', datetime(2025, 6, 2, 2, 0), count=1) == ['2025-06-03 02:00 Tue']
+
+
+def test_rolls_over_months_and_years():
+    assert next_times('30 23 31 * *', datetime(2025, 11, 1), count=2) == [
+        '2025-12-31 23:30 Wed', '2026-01-31 23:30 Sat']
+    assert next_times('0 0 29 2 *', datetime(2025, 1, 1), count=1) == ['2028-02-29 00:00 Tue']
+
+
+def test_weekdays_count_from_sunday():
+    assert next_times('0 9 * * 1-5', datetime(2025, 6, 6, 10), count=2) == [
+        '2025-06-09 09:00 Mon', '2025-06-10 09:00 Tue']
+    assert next_times('0 9 * * 0', datetime(2025, 6, 2), count=1) == ['2025-06-08 09:00 Sun']
+
+
+def test_either_day_field_matches_when_both_are_set():
+    # The 13th of the month, or any Friday
+    assert next_times('0 0 13 * 5', datetime(2025, 6, 1), count=3) == [
+        '2025-06-06 00:00 Fri', '2025-06-13 00:00 Fri', '2025-06-20 00:00 Fri']
+    assert next_times('0 0 13 * 5', datetime(2025, 7, 5), count=2) == [
+        '2025-07-11 00:00 Fri', '2025-07-13 00:00 Sun']
+
+
+def test_impossible_date_never_matches():
+    with pytest.raises(ValueError):
+        next_cron_time(parse_cron('0 0 30 2 *'), datetime(2025, 1, 1))
+
+
+def test_job_needs_one_schedule():
+    with pytest.raises(ValueError):
+        Job('backup', print)
+    with pytest.raises(ValueError):
+        Job('backup', print, interval=60, cron='0 * * * *')
+    job = Job('backup', print, cron='0 * * * *')
+    assert job.next_run(datetime(2025, 6, 2, 10, 15).timestamp()) == datetime(2025, 6, 2, 11, 0).timestamp()
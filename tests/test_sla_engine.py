@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complaint_merge import UNIFIED_COLUMNS  # noqa: E402
+from sla_engine import SLAEngine, resolution_stats, sla_hours  # noqa: E402
+
+
+SUBMITTED = datetime(2025, 6, 1, 9, 0, 0)
+
+
+class FakeView:
+    """The parts of UnifiedComplaintView the engine follows"""
+
+    def __init__(self):
+        self.table = pd.DataFrame(columns=UNIFIED_COLUMNS)
+        self.generation = 0
+        self.updated_ids = []
+
+    def add(self, complaint_id, category, priority='', submitted=SUBMITTED, status='Open'):
+        row = {column: '' for column in UNIFIED_COLUMNS}
+        row.update(complaint_id=complaint_id, category=category, priority=priority, status=status,
+                   source='web', submission_date=submitted.strftime('%Y-%m-%d %H:%M:%S'))
+        self.table = pd.concat([self.table, pd.DataFrame([row])], ignore_index=True)
+
+    def set_values(self, complaint_id, **changes):
+        for column, value in changes.items():
+            self.table.loc[self.table['complaint_id'] == complaint_id, column] = value
+        self.updated_ids.append(complaint_id)
+
+    def refresh(self):
+        return self.table
+
+    def updates_since(self, seq):
+        return self.updated_ids[seq:], len(self.updated_ids)
+
+
+def following(view, escalation_file):
+    engine = SLAEngine(str(escalation_file))
+    engine.sync = lambda: SLAEngine.sync(engine, view)
+    return engine
+
+
+def escalated(escalations):
+    return [escalation['complaint_id'] for escalation in escalations]
+
+
+def test_category_contract_beats_priority():
+    assert sla_hours('low', 'Power Outage') == 4
+    assert sla_hours('high', 'Meter Problem') == 8
+    # No priority: derived from the category
+    assert sla_hours('', 'Meter Problem') == 48
+    assert sla_hours('', 'New Connection') == 120
+
+
+def test_complaints_escalate_once_when_overdue(tmp_path):
+    view = FakeView()
+    view.add('CID1', 'Power Outage')
+    view.add('CID2', 'Meter Problem')
+    engine = following(view, tmp_path / 'escalations.ndjson')
+
+    assert engine.check(SUBMITTED + timedelta(hours=3)) == []
+    escalations = engine.check(SUBMITTED + timedelta(hours=4))
+    assert escalated(escalations) == ['CID1']
+    assert escalations[0]['due'] == '2025-06-01 13:00:00'
+    assert engine.check(SUBMITTED + timedelta(hours=47)) == []
+    assert escalated(engine.check(SUBMITTED + timedelta(hours=48))) == ['CID2']
+
+
+def test_resolved_complaints_are_not_escalated(tmp_path):
+    view = FakeView()
+    view.add('CID1', 'Power Outage')
+    view.add('CID2', 'Power Outage', status='Resolved')
+    engine = following(view, tmp_path / 'escalations.ndjson')
+    engine.check(SUBMITTED)
+
+    view.set_values('CID1', status='Resolved')
+    assert engine.check(SUBMITTED + timedelta(days=30)) == []
+
+
+def test_redated_complaint_uses_its_new_deadline(tmp_path):
+    view = FakeView()
+    view.add('CID1', 'Power Outage')
+    engine = following(view, tmp_path / 'escalations.ndjson')
+    engine.check(SUBMITTED)
+
+    view.set_values('CID1', category='Billing Issue')
+    assert engine.check(SUBMITTED + timedelta(hours=5)) == []
+    assert escalated(engine.check(SUBMITTED + timedelta(hours=168))) == ['CID1']
+
+
+def test_escalations_are_shared_through_the_file(tmp_path):
+    escalation_file = tmp_path / 'escalations.ndjson'
+    view = FakeView()
+    view.add('CID1', 'Power Outage')
+    view.add('CID2', 'Power Outage', submitted=SUBMITTED + timedelta(hours=1))
+
+    assert escalated(following(view, escalation_file).check(SUBMITTED + timedelta(hours=4))) == ['CID1']
+    # Another process escalates only what the first has not
+    assert escalated(following(view, escalation_file).check(SUBMITTED + timedelta(hours=5))) == ['CID2']
+    with open(escalation_file) as f:
+        assert [json.loads(line)['complaint_id'] for line in f] == ['CID1', 'CID2']
+
+
+def test_resolution_percentiles_per_category():
+    table = pd.DataFrame({
+        'category': ['Power Outage'] * 4 + ['Billing Issue', ''],
+        'submission_date': ['2025-06-01 00:00:00'] * 6,
+        'resolution_date': ['2025-06-01 01:00:00', '2025-06-01 02:00:00', '2025-06-01 03:00:00',
+                            '', '2025-06-03 00:00:00', '2025-06-01 06:00:00'],
+    })
+
+    stats = resolution_stats(table)
+
+    assert stats['Power Outage'] == {'count': 3, 'p50': 2.0, 'p90': 2.8, 'p99': 2.98}
+    assert stats['Billing Issue']['p50'] == 48.0
+    assert stats['Uncategorised']['count'] == 1
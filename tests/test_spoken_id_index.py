@@ -0,0 +1,126 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spoken_id_index import ComplaintIdIndex, bounded_levenshtein, normalise_spoken_id  # noqa: E402
+
+
+START = datetime(2025, 1, 1)
+
+
+def complaint_ids(count, days, seed=7):
+    """IDs as ivr_server makes them: EC + timestamp, some with a same-second sequence"""
+    rng = random.Random(seed)
+    ids = set()
+    while len(ids) < count:
+        stamp = (START + timedelta(seconds=rng.randrange(days * 86400))).strftime('%Y%m%d%H%M%S')
+        ids.add(f'EC{stamp}{rng.randrange(1, 20):02d}' if rng.random() < 0.2 else f'EC{stamp}')
+    return sorted(ids)
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+def misspoken(complaint_id, edits, rng):
+    for _ in range(edits):
+        position = rng.randrange(2, len(complaint_id))
+        digit = rng.choice('0123456789')
+        operation = rng.choice('replace insert delete'.split())
+        if operation == 'replace':
+            complaint_id = complaint_id[:position] + digit + complaint_id[position + 1:]
+        elif operation == 'insert':
+            complaint_id = complaint_id[:position] + digit + complaint_id[position:]
+        else:
+            complaint_id = complaint_id[:position] + complaint_id[position + 1:]
+    return complaint_id
+
+
+def test_spoken_digits_letters_and_repeats():
+    assert normalise_spoken_id('E C two zero double five') == 'EC2055'
+    assert normalise_spoken_id('my complaint id is e c 2 0 triple 1') == 'EC20111'
+
+
+def test_homophones_count_only_inside_the_id():
+    assert normalise_spoken_id('E C two to five') == 'EC225'
+    assert normalise_spoken_id('I want to check E C 1 2') == 'EC12'
+
+
+def test_lone_letter_words_are_not_part_of_the_id():
+    assert normalise_spoken_id('I think it is E C 2 0 2 4 0 1 0 1') == 'EC20240101'
+    assert normalise_spoken_id('E C two zero X five') == 'EC20X5'
+
+
+def test_stray_letter_before_the_prefix_is_dropped():
+    index = ComplaintIdIndex()
+    index.add('EC20240101', {'status': 'Open'})
+    assert index.lookup('it is a E C 2 0 2 4 0 1 0 1') == ('EC20240101', {'status': 'Open'})
+
+
+def test_digits_without_the_prefix():
+    index = ComplaintIdIndex()
+    index.add('EC20250601120000', {})
+    assert index.lookup('2 0 2 5 0 6 0 1 1 2 0 0 0 0')[0] == 'EC20250601120000'
+
+
+def test_equally_close_ids_are_not_guessed():
+    index = ComplaintIdIndex()
+    index.add('EC20250601120001', {})
+    index.add('EC20250601120002', {})
+    assert index.lookup('E C 2 0 2 5 0 6 0 1 1 2 0 0 0 9') == (None, None)
+
+
+def test_bounded_levenshtein_matches_plain_edit_distance():
+    rng = random.Random(3)
+    for _ in range(3000):
+        a = ''.join(rng.choice('0123') for _ in range(rng.randrange(10)))
+        b = ''.join(rng.choice('0123') for _ in range(rng.randrange(10)))
+        for bound in (0, 1, 2, 3):
+            assert bounded_levenshtein(a, b, bound) == min(edit_distance(a, b), bound + 1)
+
+
+def id_index(ids):
+    index = ComplaintIdIndex()
+    for complaint_id in ids:
+        index.add(complaint_id, {})
+    return index
+
+
+def closest_ids(query, ids):
+    distances = [bounded_levenshtein(query, complaint_id, 2) for complaint_id in ids]
+    return [complaint_id for complaint_id, distance in zip(ids, distances)
+            if distance == min(distances) <= 2]
+
+
+def test_two_edits_through_the_rare_grams_still_match():
+    # Both edits land in the digits few IDs share; the grams left in
+    # common are ones most IDs share (the year and month)
+    ids = complaint_ids(1500, days=5)
+    index = id_index(ids)
+    for query, complaint_id in [('EC202501010836618', 'EC20250101035618'),
+                                ('EC202501030250205', 'EC20250103045025')]:
+        assert closest_ids(query, ids) == [complaint_id]
+        assert index.lookup(' '.join(query))[0] == complaint_id
+
+
+def test_every_unique_match_within_two_edits_is_found():
+    ids = complaint_ids(1500, days=5)
+    index = id_index(ids)
+    rng = random.Random(11)
+    checked = 0
+    while checked < 40:
+        query = misspoken(rng.choice(ids), rng.choice((1, 2)), rng)
+        closest = closest_ids(query, ids)
+        if len(closest) != 1:
+            continue
+        checked += 1
+        assert index.lookup(' '.join(query))[0] == closest[0], query
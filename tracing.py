@@ -0,0 +1,189 @@
+# tracing.py - Lightweight tracing spans with a slow-operation log
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+SLOW_OP_LOG_FILE = 'data/slow_ops.ndjson'
+# Traces taking at least this long are written to the slow-operation log
+SLOW_OP_THRESHOLD_MS = float(os.getenv('SLOW_OP_THRESHOLD_MS', '500'))
+# If set, every trace is also appended here as OTLP/JSON (one
+# ExportTraceServiceRequest per line, as the OpenTelemetry Collector's
+# file exporter writes them) for offline analysis
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE')
+SERVICE_NAME = 'ecms'
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+write_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.spans = []
+        self.stack = []
+
+
+def new_span_id():
+    return uuid.uuid4().hex[:16]
+
+
+def append_line(file_path, record):
+    line = json.dumps(record, default=str) + '\n'
+    try:
+        with write_lock, open(file_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except Exception as e:
+        print(f"Error writing trace: {e}")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_record(trace):
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': 'ecms.tracing'},
+            'spans': [{
+                'traceId': trace.trace_id,
+                'spanId': span['span_id'],
+                'parentSpanId': span['parent_id'] or '',
+                'name': span['name'],
+                'kind': 2 if span['parent_id'] is None else 1,
+                'startTimeUnixNano': str(span['start_ns']),
+                'endTimeUnixNano': str(span['end_ns']),
+                'attributes': [{'key': key, 'value': otlp_value(value)}
+                               for key, value in span['attributes'].items()],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {},
+            } for span in trace.spans],
+        }],
+    }]}
+
+
+def finish_trace(trace):
+    """Write a finished trace to the slow-operation log and/or the OTLP file"""
+    if not trace.spans:
+        return
+    root = trace.spans[0]
+    duration_ms = (root['end_ns'] - root['start_ns']) / 1e6
+    if duration_ms >= SLOW_OP_THRESHOLD_MS:
+        append_line(SLOW_OP_LOG_FILE, {
+            'trace_id': trace.trace_id,
+            'name': trace.name,
+            'duration_ms': round(duration_ms, 2),
+            'attributes': root['attributes'],
+            'spans': [{'name': span['name'], 'depth': span['depth'],
+                       'offset_ms': round((span['start_ns'] - root['start_ns']) / 1e6, 2),
+                       'duration_ms': round((span['end_ns'] - span['start_ns']) / 1e6, 2),
+                       'error': span['error']}
+                      for span in trace.spans[1:]],
+        })
+    if TRACE_EXPORT_FILE:
+        append_line(TRACE_EXPORT_FILE, otlp_record(trace))
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a span of the current trace. Outside a request (e.g.
+    a scheduled job) the span starts a trace of its own.
+    """
+    trace = current_trace.get()
+    token = None
+    if trace is None:
+        trace = Trace(name)
+        token = current_trace.set(trace)
+    record = {
+        'span_id': new_span_id(),
+        'parent_id': trace.stack[-1]['span_id'] if trace.stack else None,
+        'name': name,
+        'depth': len(trace.stack),
+        'attributes': attributes,
+        'error': None,
+        'start_ns': time.time_ns(),
+        'end_ns': None,
+    }
+    trace.spans.append(record)
+    trace.stack.append(record)
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record['end_ns'] = time.time_ns()
+        trace.stack.pop()
+        if token is not None:
+            current_trace.reset(token)
+            finish_trace(trace)
+
+
+def traced(name=None):
+    """Decorator form of span(), named after the function by default"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace_id():
+    trace = current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def init_tracing(app):
+    """Give every request a trace; its ID comes from X-Request-ID when the caller sends one"""
+    from flask import g, request
+
+    @app.before_request
+    def start_trace():
+        request_id = request.headers.get('X-Request-ID', '')
+        # OTLP trace IDs are 32 hex digits; other caller IDs are kept as an attribute
+        trace_id = request_id.lower() if re.fullmatch(r'[0-9a-fA-F]{32}', request_id) else None
+        trace = Trace(f"{request.method} {request.endpoint or 'unmatched'}", trace_id)
+        g.trace_token = current_trace.set(trace)
+        g.trace_span = span('request', method=request.method, path=request.path,
+                            endpoint=request.endpoint or 'unmatched', request_id=request_id)
+        g.trace_span.__enter__()
+
+    @app.after_request
+    def add_trace_header(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers['X-Trace-ID'] = trace_id
+            record = current_trace.get().spans[0]
+            record['attributes']['status_code'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_trace(error=None):
+        request_span = g.pop('trace_span', None)
+        token = g.pop('trace_token', None)
+        if request_span is None:
+            return
+        trace = current_trace.get()
+        if error is not None:
+            trace.spans[0]['error'] = f"{type(error).__name__}: {error}"
+        request_span.__exit__(None, None, None)
+        current_trace.reset(token)
+        finish_trace(trace)
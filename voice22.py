@@ -8,25 +8,70 @@ from dataclasses import dataclass, asdict
 from typing import List, Dict
 import threading
 import time
+import hashlib
 import pandas as pd
+from pydub import AudioSegment
+from pydub.playback import play
+from spoken_id_index import ComplaintIdIndex
+from tracing import span, traced
+from change_log import ENTITIES, record_change
+from dispatch import AUTO_DISPATCH, dispatch_engine
+from excel_handler import save_workbook, workbook_lock
+from metrics import storage_timer
 
 
 VOICE_COMPLAINT_FILE = "data/voiceComplaint.xlsx"
+PROMPT_CACHE_DIR = "data/prompt_cache"
 os.makedirs('data', exist_ok=True)    
 
+# Fixed prompts that are rendered to WAV once and replayed from the cache.
+# Anything not listed here (complaint IDs, names, counts) is spoken live.
+STATIC_PROMPTS = [
+    "Welcome to the Electricity Complaint System. How can I help you today?",
+    "What would you like to do? You can register a new complaint, check complaint status, view all complaints, or exit.",
+    "What would you like to do?",
+    "I didn't hear anything. Please try again.",
+    "No response received. Moving to next step.",
+    "I couldn't understand. Please speak clearly.",
+    "Unable to understand. Please try again later.",
+    "There was an error processing your speech. Please try again later.",
+    "No input received. Please try again.",
+    "I didn't understand your choice. Please try again.",
+    "I'll help you register your electricity complaint. Let's start with your details.",
+    "Please tell me your full name.",
+    "Unable to get your name. Please try again later.",
+    "Please tell me your phone number digit by digit.",
+    "Unable to get your phone number. Please try again later.",
+    "Please tell me your complete address.",
+    "Unable to get your address. Please try again later.",
+    "Now, please describe your electricity problem in detail.",
+    "Please describe your complaint.",
+    "Unable to get complaint description. Please try again later.",
+    "Please tell me your complaint ID.",
+    "Unable to get complaint ID. Please try again later.",
+    "Sorry, I couldn't find a complaint with that ID. Please check and try again.",
+    "No complaints found in the system.",
+    "Sorry, there was an error retrieving the complaints.",
+    "Thank you for using the Electricity Complaint System. Have a good day!",
+    "System shutting down. Goodbye!",
+    "Sorry, there was a system error. Please try again later.",
+]
+
 # Initialize Excel file if it doesn't exist
 if not os.path.exists(VOICE_COMPLAINT_FILE):
     voice_complaint_df = pd.DataFrame(columns=[
         'complaint_id', 'customer_name', 'phone_number', 'address', 'complaint_type',
         'description', 'timestamp', 'priority', 'status'
     ])
-    voice_complaint_df.to_excel(VOICE_COMPLAINT_FILE, index=False)
+    save_workbook(voice_complaint_df, VOICE_COMPLAINT_FILE)
 
-def load_voice_complaints():
+@traced()
+def load_voice_complaints(file_path=VOICE_COMPLAINT_FILE):
     """Load complaints from Excel file"""
-    if os.path.exists(VOICE_COMPLAINT_FILE):
+    if os.path.exists(file_path):
         try:
-            voice_complaint_df = pd.read_excel(VOICE_COMPLAINT_FILE)
+            with storage_timer('read_excel', file_path):
+                voice_complaint_df = pd.read_excel(file_path)
             return voice_complaint_df
         except Exception as e:
             print(f"Error loading complaints: {e}")
@@ -39,26 +84,45 @@ def load_voice_complaints():
         'description', 'timestamp', 'priority', 'status'
     ])
 
-def save_complaint_to_excel(complaint):
+def save_complaint_to_excel(complaint, file_path=VOICE_COMPLAINT_FILE):
     """Save a single complaint to Excel file"""
     try:
-        # Load existing complaints
-        complaints_df = load_voice_complaints()
-        
+        # Copies used by load tests are not part of the logged data
+        live = os.path.abspath(file_path) == os.path.abspath(ENTITIES['voice_complaint']['file'])
         # Convert complaint object to dictionary
         complaint_dict = asdict(complaint)
-        
-        # Create new row DataFrame
-        new_complaint_df = pd.DataFrame([complaint_dict])
-        
-        # Concatenate with existing data
-        updated_df = pd.concat([complaints_df, new_complaint_df], ignore_index=True)
-        
-        # Save to Excel
-        updated_df.to_excel(VOICE_COMPLAINT_FILE, index=False)
+        # The assignment is saved with the complaint, as for web complaints
+        if AUTO_DISPATCH and live:
+            try:
+                assignment = dispatch_engine.assign_new(complaint.complaint_id)
+            except Exception as e:
+                print(f"Error dispatching complaint: {e}")
+                assignment = None
+            if assignment:
+                complaint_dict.update(assigned_to=assignment[1], technician_name=assignment[2],
+                                      status='In Progress')
+
+        # The web app updates this workbook too
+        with workbook_lock(file_path):
+            # Load existing complaints
+            complaints_df = load_voice_complaints(file_path)
+            
+            # Create new row DataFrame
+            new_complaint_df = pd.DataFrame([complaint_dict])
+            
+            # Concatenate with existing data
+            updated_df = pd.concat([complaints_df, new_complaint_df], ignore_index=True)
+            
+            # Save to Excel
+            save_workbook(updated_df, file_path)
+            if live:
+                record_change('voice_complaint', 'insert', complaint_dict)
         print(f"Complaint {complaint.complaint_id} saved to Excel successfully!")
         
     except Exception as e:
+        if AUTO_DISPATCH:
+            # The engine counted an assignment that was never saved
+            dispatch_engine.reset()
         print(f"Error saving complaint to Excel: {e}")
 
 @dataclass
@@ -74,9 +138,23 @@ class Complaint:
     status: str = "Open"
 
 class ElectricityComplaintSystem:
+    # Complaint types and keywords
+    complaint_types = {
+        "power outage": ["outage", "blackout", "no power", "electricity gone", "power cut"],
+        "voltage fluctuation": ["voltage", "fluctuation", "high voltage", "low voltage", "unstable"],
+        "billing issue": ["bill", "billing", "overcharge", "payment", "meter reading"],
+        "equipment fault": ["pole", "wire", "transformer", "meter", "equipment", "damaged"],
+        "street light": ["street light", "lamp", "lighting", "dark", "bulb"],
+        "new connection": ["new connection", "connection", "supply", "installation"]
+    }
+    
+    # Seconds to wait before showing the menu again
+    menu_pause = 1
+    
     def __init__(self):
-        # Initialize speech recognition and text-to-speech
-        self.recognizer = sr.Recognizer()
+        self.init_dialogue_state()
+        
+        # Initialize the microphone and text-to-speech
         self.microphone = sr.Microphone()
         self.tts_engine = pyttsx3.init()
         
@@ -84,39 +162,120 @@ class ElectricityComplaintSystem:
         self.tts_engine.setProperty('rate', 150)  # Speed of speech
         self.tts_engine.setProperty('volume', 0.8)  # Volume level
         
+        # Pre-rendered audio for the fixed prompts
+        self.tts_engine.connect('started-utterance', self.on_utterance_started)
+        self.warm_prompt_cache()
+        
         # Complaint storage (also maintain JSON backup)
-        self.complaints_file = "complaints.json"
         self.complaints = self.load_complaints()
-        
-        # Complaint types and keywords
-        self.complaint_types = {
-            "power outage": ["outage", "blackout", "no power", "electricity gone", "power cut"],
-            "voltage fluctuation": ["voltage", "fluctuation", "high voltage", "low voltage", "unstable"],
-            "billing issue": ["bill", "billing", "overcharge", "payment", "meter reading"],
-            "equipment fault": ["pole", "wire", "transformer", "meter", "equipment", "damaged"],
-            "street light": ["street light", "lamp", "lighting", "dark", "bulb"],
-            "new connection": ["new connection", "connection", "supply", "installation"]
-        }
+        self.refresh_id_index()
         
         print("Voice-Based Electricity Complaint System Initialized")
         self.speak("Welcome to the Electricity Complaint System. How can I help you today?")
     
+    def init_dialogue_state(self):
+        """State every dialogue needs, whether it talks to a microphone or a caller"""
+        self.recognizer = sr.Recognizer()
+        
+        # Calibrate for ambient noise once per session; after that the
+        # recognizer keeps adapting its energy threshold from the silence
+        # it hears before each phrase
+        self.recognizer.dynamic_energy_threshold = True
+        self.calibration_duration = 1
+        self.calibration_time = None
+        self.turn_timings = []
+        
+        self.prompt_audio = {}
+        self.speak_timings = []
+        self.speak_started = None
+        
+        self.complaints_file = "complaints.json"
+        self.complaints = []
+        
+        # Spoken complaint ID index, rebuilt only when the Excel file changes
+        self.id_index = ComplaintIdIndex()
+        self.id_index_version = None
+    
     def speak(self, text: str):
         """Convert text to speech"""
         print(f"System: {text}")
+        started = time.perf_counter()
+        
+        # Fixed prompts play from the cache; dynamic text is synthesised live
+        audio = self.cached_prompt(text) if text in STATIC_PROMPTS else None
+        if audio is not None:
+            try:
+                self.speak_timings.append((True, time.perf_counter() - started))
+                play(audio)
+                return
+            except Exception as e:
+                print(f"Error playing cached prompt: {e}")
+                self.speak_timings.pop()
+        
+        self.speak_started = started
         self.tts_engine.say(text)
         self.tts_engine.runAndWait()
+        self.speak_started = None
+    
+    def on_utterance_started(self, name):
+        """pyttsx3 callback: live synthesis has started producing audio"""
+        if self.speak_started is not None:
+            self.speak_timings.append((False, time.perf_counter() - self.speak_started))
+    
+    def prompt_cache_path(self, text: str) -> str:
+        """Cache file for a prompt, keyed by its text and the voice settings"""
+        settings = (f"{text}|{self.tts_engine.getProperty('rate')}|"
+                    f"{self.tts_engine.getProperty('volume')}|{self.tts_engine.getProperty('voice')}")
+        digest = hashlib.sha1(settings.encode('utf-8')).hexdigest()
+        return os.path.join(PROMPT_CACHE_DIR, f"{digest}.wav")
+    
+    def cached_prompt(self, text: str):
+        """Return the pre-rendered audio for a prompt, rendering it on first use"""
+        if text in self.prompt_audio:
+            return self.prompt_audio[text]
+        
+        path = self.prompt_cache_path(text)
+        try:
+            if not os.path.exists(path):
+                os.makedirs(PROMPT_CACHE_DIR, exist_ok=True)
+                # Render to a temporary name so a half-written file is never played
+                temp_path = f"{path}.tmp.wav"
+                self.tts_engine.save_to_file(text, temp_path)
+                self.tts_engine.runAndWait()
+                os.replace(temp_path, path)
+            audio = AudioSegment.from_wav(path)
+        except Exception as e:
+            print(f"Error caching prompt audio: {e}")
+            audio = None
+        
+        self.prompt_audio[text] = audio
+        return audio
+    
+    def warm_prompt_cache(self):
+        """Load (and on the first run, render) every fixed prompt"""
+        started = time.perf_counter()
+        for text in STATIC_PROMPTS:
+            self.cached_prompt(text)
+        ready = sum(1 for audio in self.prompt_audio.values() if audio is not None)
+        print(f"Prompt cache ready: {ready}/{len(STATIC_PROMPTS)} prompts "
+              f"in {time.perf_counter() - started:.2f}s")
     
     def listen(self, timeout=5, phrase_time_limit=10) -> str:
         """Listen for audio input and convert to text"""
         try:
             with self.microphone as source:
+                if self.calibration_time is None:
+                    self.calibrate(source)
                 print("Listening...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+                started = time.perf_counter()
+                try:
+                    audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+                finally:
+                    self.turn_timings.append(time.perf_counter() - started)
             
             print("Processing speech...")
-            text = self.recognizer.recognize_google(audio)
+            with span('transcribe', engine='google'):
+                text = self.recognizer.recognize_google(audio)
             print(f"You said: {text}")
             return text.lower()
         
@@ -128,6 +287,39 @@ class ElectricityComplaintSystem:
             print(f"Speech recognition error: {e}")
             return "error"
     
+    def calibrate(self, source):
+        """Measure ambient noise once and set the starting energy threshold"""
+        print("Calibrating for background noise...")
+        started = time.perf_counter()
+        self.recognizer.adjust_for_ambient_noise(source, duration=self.calibration_duration)
+        self.calibration_time = time.perf_counter() - started
+        print(f"Energy threshold set to {self.recognizer.energy_threshold:.0f}")
+    
+    def timing_report(self):
+        """Print speaking and listening latency for this session"""
+        print("\n" + "="*80)
+        print("TIMING REPORT")
+        print("="*80)
+        
+        for cached, label in [(True, "cached prompts"), (False, "live synthesis")]:
+            timings = [seconds for from_cache, seconds in self.speak_timings if from_cache == cached]
+            if timings:
+                print(f"Time to first audio, {label}: {sum(timings) / len(timings) * 1000:.0f}ms "
+                      f"average over {len(timings)} prompts")
+        
+        turns = len(self.turn_timings)
+        if not turns or self.calibration_time is None:
+            return
+        
+        average = sum(self.turn_timings) / turns
+        saved = self.calibration_time * (turns - 1)
+        print(f"Turns: {turns}")
+        print(f"One-time calibration: {self.calibration_time:.2f}s")
+        print(f"Average capture per turn: {average:.2f}s "
+              f"(was about {average + self.calibration_time:.2f}s with per-turn calibration)")
+        print(f"Latency saved per turn: {self.calibration_time:.2f}s, {saved:.1f}s this session")
+        print(f"Final energy threshold: {self.recognizer.energy_threshold:.0f}")
+    
     def get_voice_input(self, prompt: str, max_attempts=3) -> str:
         """Get voice input with retries"""
         self.speak(prompt)
@@ -232,14 +424,7 @@ class ElectricityComplaintSystem:
             status="Open"
         )
         
-        # Store complaint in memory
-        self.complaints.append(complaint)
-        
-        # Save to JSON (backup)
-        self.save_complaints_to_json()
-        
-        # Save to Excel
-        save_complaint_to_excel(complaint)
+        self.store_complaint(complaint)
        
         # Confirm registration
         self.speak(f"Your complaint has been registered successfully. Your complaint ID is {complaint_id}. "
@@ -263,41 +448,64 @@ class ElectricityComplaintSystem:
             self.speak("Unable to get complaint ID. Please try again later.")
             return
         
-        # Extract complaint ID from speech
-        complaint_id = complaint_id.upper().replace(" ", "")
-        
-        # Check in Excel file first
-        try:
-            complaints_df = load_voice_complaints()
-            matching_complaints = complaints_df[complaints_df['complaint_id'].str.contains(complaint_id, case=False, na=False)]
-            
-            if not matching_complaints.empty:
-                complaint_row = matching_complaints.iloc[0]
-                self.speak(f"Found your complaint. Complaint ID {complaint_row['complaint_id']}. "
-                         f"Type: {complaint_row['complaint_type']}. "
-                         f"Status: {complaint_row['status']}. "
-                         f"Priority: {complaint_row['priority']}. "
-                         f"Registered on {str(complaint_row['timestamp'])[:10]}.")
-                return
-        except Exception as e:
-            print(f"Error checking Excel file: {e}")
-        
-        # Fallback to memory search
-        complaint = None
-        for c in self.complaints:
-            if complaint_id in c.complaint_id.upper():
-                complaint = c
-                break
+        # Match the spoken ID against the index, tolerating recognition errors
+        matched_id, complaint = self.find_complaint(complaint_id)
         
         if complaint:
-            self.speak(f"Found your complaint. Complaint ID {complaint.complaint_id}. "
-                     f"Type: {complaint.complaint_type}. "
-                     f"Status: {complaint.status}. "
-                     f"Priority: {complaint.priority}. "
-                     f"Registered on {complaint.timestamp[:10]}.")
+            self.speak(f"Found your complaint. Complaint ID {matched_id}. "
+                     f"Type: {complaint['complaint_type']}. "
+                     f"Status: {complaint['status']}. "
+                     f"Priority: {complaint['priority']}. "
+                     f"Registered on {str(complaint['timestamp'])[:10]}.")
         else:
             self.speak("Sorry, I couldn't find a complaint with that ID. Please check and try again.")
     
+    def store_complaint(self, complaint: Complaint):
+        """Persist a newly registered complaint"""
+        # Store complaint in memory
+        self.complaints.append(complaint)
+        
+        # Save to JSON (backup)
+        self.save_complaints_to_json()
+        
+        # Save to Excel
+        save_complaint_to_excel(complaint)
+        
+        # Index the new ID so a status check right after needs no reload
+        self.id_index.add(complaint.complaint_id, asdict(complaint))
+        self.id_index_version = self.voice_file_version()
+    
+    def find_complaint(self, spoken_id: str):
+        """Return (complaint_id, record) for a spoken complaint ID"""
+        self.refresh_id_index()
+        return self.id_index.lookup(spoken_id)
+    
+    def voice_file_version(self):
+        """Modification stamp of the voice complaints file"""
+        try:
+            stat = os.stat(VOICE_COMPLAINT_FILE)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def refresh_id_index(self):
+        """Rebuild the complaint ID index if the Excel file has changed"""
+        version = self.voice_file_version()
+        if version is not None and version == self.id_index_version:
+            return
+        
+        self.id_index.clear()
+        # JSON backup first so the Excel rows (with current status) win
+        for complaint in self.complaints:
+            self.id_index.add(complaint.complaint_id, asdict(complaint))
+        try:
+            complaints_df = load_voice_complaints()
+            for record in complaints_df.to_dict('records'):
+                self.id_index.add(record['complaint_id'], record)
+        except Exception as e:
+            print(f"Error indexing complaint IDs: {e}")
+        self.id_index_version = version
+    
     def load_complaints(self) -> List[Complaint]:
         """Load complaints from JSON file (backup)"""
         if os.path.exists(self.complaints_file):
@@ -385,28 +593,33 @@ class ElectricityComplaintSystem:
         
         return True
     
+    def dialogue_loop(self):
+        """Offer the menu until the user chooses to exit"""
+        while True:
+            self.show_menu()
+            choice = self.get_voice_input("What would you like to do?")
+            
+            if not choice:
+                self.speak("No input received. Please try again.")
+                continue
+            
+            if not self.process_menu_choice(choice):
+                break
+            
+            # Brief pause before showing menu again
+            time.sleep(self.menu_pause)
+    
     def run(self):
         """Main application loop"""
         try:
-            while True:
-                self.show_menu()
-                choice = self.get_voice_input("What would you like to do?")
-                
-                if not choice:
-                    self.speak("No input received. Please try again.")
-                    continue
-                
-                if not self.process_menu_choice(choice):
-                    break
-                
-                # Brief pause before showing menu again
-                time.sleep(1)
-                
+            self.dialogue_loop()
         except KeyboardInterrupt:
             self.speak("System shutting down. Goodbye!")
         except Exception as e:
             print(f"System error: {e}")
             self.speak("Sorry, there was a system error. Please try again later.")
+        finally:
+            self.timing_report()
 
 def main():
     """Main function to run the complaint system"""